@@ -0,0 +1,146 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import itertools
+import logging
+
+from typing import Dict, Iterable, Set
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from agri_gaia_backend.db.models import TableVersion
+
+logger = logging.getLogger("api-logger")
+
+_table_versions = TableVersion.__table__
+
+
+def _changed_tables(session: Session) -> Set[str]:
+    tables = set()
+    for obj in itertools.chain(session.new, session.deleted):
+        tables.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            tables.add(obj.__table__.name)
+    return tables
+
+
+# Keys of Session.info: the tables changed in the current transaction and the tables
+# changed by committed transactions, whose versions are incremented when it ends.
+_CHANGED_TABLES = "changed_tables"
+_COMMITTED_TABLES = "committed_tables"
+
+
+@event.listens_for(Session, "after_flush")
+def _track_changed_tables(session: Session, flush_context) -> None:
+    """
+    Remembers the tables touched by the flush until the transaction ends.
+    Registered on the Session class, so it applies to the sessions of AsyncSession as well.
+    """
+    tables = _changed_tables(session)
+    tables.discard(_table_versions.name)
+    increment_table_versions(session, tables)
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session: Session) -> None:
+    if session.in_nested_transaction():
+        # Releasing a savepoint, the changes are committed with the outer transaction.
+        return
+    committed = session.info.setdefault(_COMMITTED_TABLES, set())
+    committed.update(session.info.pop(_CHANGED_TABLES, ()))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _increment_committed_table_versions(session: Session, transaction) -> None:
+    """
+    Increments the change counters of the tables changed by a committed transaction.
+
+    This runs after the commit, once the connection of the session was returned to the
+    pool, in a short transaction of its own. Writers therefore never hold the lock of a
+    counter row until they commit, and a version is only visible after the changes it
+    stands for are. Changes rolled back to a savepoint may still increment a version,
+    which only invalidates cached responses.
+    """
+    if transaction.parent is not None:
+        return
+    session.info.pop(_CHANGED_TABLES, None)
+    tables = session.info.pop(_COMMITTED_TABLES, None)
+    if not tables:
+        return
+    try:
+        with session.get_bind().begin() as connection:
+            connection.execute(_increment_stmt(tables))
+    except Exception as e:
+        # The changes are committed already, failing the request would not undo them.
+        logger.exception(f"Could not increment the versions of {sorted(tables)}: {e}")
+
+
+def increment_table_versions(session: Session, tables: Iterable[str]) -> None:
+    """
+    Marks the given tables as changed. Their change counters are incremented after the
+    current transaction of the session commits. Has to be called after bulk statements
+    (update(), delete(), insert().from_select()), which are not flushed and therefore
+    not tracked automatically.
+
+    Args:
+        session: Database Session.
+        tables: Names of the changed tables.
+    """
+    if tables:
+        session.info.setdefault(_CHANGED_TABLES, set()).update(tables)
+
+
+def _increment_stmt(tables: Iterable[str]):
+    # Sorted to always lock the counter rows in the same order and prevent deadlocks.
+    stmt = postgresql.insert(_table_versions).values(
+        [{"table_name": table, "version": 1} for table in sorted(tables)]
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[_table_versions.c.table_name],
+        set_={"version": _table_versions.c.version + 1},
+    )
+
+
+def _versions_select(tables: Iterable[str]):
+    return select(_table_versions.c.table_name, _table_versions.c.version).where(
+        _table_versions.c.table_name.in_(list(tables))
+    )
+
+
+def get_table_versions(db: Session, tables: Iterable[str]) -> Dict[str, int]:
+    """
+    Fetches the change counters of the given tables.
+
+    Args:
+        db: Database Session.
+        tables: Names of the tables.
+
+    Returns:
+        The version of each table. Tables which never changed have version 0.
+    """
+    tables = list(tables)
+    versions = dict(db.execute(_versions_select(tables)).all())
+    return {table: versions.get(table, 0) for table in tables}
+
+
+async def get_table_versions_async(
+    db: AsyncSession, tables: Iterable[str]
+) -> Dict[str, int]:
+    """
+    Same as get_table_versions, but for an AsyncSession.
+    """
+    tables = list(tables)
+    versions = dict((await db.execute(_versions_select(tables))).all())
+    return {table: versions.get(table, 0) for table in tables}
@@ -11,10 +11,12 @@
 
 from multiprocessing.dummy import Array
 from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import datetime
 
-from agri_gaia_backend.db import models
+from agri_gaia_backend.db import models, pagination
 
 
 def get_dataset(db: Session, dataset_id: int) -> Optional[models.Dataset]:
@@ -85,6 +87,32 @@ def get_datasets(db: Session, skip: int = 0, limit: int = 100) -> List[models.Da
     return db.query(models.Dataset).offset(skip).limit(limit).all()
 
 
+DATASET_SORT_KEYS = pagination.sort_keys(
+    models.Dataset, last_modified=models.Dataset.last_modified
+)
+
+
+async def get_datasets_async(
+    db: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    order_by: str = "id",
+    descending: bool = False,
+    skip: int = 0,
+    with_total: bool = False,
+) -> pagination.Page:
+    return await pagination.paginate_async(
+        db,
+        select(models.Dataset),
+        pagination.get_sort_key(DATASET_SORT_KEYS, order_by),
+        cursor=cursor,
+        limit=limit,
+        descending=descending,
+        skip=skip,
+        with_total=with_total,
+    )
+
+
 def create_dataset(
     db: Session,
     name: str,
@@ -9,10 +9,15 @@
 #
 # SPDX-License-Identifier: MIT
 
-from typing import List
-from sqlalchemy.orm import Session
+import datetime
 
-from agri_gaia_backend.db.models import EdgeDevice
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from agri_gaia_backend.db import pagination
+from agri_gaia_backend.db.models import ContainerDeployment, EdgeDevice
 from agri_gaia_backend.schemas import edge_device as schemas
 
 
@@ -24,6 +29,77 @@ def get_edge_devices(db: Session, skip: int = 0, limit: int = 100) -> List[EdgeD
     return db.query(EdgeDevice).offset(skip).limit(limit).all()
 
 
+EDGE_DEVICE_SORT_KEYS = pagination.sort_keys(EdgeDevice)
+
+
+async def get_edge_devices_async(
+    db: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    descending: bool = False,
+    skip: int = 0,
+    with_total: bool = False,
+) -> pagination.Page:
+    # Relationships have to be loaded eagerly, lazy loading is not possible with an AsyncSession.
+    deployments = selectinload(EdgeDevice.container_deployments)
+    q = select(EdgeDevice).options(
+        deployments.selectinload(ContainerDeployment.container_image),
+        deployments.selectinload(ContainerDeployment.port_bindings),
+    )
+    return await pagination.paginate_async(
+        db,
+        q,
+        EDGE_DEVICE_SORT_KEYS["id"],
+        cursor=cursor,
+        limit=limit,
+        descending=descending,
+        skip=skip,
+        with_total=with_total,
+    )
+
+
+async def update_heartbeats_async(
+    db: AsyncSession, heartbeats: Dict[str, datetime.datetime]
+) -> int:
+    """
+    Stores the last heartbeat of the edge devices where it changed and commits.
+
+    The update is a bulk statement, which does not increment the version of the
+    edge_devices table. Devices check in every few seconds, so every heartbeat would
+    otherwise invalidate all cached responses built from the table. Responses
+    containing the heartbeat have to cover it otherwise, e.g. in their ETag.
+
+    Args:
+        db: Async Database Session.
+        heartbeats: Last heartbeat by edge device name.
+
+    Returns:
+        The number of updated edge devices.
+    """
+    if not heartbeats:
+        return 0
+    result = await db.execute(
+        select(EdgeDevice.name, EdgeDevice.last_heartbeat).where(
+            EdgeDevice.name.in_(list(heartbeats))
+        )
+    )
+    changed = [
+        {"device": name, "heartbeat": heartbeats[name]}
+        for name, last_heartbeat in result.all()
+        if last_heartbeat != heartbeats[name]
+    ]
+    if changed:
+        table = EdgeDevice.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.name == bindparam("device"))
+            .values(last_heartbeat=bindparam("heartbeat")),
+            changed,
+        )
+        await db.commit()
+    return len(changed)
+
+
 def create_edge_device(
     db: Session,
     name: str,
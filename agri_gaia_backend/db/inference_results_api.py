@@ -0,0 +1,117 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import datetime
+from typing import Dict, List
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from agri_gaia_backend.db.models import InferenceResult
+
+# No list endpoint depends on the inference_results table. Its rows are only written by
+# bulk statements, which do not increment the table version (see db/change_tracking.py).
+
+
+def get_outputs(
+    db: Session,
+    model_hash: str,
+    preprocessing: str,
+    etags: List[str],
+    created_after: datetime.datetime,
+) -> Dict[str, bytes]:
+    """
+    Returns:
+        The cached outputs by ETag, images without a cached output or with an output
+        created before created_after are missing.
+    """
+    if not etags:
+        return {}
+    rows = db.execute(
+        select(InferenceResult.etag, InferenceResult.output).where(
+            InferenceResult.model_hash == model_hash,
+            InferenceResult.preprocessing == preprocessing,
+            InferenceResult.etag.in_(etags),
+            InferenceResult.created > created_after,
+        )
+    )
+    return {etag: output for etag, output in rows}
+
+
+def save_outputs(
+    db: Session, model_hash: str, preprocessing: str, outputs: Dict[str, bytes]
+) -> None:
+    if not outputs:
+        return
+    created = datetime.datetime.now()
+    stmt = postgresql.insert(InferenceResult).values(
+        [
+            {
+                "model_hash": model_hash,
+                "preprocessing": preprocessing,
+                "etag": etag,
+                "output": output,
+                "created": created,
+            }
+            for etag, output in outputs.items()
+        ]
+    )
+    # Concurrent runs may store the output of the same image.
+    stmt = stmt.on_conflict_do_nothing()
+    db.execute(stmt)
+    db.commit()
+
+
+def delete_outputs(db: Session, model_hash: str) -> int:
+    result = db.execute(
+        delete(InferenceResult).where(InferenceResult.model_hash == model_hash)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def delete_expired_outputs(
+    db: Session, created_before: datetime.datetime, max_bytes: int
+) -> int:
+    """
+    Deletes the outputs created before the given date and the oldest outputs beyond
+    a total size of max_bytes.
+
+    Returns:
+        The number of deleted outputs.
+    """
+    expired = db.execute(
+        delete(InferenceResult)
+        .where(InferenceResult.created <= created_before)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    key = (
+        InferenceResult.model_hash,
+        InferenceResult.preprocessing,
+        InferenceResult.etag,
+    )
+    newer_bytes = (
+        func.sum(func.octet_length(InferenceResult.output))
+        .over(order_by=(InferenceResult.created.desc(), *key))
+        .label("newer_bytes")
+    )
+    sizes = select(*key, newer_bytes).subquery()
+    over_size = select(sizes.c.model_hash, sizes.c.preprocessing, sizes.c.etag).where(
+        sizes.c.newer_bytes > max_bytes
+    )
+    evicted = db.execute(
+        delete(InferenceResult)
+        .where(tuple_(*key).in_(over_size))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return expired + evicted
@@ -11,11 +11,13 @@
 
 from multiprocessing.dummy import Array
 
-from typing import List
+from typing import List, Optional
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from agri_gaia_backend.db import models
+from agri_gaia_backend.db import models, pagination
 import datetime
 
 
@@ -71,6 +73,32 @@ def get_models(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Model).offset(skip).limit(limit).all()
 
 
+MODEL_SORT_KEYS = pagination.sort_keys(
+    models.Model, last_modified=models.Model.last_modified
+)
+
+
+async def get_models_async(
+    db: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    order_by: str = "id",
+    descending: bool = False,
+    skip: int = 0,
+    with_total: bool = False,
+) -> pagination.Page:
+    return await pagination.paginate_async(
+        db,
+        select(models.Model),
+        pagination.get_sort_key(MODEL_SORT_KEYS, order_by),
+        cursor=cursor,
+        limit=limit,
+        descending=descending,
+        skip=skip,
+        with_total=with_total,
+    )
+
+
 def create_model(
     db: Session,
     name: str,
@@ -20,7 +20,9 @@ from sqlalchemy import (
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    LargeBinary,
     String,
     UniqueConstraint,
     Numeric,
@@ -288,9 +290,14 @@ class TrainContainer(Base):
 
 class TaskStatus(enum.Enum):
     created = "created"
+    # Waiting for other running tasks of the same user, see services/tasks/scheduler.py.
+    queued = "queued"
     inprogress = "inprogress"
     completed = "completed"
     failed = "failed"
+    # Cancellation was requested, but the task has not stopped yet.
+    cancelling = "cancelling"
+    cancelled = "cancelled"
 
 
 class Task(Base):
@@ -307,6 +314,91 @@ class Task(Base):
     status = Column(Enum(TaskStatus))
     completion_percentage = Column(Float)
     message = Column(String, nullable=True)
+    # Durations and byte counts of the task's phases, see services/tasks/phases.py.
+    phases = Column(postgresql.JSONB, nullable=True)
+
+    __table_args__ = (
+        # Task list of a user, filtered by status and ordered by creation time.
+        Index(
+            "ix_tasks_initiator_status_creation_date",
+            "initiator",
+            "status",
+            "creation_date",
+        ),
+        # Task list of a user in the default order (keyset pagination by id).
+        Index("ix_tasks_initiator_id", "initiator", "id"),
+        # Finished tasks to archive, see services/tasks/retention.py.
+        Index("ix_tasks_status_creation_date", "status", "creation_date"),
+    )
+
+
+class TaskHistory(Base):
+    """
+    Archived finished task. Tasks are moved here after TASK_RETENTION_DAYS,
+    so that the tasks table only holds recent and running tasks.
+    """
+
+    __tablename__ = "task_history"
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=True)
+    creation_date = Column(DateTime)
+    initiator = Column(String, index=True)
+    status = Column(Enum(TaskStatus))
+    message = Column(String, nullable=True)
+    archived_date = Column(DateTime)
+
+
+class TritonRepositoryEntry(Base):
+    """
+    Manifest entry of a model in the triton bucket, the model repository of Triton.
+    Used to skip uploading unchanged models and to evict the least recently used ones.
+    """
+
+    __tablename__ = "triton_repository"
+
+    model_name = Column(String, primary_key=True)
+    # ETag of the model file in the bucket of its owner, i.e. the content hash.
+    content_hash = Column(String, nullable=False)
+    # SHA-256 of the generated config.pbtxt, None if Triton derives the config.
+    config_hash = Column(String, nullable=True)
+    object_name = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    last_used = Column(DateTime, nullable=False, index=True)
+    # Batch size chosen by the autotuner and the measurements it was chosen by,
+    # reset when the model changes, see services/inference/autotune.py.
+    batch_size = Column(Integer, nullable=True)
+    batch_size_probes = Column(postgresql.JSONB, nullable=True)
+
+
+class InferenceResult(Base):
+    """
+    Cached output of a model for an image, see services/inference/result_cache.py.
+    """
+
+    __tablename__ = "inference_results"
+
+    # Content and config hash of the model, see TritonRepositoryEntry.
+    model_hash = Column(String, primary_key=True)
+    # Preprocessing parameters and the names of the outputs.
+    preprocessing = Column(String, primary_key=True)
+    # ETag of the image, i.e. its content hash.
+    etag = Column(String, primary_key=True)
+    # The raw outputs by name as .npz file, which keeps their shapes and dtypes.
+    output = Column(LargeBinary, nullable=False)
+    created = Column(DateTime, nullable=False)
+
+
+class TableVersion(Base):
+    """
+    Change counter of a table. Incremented after every committed transaction
+    that inserts, updates or deletes rows of the table, see db/change_tracking.py.
+    """
+
+    __tablename__ = "table_versions"
+
+    table_name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
 
 
 class Application(Base):
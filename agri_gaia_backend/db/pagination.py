@@ -0,0 +1,242 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import base64
+import datetime
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PaginationError(ValueError):
+    pass
+
+
+class InvalidCursorError(PaginationError):
+    pass
+
+
+@dataclass
+class Page:
+    items: List[Any]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+
+@dataclass
+class SortKey:
+    """
+    Column a list is ordered by. The primary key is always used as tie breaker,
+    so that the order is total even if the column contains duplicates.
+    """
+
+    name: str
+    column: Any
+    id_column: Any
+
+    @property
+    def is_id(self) -> bool:
+        return self.column is self.id_column
+
+
+def sort_keys(model, **columns) -> Dict[str, SortKey]:
+    """
+    Builds the sort keys available for a model. "id" is always available.
+
+    Example:
+        sort_keys(Task, created=Task.creation_date)
+    """
+    keys = {"id": SortKey("id", model.id, model.id)}
+    for name, column in columns.items():
+        keys[name] = SortKey(name, column, model.id)
+    return keys
+
+
+def get_sort_key(keys: Dict[str, SortKey], name: str) -> SortKey:
+    if name not in keys:
+        raise PaginationError(
+            f"Cannot order by '{name}'. Possible values: {', '.join(keys)}."
+        )
+    return keys[name]
+
+
+def _serialize(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _deserialize(value: Any, column) -> Any:
+    if value is not None and column.type.python_type is datetime.datetime:
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def encode_cursor(sort_key: SortKey, descending: bool, item: Any) -> str:
+    payload = {
+        "k": sort_key.name,
+        "d": descending,
+        "v": [_serialize(getattr(item, sort_key.column.key)), item.id],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort_key: SortKey, descending: bool) -> List[Any]:
+    """
+    Decodes an opaque cursor into the key values of the last item of the previous page.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed or was issued for another ordering.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        key_value, id_value = payload["v"]
+        if payload["k"] != sort_key.name or payload["d"] != descending:
+            raise InvalidCursorError("Cursor was issued for a different ordering.")
+        return [_deserialize(key_value, sort_key.column), int(id_value)]
+    except InvalidCursorError:
+        raise
+    except Exception:
+        raise InvalidCursorError("Malformed cursor.")
+
+
+def keyset_select(
+    stmt: Select,
+    sort_key: SortKey,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    descending: bool = False,
+) -> Select:
+    """
+    Orders the statement by the sort key and restricts it to the page following the cursor.
+    One more row than requested is selected to detect whether there is a next page.
+
+    NULL keys are ordered as if they were larger than any other value (the Postgres
+    default, which lets the indexes be scanned in both directions), i.e. last in
+    ascending and first in descending order.
+    """
+    if sort_key.is_id:
+        order_by = [sort_key.id_column.desc() if descending else sort_key.id_column]
+    elif descending:
+        order_by = [sort_key.column.desc().nulls_first(), sort_key.id_column.desc()]
+    else:
+        order_by = [sort_key.column.asc().nulls_last(), sort_key.id_column]
+
+    stmt = stmt.order_by(*order_by)
+
+    if cursor is not None:
+        key_value, id_value = decode_cursor(cursor, sort_key, descending)
+        stmt = stmt.filter(_after_cursor(sort_key, key_value, id_value, descending))
+
+    return stmt.limit(limit + 1)
+
+
+def _after_cursor(sort_key: SortKey, key_value: Any, id_value: int, descending: bool):
+    """
+    Predicate of the rows following (key_value, id_value) in the order of keyset_select.
+    A row comparison alone would drop all rows with a NULL key, since comparing NULL
+    yields NULL.
+    """
+    column, id_column = sort_key.column, sort_key.id_column
+    if sort_key.is_id:
+        return id_column < id_value if descending else id_column > id_value
+
+    if key_value is None:
+        # The cursor is inside the NULL keys, ordered by id only.
+        if descending:
+            return or_(and_(column.is_(None), id_column < id_value), column.isnot(None))
+        return and_(column.is_(None), id_column > id_value)
+
+    lhs = tuple_(column, id_column)
+    rhs = tuple_(key_value, id_value)
+    if descending:
+        # NULL keys come first and were all part of the previous pages.
+        return lhs < rhs
+    return or_(lhs > rhs, column.is_(None))
+
+
+def _count_select(stmt: Select) -> Select:
+    return select(func.count()).select_from(stmt.order_by(None).subquery())
+
+
+def _to_page(rows: List[Any], sort_key: SortKey, limit: int, descending: bool) -> Page:
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort_key, descending, rows[-1])
+    return Page(items=rows, next_cursor=next_cursor)
+
+
+def paginate(
+    db: Session,
+    stmt: Select,
+    sort_key: SortKey,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    descending: bool = False,
+    skip: int = 0,
+    with_total: bool = False,
+) -> Page:
+    """
+    Fetches one page of the given (filtered) select statement.
+
+    Args:
+        db: Database Session.
+        stmt: The select statement including all filters.
+        sort_key: The key the result is ordered by.
+        cursor: Opaque cursor of the previous page. None for the first page.
+        limit: Maximum number of items in the page.
+        descending: Order descending instead of ascending.
+        skip: Offset, only kept for compatibility with offset based clients.
+        with_total: Also count all rows matching the filters.
+
+    Returns:
+        The page with its items, the cursor of the next page (if any) and the optional total.
+    """
+    page_stmt = keyset_select(stmt, sort_key, cursor, limit, descending)
+    if skip:
+        page_stmt = page_stmt.offset(skip)
+    page = _to_page(db.execute(page_stmt).scalars().all(), sort_key, limit, descending)
+    if with_total:
+        page.total = db.execute(_count_select(stmt)).scalar_one()
+    return page
+
+
+async def paginate_async(
+    db: AsyncSession,
+    stmt: Select,
+    sort_key: SortKey,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    descending: bool = False,
+    skip: int = 0,
+    with_total: bool = False,
+) -> Page:
+    """
+    Same as paginate, but for an AsyncSession.
+    """
+    page_stmt = keyset_select(stmt, sort_key, cursor, limit, descending)
+    if skip:
+        page_stmt = page_stmt.offset(skip)
+    result = await db.execute(page_stmt)
+    page = _to_page(result.scalars().all(), sort_key, limit, descending)
+    if with_total:
+        page.total = (await db.execute(_count_select(stmt))).scalar_one()
+    return page
@@ -0,0 +1,312 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import time
+import threading
+import traceback
+import logging
+
+from dataclasses import dataclass
+from typing import Dict
+
+from prometheus_client import Counter, Gauge, Histogram
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from agri_gaia_backend.util.env import bool_from_env, float_from_env, int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Total number of Postgres connections all backend worker processes together may open.
+# Should stay below the max_connections of the Postgres server (defaults to 100, of
+# which 3 are reserved for superusers), leaving a few for migrations and psql sessions.
+DB_CONNECTION_BUDGET = int_from_env("DB_CONNECTION_BUDGET", 90)
+# Number of backend worker processes sharing the budget. Uvicorn reads the same variable.
+WEB_CONCURRENCY = int_from_env("WEB_CONCURRENCY", 1)
+# Share of a worker's budget given to the async engine. The rest goes to the sync engine,
+# which is also used by all background tasks.
+DB_ASYNC_POOL_SHARE = float_from_env("DB_ASYNC_POOL_SHARE", 0.25)
+DB_POOL_TIMEOUT = float_from_env("DB_POOL_TIMEOUT", 30.0)
+# Connections checked out for longer than this are reported with the stack which checked them out.
+DB_LONG_HELD_CONNECTION_SECONDS = float_from_env(
+    "DB_LONG_HELD_CONNECTION_SECONDS", 60.0
+)
+DB_POOL_CAPTURE_STACKS = not bool_from_env("DB_POOL_DISABLE_STACK_CAPTURE")
+# Number of application frames kept of the stack which checked out a connection.
+DB_POOL_STACK_DEPTH = int_from_env("DB_POOL_STACK_DEPTH", 25)
+# Default size of the threadpool running sync endpoints (anyio), each may hold a session.
+REQUEST_THREADS = 40
+
+_SQLALCHEMY_DIR = os.path.dirname(sqlalchemy.__file__) + os.sep
+
+POOL_CHECKED_OUT = Gauge(
+    "agri_gaia_db_pool_checked_out",
+    "Connections currently checked out of the pool.",
+    labelnames=("engine",),
+)
+POOL_OVERFLOW = Gauge(
+    "agri_gaia_db_pool_overflow",
+    "Current overflow of the pool. Negative while the pool is not filled up yet.",
+    labelnames=("engine",),
+)
+POOL_SIZE = Gauge(
+    "agri_gaia_db_pool_size",
+    "Configured number of persistent connections in the pool.",
+    labelnames=("engine",),
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "agri_gaia_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection to be checked out of the pool.",
+    labelnames=("engine",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30),
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "agri_gaia_db_pool_checkout_timeouts_total",
+    "Checkouts which failed because the pool was exhausted.",
+    labelnames=("engine",),
+)
+POOL_LONG_HELD_CONNECTIONS = Counter(
+    "agri_gaia_db_pool_long_held_connections_total",
+    "Connections which were held longer than DB_LONG_HELD_CONNECTION_SECONDS.",
+    labelnames=("engine",),
+)
+
+
+@dataclass
+class PoolSizing:
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+
+    def engine_kwargs(self) -> Dict:
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+        }
+
+
+def compute_pool_sizing(
+    budget: int, workers: int, share: float, pool_timeout: float = DB_POOL_TIMEOUT
+) -> PoolSizing:
+    """
+    Derives the pool configuration of one engine from the connection budget.
+
+    Args:
+        budget: Total number of connections all worker processes may open.
+        workers: Number of worker processes sharing the budget.
+        share: Fraction of the per worker budget the engine may use.
+        pool_timeout: Seconds to wait for a connection before giving up.
+
+    Returns:
+        The sizing, half of the connections persistent and half as overflow.
+        All workers together never open more than their share of the budget.
+
+    Raises:
+        ValueError: If the share of the budget is less than one connection per worker.
+    """
+    workers = max(workers, 1)
+    connections = int(budget // workers * share)
+    if connections < 1:
+        raise ValueError(
+            f"A connection budget of {budget} leaves less than one connection per "
+            f"worker for a pool share of {share} with {workers} worker(s). "
+            f"Raise DB_CONNECTION_BUDGET or lower WEB_CONCURRENCY."
+        )
+    pool_size = max(connections // 2, 1)
+    return PoolSizing(
+        pool_size=pool_size,
+        max_overflow=connections - pool_size,
+        pool_timeout=pool_timeout,
+    )
+
+
+def check_sync_pool_sizing(sizing: PoolSizing, task_workers: int) -> None:
+    """
+    Warns if the sync pool cannot serve every background task worker and request thread
+    at once. Every background task holds a session for its whole run, so requests then
+    wait for a connection until DB_POOL_TIMEOUT while long tasks are running.
+
+    Args:
+        sizing: The sizing of the sync engine.
+        task_workers: Number of worker threads of all background task queues.
+    """
+    connections = sizing.pool_size + sizing.max_overflow
+    demand = task_workers + REQUEST_THREADS
+    if connections < demand:
+        logger.warning(
+            f"The sync DB pool has {connections} connection(s), but up to {demand} "
+            f"({task_workers} background task workers, {REQUEST_THREADS} request "
+            f"threads) may hold one at the same time. Raise DB_CONNECTION_BUDGET or "
+            f"lower the TASK_QUEUE_*_CONCURRENCY settings."
+        )
+
+
+def sync_pool_sizing() -> PoolSizing:
+    return compute_pool_sizing(
+        DB_CONNECTION_BUDGET, WEB_CONCURRENCY, 1.0 - DB_ASYNC_POOL_SHARE
+    )
+
+
+def async_pool_sizing() -> PoolSizing:
+    return compute_pool_sizing(
+        DB_CONNECTION_BUDGET, WEB_CONCURRENCY, DB_ASYNC_POOL_SHARE
+    )
+
+
+class _CheckoutWaitMixin:
+    """
+    Measures how long a checkout waits for a free connection.
+    """
+
+    engine_name = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(engine=self.engine_name).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.labels(engine=self.engine_name).observe(
+                time.perf_counter() - start
+            )
+
+
+class InstrumentedQueuePool(_CheckoutWaitMixin, QueuePool):
+    engine_name = "sync"
+
+
+class InstrumentedAsyncQueuePool(_CheckoutWaitMixin, AsyncAdaptedQueuePool):
+    engine_name = "async"
+
+
+def _application_stack() -> traceback.StackSummary:
+    """
+    Returns the innermost frames of the current stack outside of SQLAlchemy and this
+    module, so that the frame which checked out a connection is not cut off by the
+    pool and event internals calling the checkout listener.
+    """
+    frames = [
+        frame
+        for frame in traceback.extract_stack()
+        if not frame.filename.startswith(_SQLALCHEMY_DIR) and frame.filename != __file__
+    ]
+    return traceback.StackSummary.from_list(frames[-DB_POOL_STACK_DEPTH:])
+
+
+class _CheckedOutConnections:
+    """
+    Bookkeeping of checked out connections, used to detect connections held for too long.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._records: Dict[int, Dict] = {}
+
+    def add(self, engine_name: str, connection_record) -> None:
+        entry = {
+            "engine": engine_name,
+            "since": time.monotonic(),
+            "stack": _application_stack() if DB_POOL_CAPTURE_STACKS else None,
+            "reported": False,
+        }
+        with self._lock:
+            self._records[id(connection_record)] = entry
+
+    def remove(self, connection_record) -> None:
+        with self._lock:
+            self._records.pop(id(connection_record), None)
+
+    def report_long_held(self, threshold: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            long_held = [
+                entry
+                for entry in self._records.values()
+                if not entry["reported"] and now - entry["since"] > threshold
+            ]
+            for entry in long_held:
+                entry["reported"] = True
+
+        for entry in long_held:
+            POOL_LONG_HELD_CONNECTIONS.labels(engine=entry["engine"]).inc()
+            stack = (
+                "".join(traceback.format_list(entry["stack"]))
+                if entry["stack"] is not None
+                else "<stack capture disabled>\n"
+            )
+            logger.warning(
+                f"DB connection of engine '{entry['engine']}' held for "
+                f"{now - entry['since']:.1f}s. Checked out at:\n{stack}"
+            )
+
+
+_checked_out = _CheckedOutConnections()
+
+
+def instrument_pool(engine: Engine, engine_name: str) -> None:
+    """
+    Registers pool events and gauges for the given engine.
+    For an AsyncEngine its sync_engine has to be passed.
+    """
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _checked_out.add(engine_name, connection_record)
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        _checked_out.remove(connection_record)
+
+    # Resolve the pool on every scrape, the engine replaces it on dispose().
+    POOL_CHECKED_OUT.labels(engine=engine_name).set_function(
+        lambda: engine.pool.checkedout()
+    )
+    POOL_OVERFLOW.labels(engine=engine_name).set_function(
+        lambda: engine.pool.overflow()
+    )
+    POOL_SIZE.labels(engine=engine_name).set_function(lambda: engine.pool.size())
+
+
+def _watch_long_held_connections(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            _checked_out.report_long_held(DB_LONG_HELD_CONNECTION_SECONDS)
+        except Exception as e:
+            logger.exception(e)
+
+
+_watchdog = None
+
+
+def start_long_held_connection_watchdog() -> None:
+    """
+    Starts a daemon thread which periodically reports connections held longer than
+    DB_LONG_HELD_CONNECTION_SECONDS. Calling it more than once has no effect.
+    """
+    global _watchdog
+    if _watchdog is not None:
+        return
+    interval = max(DB_LONG_HELD_CONNECTION_SECONDS / 4, 1.0)
+    _watchdog = threading.Thread(
+        target=_watch_long_held_connections,
+        args=(interval,),
+        name="db-pool-watchdog",
+        daemon=True,
+    )
+    _watchdog.start()
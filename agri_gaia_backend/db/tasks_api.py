@@ -11,12 +11,21 @@
 
 import datetime
 from typing import List, Optional
+from sqlalchemy import DateTime, delete, insert, literal, select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from agri_gaia_backend.db.models import Task, TaskStatus
+from agri_gaia_backend.db import change_tracking, pagination
+from agri_gaia_backend.db.models import Task, TaskHistory, TaskStatus
 
 # from agri_gaia_backend.schemas import task as schemas
 
+FINISHED_TASK_STATUSES = (
+    TaskStatus.completed,
+    TaskStatus.failed,
+    TaskStatus.cancelled,
+)
+
 
 def get_task(db: Session, task_id: int) -> Task:
     return db.query(Task).filter(Task.id == task_id).first()
@@ -28,7 +37,7 @@ def get_tasks(
     q = db.query(Task)
     if ids:
         q = q.filter(Task.id.in_(ids))
-    return q.offset(skip).limit(limit).all()
+    return q.order_by(Task.id).offset(skip).limit(limit).all()
 
 
 def get_tasks_by_initiator(
@@ -37,12 +46,44 @@ def get_tasks_by_initiator(
     return (
         db.query(Task)
         .filter(Task.initiator == initiator)
+        .order_by(Task.id)
         .offset(skip)
         .limit(limit)
         .all()
     )
 
 
+TASK_SORT_KEYS = pagination.sort_keys(Task, created=Task.creation_date)
+
+
+async def get_tasks_async(
+    db: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = pagination.DEFAULT_PAGE_SIZE,
+    ids: Optional[List[int]] = None,
+    initiator: Optional[str] = None,
+    order_by: str = "id",
+    descending: bool = False,
+    skip: int = 0,
+    with_total: bool = False,
+) -> pagination.Page:
+    q = select(Task)
+    if ids:
+        q = q.filter(Task.id.in_(ids))
+    if initiator:
+        q = q.filter(Task.initiator == initiator)
+    return await pagination.paginate_async(
+        db,
+        q,
+        pagination.get_sort_key(TASK_SORT_KEYS, order_by),
+        cursor=cursor,
+        limit=limit,
+        descending=descending,
+        skip=skip,
+        with_total=with_total,
+    )
+
+
 def create_task(db: Session, initiator: str, title: Optional[str] = None) -> Task:
     db_task = Task(
         initiator=initiator,
@@ -64,7 +105,102 @@ def update_task(db: Session, task: Task) -> Task:
     return task
 
 
+def update_task_progress(db: Session, task: Task) -> None:
+    # Progress is written frequently, so the task is not refreshed afterwards.
+    db.add(task)
+    db.commit()
+
+
+def request_task_cancellation(db: Session, task: Task) -> bool:
+    # Locks the row, so that a task finishing in the meantime keeps its status.
+    db.refresh(task, with_for_update=True)
+    if task.status not in (
+        TaskStatus.created,
+        TaskStatus.queued,
+        TaskStatus.inprogress,
+    ):
+        db.commit()
+        return False
+    task.status = TaskStatus.cancelling
+    db.commit()
+    db.refresh(task)
+    return True
+
+
+def is_task_cancellation_requested(db: Session, task_id: int) -> bool:
+    status = db.execute(select(Task.status).where(Task.id == task_id)).scalar()
+    # A deleted task is cancelled as well.
+    return status is None or status == TaskStatus.cancelling
+
+
 def delete_task(db: Session, task: Task) -> bool:
     db.delete(task)
     db.commit()
     return True
+
+
+def archive_finished_tasks(
+    db: Session, created_before: datetime.datetime, limit: int = 1000
+) -> int:
+    """
+    Moves finished tasks created before the given date into the task_history table.
+
+    Args:
+        db: Database Session.
+        created_before: Only tasks created before this date are archived.
+        limit: Maximum number of tasks archived in this transaction.
+
+    Returns:
+        The number of archived tasks.
+    """
+    # Rows locked by another worker archiving at the same time are skipped.
+    task_ids = (
+        db.execute(
+            select(Task.id)
+            .where(
+                Task.status.in_(FINISHED_TASK_STATUSES),
+                Task.creation_date < created_before,
+            )
+            .order_by(Task.creation_date)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        .scalars()
+        .all()
+    )
+    if not task_ids:
+        db.commit()
+        return 0
+
+    db.execute(
+        insert(TaskHistory).from_select(
+            [
+                TaskHistory.id,
+                TaskHistory.title,
+                TaskHistory.creation_date,
+                TaskHistory.initiator,
+                TaskHistory.status,
+                TaskHistory.message,
+                TaskHistory.archived_date,
+            ],
+            select(
+                Task.id,
+                Task.title,
+                Task.creation_date,
+                Task.initiator,
+                Task.status,
+                Task.message,
+                literal(datetime.datetime.now(), DateTime),
+            ).where(Task.id.in_(task_ids)),
+        )
+    )
+    db.execute(
+        delete(Task)
+        .where(Task.id.in_(task_ids))
+        .execution_options(synchronize_session=False)
+    )
+    change_tracking.increment_table_versions(
+        db, (Task.__tablename__, TaskHistory.__tablename__)
+    )
+    db.commit()
+    return len(task_ids)
@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import datetime
+from typing import List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from agri_gaia_backend.db.models import TritonRepositoryEntry
+
+
+def get_entry(db: Session, model_name: str) -> Optional[TritonRepositoryEntry]:
+    return (
+        db.query(TritonRepositoryEntry)
+        .filter(TritonRepositoryEntry.model_name == model_name)
+        .first()
+    )
+
+
+def get_entries_by_last_used(db: Session) -> List[TritonRepositoryEntry]:
+    return (
+        db.query(TritonRepositoryEntry).order_by(TritonRepositoryEntry.last_used).all()
+    )
+
+
+def get_total_size(db: Session) -> int:
+    return db.query(func.coalesce(func.sum(TritonRepositoryEntry.size), 0)).scalar()
+
+
+def save_entry(
+    db: Session,
+    model_name: str,
+    content_hash: str,
+    config_hash: Optional[str],
+    object_name: str,
+    size: int,
+) -> TritonRepositoryEntry:
+    entry = get_entry(db, model_name) or TritonRepositoryEntry(model_name=model_name)
+    entry.content_hash = content_hash
+    entry.config_hash = config_hash
+    entry.object_name = object_name
+    entry.size = size
+    entry.last_used = datetime.datetime.now()
+    # The batch size was tuned for the previous version of the model.
+    entry.batch_size = None
+    entry.batch_size_probes = None
+    db.add(entry)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+
+def set_batch_size(
+    db: Session, entry: TritonRepositoryEntry, batch_size: int, probes: List[dict]
+) -> None:
+    entry.batch_size = batch_size
+    entry.batch_size_probes = probes
+    db.add(entry)
+    db.commit()
+
+
+def touch_entry(db: Session, entry: TritonRepositoryEntry) -> None:
+    entry.last_used = datetime.datetime.now()
+    db.add(entry)
+    db.commit()
+
+
+def delete_entry(db: Session, entry: TritonRepositoryEntry) -> None:
+    db.delete(entry)
+    db.commit()
@@ -14,8 +14,13 @@ import logging
 from agri_gaia_backend import db
 from agri_gaia_backend.util.common import get_stacktrace
 from agri_gaia_backend.util.env import bool_from_env
+from agri_gaia_backend.util.server_timing import server_timing_middleware
 from agri_gaia_backend.services.portainer.portainer_api import portainer
 from agri_gaia_backend.services.docker import image_builder
+from agri_gaia_backend.services.tasks.retention import start_task_retention_job
+from agri_gaia_backend.services.inference.result_cache import (
+    start_result_cache_eviction_job,
+)
 from agri_gaia_backend.routers.exception_handlers import (
     _missing_input_data_exception_handler,
 )
@@ -85,6 +90,11 @@ if should_migrate:
 else:
     logger.info("Creating db tables from sqlalchemy definitions. Not using alembic")
     db.models.Base.metadata.create_all(bind=db.database.engine)
+
+# Report DB connections which are held for too long, see DB_LONG_HELD_CONNECTION_SECONDS
+db.pool.start_long_held_connection_watchdog()
+start_task_retention_job()
+start_result_cache_eviction_job()
 ####################
 
 debug = bool_from_env("DEBUG")
@@ -98,7 +108,7 @@ app = FastAPI(debug=debug)
 # CORS has to be the outer most all the time, so that all requests get the needed CORS-Headers
 
 # Current config:
-# CORS -> Expose Headers -> Logs -> Prometheus -> Auth -> AuthCheck -> Auth -> Prometheus -> Logs -> Expose Headers -> CORS
+# CORS -> Expose Headers -> Logs -> Server-Timing -> Prometheus -> Auth -> AuthCheck -> Auth -> Prometheus -> Server-Timing -> Logs -> Expose Headers -> CORS
 
 
 # add a custom middleware that checks if the user created in AuthenticationMiddleware
@@ -133,6 +143,9 @@ app.add_middleware(AuthenticationMiddleware, backend=BearerTokenAuthBackend())
 # Prometheus Monitoring
 Instrumentator().instrument(app).expose(app)
 
+# Per-request downstream latency breakdown (Server-Timing header + Prometheus histograms)
+app.middleware("http")(server_timing_middleware)
+
 
 @app.middleware("http")
 async def log_errors_middleware(request: Request, call_next):
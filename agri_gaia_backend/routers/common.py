@@ -10,18 +10,50 @@
 # SPDX-License-Identifier: MIT
 
 import io
+import inspect
 import mimetypes
+import threading
 from zipfile import ZipFile
-from typing import Callable, List, Tuple, TypeVar, Dict
-from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Type, TypeVar, Dict
+from concurrent.futures import Future
 
 from fastapi import Request, Response, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from agri_gaia_backend.db.database import SessionLocal
-from agri_gaia_backend.db import tasks_api
+from sqlalchemy.ext.asyncio import AsyncSession
+from agri_gaia_backend.db.database import SessionLocal, AsyncSessionLocal
+from agri_gaia_backend.db import change_tracking, tasks_api
+from agri_gaia_backend.db.pagination import Page, PaginationError
 from agri_gaia_backend.db.models import Task, TaskStatus
+from agri_gaia_backend.schemas import task as task_schemas
 from agri_gaia_backend.schemas.keycloak_user import KeycloakUser
+from agri_gaia_backend.services.tasks import events, phases
+from agri_gaia_backend.services.tasks.cancellation import (
+    TASK_TIMEOUTS,
+    CancellationToken,
+    TaskCancelledError,
+    cancellation_registry,
+)
+from agri_gaia_backend.services.tasks.events import task_events
+from agri_gaia_backend.services.tasks.progress import CoalescingProgressWriter
+from agri_gaia_backend.services.tasks.scheduler import (
+    IO,
+    Priority,
+    QueueFullError,
+    TaskScheduler,
+    UserQuotaExceededError,
+    scheduler,
+)
 from agri_gaia_backend.util import env
+from agri_gaia_backend.util.response_cache import (
+    RESPONSE_CACHE_REQUESTS,
+    CachedResponse,
+    etag_matches,
+    make_etag,
+    response_cache,
+)
 from agri_gaia_backend.routers.paths import TASKS_ROOT_PATH
 
 import logging
@@ -38,11 +70,17 @@ def get_db() -> SessionLocal:
         db.close()
 
 
+# FastAPI Dependency for async endpoints
+async def get_async_db() -> AsyncSession:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 class TaskCreator:
     """
     TaskCreator class. This class is responsible for creating tasks and running them in a background thread.
 
-    In this implementation a ThreadPoolExecutor is used instead of FastAPIs BackgroundTasks.
+    In this implementation a TaskScheduler (services/tasks/scheduler.py) is used instead of FastAPIs BackgroundTasks.
     The reason for this is that we use the BaseHTTPMiddleware class of Starlette which is incompatible
     with the BackgroundTasks in FastAPI (which needs a rework anyways as far as I understood).
     See:
@@ -52,7 +90,7 @@ class TaskCreator:
     - https://github.com/encode/starlette/issues/1678
     """
 
-    executor: ThreadPoolExecutor = ThreadPoolExecutor()
+    scheduler: TaskScheduler = scheduler
 
     def __init__(self, initiator: str) -> None:
         self.initiator = initiator
@@ -61,38 +99,102 @@ class TaskCreator:
     def _get_task_location_url(task_id: int) -> str:
         return f"https://api.{env.PROJECT_BASE_URL}{TASKS_ROOT_PATH}/{task_id}"
 
+    @staticmethod
+    def publish(event_type: str, task: Task) -> None:
+        try:
+            task_events.publish(
+                event_type, task.initiator, task.id, task_schemas.Task.from_orm(task)
+            )
+        except Exception as e:
+            logger.exception(e)
+
+    @staticmethod
+    def _is_cancellation_requested(task_id: int) -> bool:
+        # Cancellations requested through another worker process are only visible in the database.
+        with SessionLocal() as db:
+            return tasks_api.is_task_cancellation_requested(db, task_id)
+
+    @staticmethod
+    def _accepts_parameter(func: Callable, name: str) -> bool:
+        return name in inspect.signature(func).parameters
+
+    @staticmethod
+    def _finish(
+        db: Session,
+        task: Task,
+        status: TaskStatus,
+        message: str,
+        recorder: Optional[phases.PhaseRecorder] = None,
+    ) -> None:
+        task.status = status
+        if recorder is not None:
+            task.phases = recorder.to_dict() or None
+        if status == TaskStatus.completed:
+            task.completion_percentage = 1.0
+        else:
+            task.message = message
+        try:
+            tasks_api.update_task(db, task)
+        except Exception as e:
+            # E.g. the task was deleted while running.
+            logger.exception(e)
+            db.rollback()
+        TaskCreator.publish(events.COMPLETED, task)
+
     def create_background_task(
-        self, func: Callable, task_title: str, *args, **kwargs
-    ) -> Tuple[Task, str]:
+        self,
+        func: Callable,
+        task_title: str,
+        *args,
+        queue: str = IO,
+        priority: Priority = Priority.NORMAL,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Tuple[Task, str, Future]:
         """
         Runs the given callable in a background thread and creates a Task object
         which is stored in the database. The Tasks status is updated when the
-        Task is completed.
+        Task is completed. Changes of the task are published as task events,
+        see services/tasks/events.py.
 
         Args:
             func (Callable): The callable to be executed in the background thread.
                             In addition to the given positional and keyword arguments the
                             function gets two callback functions:
                             on_progress_change (float -> None): which can be called to update the tasks progress.
-                                                                The progress should be between 0 and 1
+                                                                The progress should be between 0 and 1.
+                                                                Updates are coalesced and written at a bounded rate,
+                                                                see services/tasks/progress.py.
+                                                                Raises a TaskCancelledError if the task was cancelled.
                             on_error (str -> None): which should be called if an error occurs.
                                                     The given message will be displayed in the task and
                                                     the task will be marked as failed.
+                            If func has a cancellation_token parameter, it also gets the CancellationToken
+                            of the task, see services/tasks/cancellation.py.
+                            If func has a task_id parameter, it also gets the id of its task.
+                            Steps of func measured with services.tasks.phases.phase() are
+                            stored in the phases of the task.
             args: positional arguments given to func
+            queue: The scheduler queue the task runs in: "io" (default), "cpu" or "docker".
+                   Each user can only run a limited number of tasks per queue at once,
+                   further tasks have the status "queued" until one of them finished.
+            priority: The priority of the task within its queue.
+            timeout: Wall-clock limit of the running task in seconds, after which it is cancelled.
+                     Defaults to the limit of the queue. 0 disables the limit.
             kwargs: keyword arguments given to func
 
         Returns:
-            Tuple[Task, str]: The created Task and the task objects location as url string.
+            Tuple[Task, str, Future]: The created Task, the task objects location as url string
+                                      and the Future of the background thread.
         """
 
-        def task_func():
-            def task_progress_change_handler(completion_percentage: float) -> None:
-                if completion_percentage <= 1.0 and completion_percentage > 0.0:
-                    task.completion_percentage = completion_percentage
-                    tasks_api.update_task(db, task)
-                else:
-                    logger.warn("Invalid value range of completion percentage")
+        def on_progress_change(completion_percentage: float) -> None:
+            cancellation_token.raise_if_cancelled()
+            # Written together with the progress.
+            task.phases = recorder.to_dict() or None
+            progress.update(completion_percentage)
 
+        def task_func():
             def on_error(message: str) -> None:
                 nonlocal error_message
                 error_message = message
@@ -101,16 +203,30 @@ class TaskCreator:
 
             error_message = "Task failed. See backend logs for details."
             task_execution_failed = False
+            cancellation_token.start()
             try:
-                task.status = TaskStatus.inprogress
-                tasks_api.update_task(db, task)
+                if cancellation_token.cancelled:
+                    return
+
+                with status_lock:
+                    task.status = TaskStatus.inprogress
+                    task.message = None
+                    tasks_api.update_task(db, task)
+                self.publish(events.STATUS, task)
+                if self._accepts_parameter(func, "cancellation_token"):
+                    kwargs["cancellation_token"] = cancellation_token
+                if self._accepts_parameter(func, "task_id"):
+                    kwargs["task_id"] = task.id
                 try:
-                    func(
-                        *args,
-                        on_progress_change=task_progress_change_handler,
-                        on_error=on_error,
-                        **kwargs,
-                    )
+                    with phases.recording(recorder):
+                        func(
+                            *args,
+                            on_progress_change=on_progress_change,
+                            on_error=on_error,
+                            **kwargs,
+                        )
+                except TaskCancelledError:
+                    pass
                 except NotImplementedError:
                     task_execution_failed = True
                     error_message = (
@@ -121,23 +237,73 @@ class TaskCreator:
                     task_execution_failed = True
                     raise e
             finally:
-                if task_execution_failed:
-                    task.status = TaskStatus.failed
-                    task.message = error_message
+                progress.flush()
+                # The time limit is not checked again, a task which finished is not cancelled.
+                if cancellation_token.reason is not None:
+                    cancellation_token.run_cleanups()
+                    self._finish(
+                        db,
+                        task,
+                        TaskStatus.cancelled,
+                        cancellation_token.message,
+                        recorder,
+                    )
+                elif task_execution_failed:
+                    self._finish(db, task, TaskStatus.failed, error_message, recorder)
                 else:
-                    task.status = TaskStatus.completed
-                    task.completion_percentage = 1.0
+                    self._finish(db, task, TaskStatus.completed, None, recorder)
+                db.close()
+
+        def on_wait() -> None:
+            # The user already runs the maximum number of tasks of this queue.
+            with status_lock:
+                if task.status != TaskStatus.created:
+                    return
+                task.status = TaskStatus.queued
+                task.message = "Waiting for other tasks of the user to finish."
                 tasks_api.update_task(db, task)
+            self.publish(events.STATUS, task)
+
+        def on_done(future: Future) -> None:
+            # The task was cancelled while waiting in the scheduler queue, task_func never ran.
+            if future.cancelled():
+                self._finish(db, task, TaskStatus.cancelled, cancellation_token.message)
                 db.close()
 
+        if timeout is None:
+            timeout = TASK_TIMEOUTS[queue]
+        status_lock = threading.Lock()
+        recorder = phases.PhaseRecorder()
+
         try:
-            db: Session = SessionLocal()
+            # The session is only used for the task, which is not modified elsewhere while running.
+            # Not expiring it on commit allows publishing progress events without reloading it.
+            db: Session = SessionLocal(expire_on_commit=False)
             task = tasks_api.create_task(db, initiator=self.initiator, title=task_title)
-            future = TaskCreator.executor.submit(task_func)
+            self.publish(events.CREATED, task)
+            cancellation_token = CancellationToken(
+                timeout, poll=lambda: self._is_cancellation_requested(task.id)
+            )
+            progress = CoalescingProgressWriter(
+                db, task, on_write=lambda t: self.publish(events.PROGRESS, t)
+            )
+            future = TaskCreator.scheduler.submit(
+                task_func, queue, priority, key=self.initiator, on_wait=on_wait
+            )
+        except UserQuotaExceededError as e:
+            self._finish(db, task, TaskStatus.failed, str(e))
+            db.close()
+            raise HTTPException(status_code=429, detail=str(e))
+        except QueueFullError as e:
+            self._finish(db, task, TaskStatus.failed, str(e))
+            db.close()
+            raise HTTPException(status_code=503, detail=str(e))
         except Exception as e:
             db.close()
             raise e
 
+        future.add_done_callback(on_done)
+        cancellation_registry.register(task.id, cancellation_token, future)
         return task, self._get_task_location_url(task.id), future
 
 
@@ -248,3 +414,83 @@ def check_exists(obj: T, detail: str = None) -> T:
     if not obj:
         raise HTTPException(status_code=404, detail=detail)
     return obj
+
+
+def _pagination_headers(page: Page, request: Request) -> Dict[str, str]:
+    headers = {}
+    if page.next_cursor is not None:
+        next_url = request.url.include_query_params(cursor=page.next_cursor)
+        headers["X-Next-Cursor"] = page.next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    if page.total is not None:
+        headers["X-Total-Count"] = str(page.total)
+    return headers
+
+
+async def cached_list_response(
+    request: Request,
+    db: AsyncSession,
+    tables: Tuple[str, ...],
+    item_schema: Type[BaseModel],
+    load_page: Callable[[], Awaitable[Page]],
+    etag_extra: Any = None,
+) -> Response:
+    """
+    Builds the response of a paginated list endpoint with support for conditional requests.
+
+    The ETag is derived from the change counters of the tables the list is built from
+    and the query parameters, so it can be computed without loading the list itself.
+    If it matches the If-None-Match header, 304 Not Modified is returned. Otherwise the
+    serialized response is served from a small per-user cache or built and cached.
+
+    The body of list endpoints stays a plain list. The cursor of the next page is returned
+    in the X-Next-Cursor header and as Link header (rel="next"), the total number of items
+    in the X-Total-Count header if it was requested.
+
+    Args:
+        request: The current request.
+        db: Async Database Session.
+        tables: Names of all tables the response depends on.
+        item_schema: Pydantic schema of a single list item.
+        load_page: Loads the requested page, only called if the response is not cached.
+        etag_extra: State the response depends on, which is not stored in the tables.
+
+    Returns:
+        The JSON list response.
+    """
+    handler = request.url.path
+    versions = await change_tracking.get_table_versions_async(db, tables)
+    key = f"{handler}?{sorted(request.query_params.multi_items())}"
+    etag = make_etag(versions, key, etag_extra)
+    headers = {
+        "ETag": etag,
+        # Clients may store the response, but have to revalidate it on every use.
+        "Cache-Control": "private, no-cache",
+        "Access-Control-Expose-Headers": "ETag, X-Next-Cursor, X-Total-Count, Link",
+    }
+
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        RESPONSE_CACHE_REQUESTS.labels(handler=handler, result="not_modified").inc()
+        return Response(status_code=304, headers=headers)
+
+    user = request.user.username
+    cached = response_cache.get(user, key)
+    if cached is not None and cached.etag == etag:
+        RESPONSE_CACHE_REQUESTS.labels(handler=handler, result="hit").inc()
+        return Response(
+            cached.body, media_type="application/json", headers=cached.headers
+        )
+
+    RESPONSE_CACHE_REQUESTS.labels(handler=handler, result="miss").inc()
+    try:
+        page = await load_page()
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers.update(_pagination_headers(page, request))
+    response = JSONResponse(
+        jsonable_encoder([item_schema.from_orm(item) for item in page.items]),
+        headers=headers,
+    )
+    response_cache.put(user, key, CachedResponse(etag, response.body, headers))
+    return response
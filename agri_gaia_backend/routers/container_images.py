@@ -38,6 +38,8 @@ from agri_gaia_backend.db import (
 from agri_gaia_backend.db import models
 from agri_gaia_backend.services.docker import image_builder
 from agri_gaia_backend.services.docker import docker_api
+from agri_gaia_backend.services.tasks import scheduler
+from agri_gaia_backend.services.tasks.cancellation import CancellationToken
 from agri_gaia_backend.routers.common import (
     TaskCreator,
     check_exists,
@@ -153,6 +155,7 @@ async def download_container_image(
     _, task_location, _ = task_creator.create_background_task(
         download_task,
         task_title=f"Download Container Image {repository}/{tag}/{os_arch}",
+        queue=scheduler.DOCKER,
     )
 
     headers = {"Location": task_location}
@@ -199,22 +202,32 @@ def build_container(
     image_builder.validate_generator_input(model, edge_info)
 
     def build_and_push_image(
-        on_error, on_progress_change, model, edge_info, container_template
+        on_error,
+        on_progress_change,
+        model,
+        edge_info,
+        container_template,
+        cancellation_token: CancellationToken,
     ):
+        def status_callback(type, info):
+            logger.debug(f"{type}: {json.dumps(info)}")
+            # Stops following the build and push between two status messages.
+            cancellation_token.raise_if_cancelled()
+
         image_id = image_builder.build_and_push_image(
             inference_container_template=container_template,
             repository_name=config.repository,
             image_tag=config.tag,
             model=model,
             edge_info=edge_info,
-            status_callback=lambda type, info: logger.debug(
-                f"{type}: {json.dumps(info)}"
-            ),
+            status_callback=status_callback,
         )
 
     _, task_location_url, _ = task_creator.create_background_task(
         build_and_push_image,
         task_title=f"Container Buildjob '{config.repository}/{config.tag}'",
+        queue=scheduler.BUILD,
+        priority=scheduler.Priority.LOW,
         model=model,
         edge_info=edge_info,
         container_template=container_template,
@@ -16,25 +16,24 @@ import json
 import logging
 import os
 import tempfile
-import fiftyone as fo
-import fiftyone.utils.labels as foul
 import fiftyone.utils.cvat as cvat
 import docker
-import xmltodict
 import inspect
 import zipfile
 import subprocess
 from functools import reduce
-from typing import Dict, List, Optional, Union
-from pathlib import Path
+from typing import Dict, List, Optional
 import io
 from PIL import Image
 
 from agri_gaia_backend.db import dataset_api as sql_api
+from agri_gaia_backend.db import models
+from agri_gaia_backend.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from agri_gaia_backend.routers import common
 from agri_gaia_backend.routers.agrovoc import check_keyword
 from agri_gaia_backend.routers.common import (
     check_exists,
+    get_async_db,
     get_db,
     create_zip_file_response,
     create_single_file_response,
@@ -44,6 +43,9 @@ from agri_gaia_backend.schemas.cvat import CvatAuthDataSchema
 from agri_gaia_backend.schemas.dataset import Dataset
 from agri_gaia_backend.schemas.keycloak_user import KeycloakUser
 from agri_gaia_backend.services import minio_api
+from agri_gaia_backend.services.tasks import scheduler
+from agri_gaia_backend.services.tasks.processes import process_pool
+from agri_gaia_backend.util.label_conversion import convert_label_file
 from agri_gaia_backend.services.cvat.cvat_api import get_task_annotations, remove_task
 from agri_gaia_backend.services.edc.connector import (
     create_catalog_entry_dataset,
@@ -55,7 +57,7 @@ from agri_gaia_backend.services.graph.sparql_operations import (
 )
 from agri_gaia_backend.services.graph.sparql_operations import util as sparql_util
 from agri_gaia_backend.services.minio_api import MINIO_ENDPOINT
-from agri_gaia_backend.util.common import get_stacktrace, rm, mkdir, gpu_available
+from agri_gaia_backend.util.common import get_stacktrace, gpu_available
 from agri_gaia_backend.util.datasets import (
     validate_name,
     is_cvat_annotation_xml,
@@ -66,6 +68,7 @@ from fastapi import (
     Depends,
     Form,
     HTTPException,
+    Query,
     Request,
     Response,
     status,
@@ -75,6 +78,7 @@ from fastapi.param_functions import File
 from fastapi.responses import FileResponse
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from agri_gaia_backend.util.env import NUCLIO_CVAT_PROJECT_NAME
 from agri_gaia_backend.routers.common import TaskCreator, get_task_creator
 
@@ -106,19 +110,50 @@ async def startup():
 
 
 @router.get("", response_model=List[Dataset])
-def get_all_datasets(skip: int = 0, limit: int = 10000, db: Session = Depends(get_db)):
+async def get_all_datasets(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    order_by: str = "id",
+    descending: bool = False,
+    include_total: bool = False,
+    skip: int = 0,
+    db: AsyncSession = Depends(get_async_db),
+):
     """
     Fetches all Datasets from the postgres database
 
+    The list is paginated by cursor. If there are more datasets, the cursor of the next page
+    is returned in the X-Next-Cursor and Link headers. Supports conditional requests
+    with If-None-Match, so polling an unchanged list is answered with 304 Not Modified.
+
     Args:
-        skip: How many dataset entries shall be skipped. Defaults to 0.
+        cursor: Cursor of the page to fetch. Defaults to the first page.
         limit: What is the maximum number of datasets to be fetched? Defaults to 100.
-        db: Database Session. Created automatically.
+        order_by: Either "id" or "last_modified". Defaults to "id".
+        descending: Order descending instead of ascending. Defaults to False.
+        include_total: Return the number of all datasets in the X-Total-Count header.
+        skip: How many dataset entries shall be skipped. Only kept for compatibility, use cursor instead.
+        db: Async Database Session. Created automatically.
 
     Returns:
-        A list of all datasets, which are stored by the plattform.
+        A list of datasets, which are stored by the plattform.
     """
-    return sql_api.get_datasets(db, skip=skip, limit=limit)
+    return await common.cached_list_response(
+        request,
+        db,
+        (models.Dataset.__tablename__,),
+        Dataset,
+        lambda: sql_api.get_datasets_async(
+            db,
+            cursor=cursor,
+            limit=limit,
+            order_by=order_by,
+            descending=descending,
+            skip=skip,
+            with_total=include_total,
+        ),
+    )
 
 
 @router.get("/keyword")
@@ -876,181 +911,30 @@ def convert_labels(
     label_file: UploadFile = File(...),
 ) -> FileResponse:
     """
-    TODO
+    Converts a label file between the formats returned by /convert/formats.
+    The conversion runs in the process pool, so that it does not slow down other requests.
     """
-
-    def import_labels(
-        tmp_dir: str, label_file: UploadFile, input_type: fo.types
-    ) -> fo.Dataset:
-        _, ext = os.path.splitext(label_file.filename)
-
-        if input_type == fo.types.YOLOv5Dataset and ext != ".zip":
-            raise RuntimeError(
-                "YOLOv5 labels have to be uploaded with images as a ZIP archive!"
-            )
-
-        input_dir = os.path.join(tmp_dir, "input")
-        mkdir(input_dir)
-
-        labels_path = os.path.join(input_dir, label_file.filename)
-
-        with open(labels_path, "wb") as fh:
-            label_data = label_file.file.read()
-            fh.write(label_data)
-
-        if ext == ".zip":
-            with zipfile.ZipFile(labels_path, "r") as zip:
-                zip.extractall(input_dir)
-                rm(labels_path)
-            labels_path = input_dir
-        else:
-            labels = label_data.decode("utf-8")
-
-        from_dir_args = {}
-        if input_type == fo.types.YOLOv5Dataset:
-            dataset_filepaths = list(
-                filter(lambda p: p.is_file(), Path(labels_path).rglob("*.*"))
-            )
-
-            if not len(
-                list(filter(lambda p: p.parent.name == "images", dataset_filepaths))
-            ):
-                raise RuntimeError(
-                    "In order to determine image dimensions, YOLOv5 labels have to be uploaded with samples."
-                )
-
-            dataset_yaml_filepath = list(
-                filter(
-                    lambda p: p.name in {"dataset.yaml", "dataset.yml"},
-                    dataset_filepaths,
-                )
-            )
-            if len(dataset_yaml_filepath) != 1:
-                raise RuntimeError("No dataset.yaml found for YOLOv5 labels.")
-            dataset_yaml_filepath = dataset_yaml_filepath[0]
-
-            from_dir_args["dataset_dir"] = dataset_yaml_filepath.parent
-            labels_path = None
-        else:
-            image_paths = None
-            if input_type == fo.types.COCODetectionDataset:
-                labels = json.loads(labels)
-                image_paths = [image["file_name"]
-                               for image in labels["images"]]
-                # With COCO, only labels of type "detections" are read by default.
-                from_dir_args["label_types"] = ("detections", "segmentations")
-            elif input_type == fo.types.CVATImageDataset:
-                labels = xmltodict.parse(labels)
-                images = labels["annotations"]["image"]
-                image_paths = [image["@name"] for image in images]
-
-            data_path = {
-                image_path: os.path.join(
-                    tmp_dir, "data", os.path.basename(image_path))
-                for image_path in image_paths
-            }
-            from_dir_args["data_path"] = data_path
-
-        # See: https://docs.voxel51.com/api/fiftyone.core.dataset.html#fiftyone.core.dataset.Dataset.from_dir
-        return fo.Dataset.from_dir(
-            dataset_type=input_type,
-            labels_path=labels_path,
-            **from_dir_args,
+    try:
+        label_filename, output_label_files = process_pool.run(
+            convert_label_file,
+            input_format,
+            output_format,
+            label_file.filename,
+            label_file.file.read(),
         )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    def transform_labels(
-        labels: fo.Dataset, input_type: fo.types, output_type: fo.types
-    ) -> Union[str, List[str]]:
-
-        # imported_exported_label_fields = [
-        #    field_name
-        #    for field_name in labels.get_field_schema().keys()
-        #    if field_name in {"detections", "segmentations", "polylines", "keypoints"}
-        # ]
-
-        exported_label_fields = None
-        if output_type == fo.types.YOLOv5Dataset:
-            if labels.get_field("detections") is not None:
-                exported_label_fields = "detections"
-        else:
-            if input_type == fo.types.COCODetectionDataset:
-                if labels.get_field("detections") is not None:
-                    exported_label_fields = ["detections"]
-                # With COCO, "segmentations" have to be manually converted to polylines.
-                if labels.get_field("segmentations") is not None:
-                    foul.instances_to_polylines(
-                        labels, "segmentations", "polylines", tolerance=0
-                    )
-                    exported_label_fields.append("polylines")
-            elif input_type == fo.types.CVATImageDataset:
-                if labels.get_field("polylines") is not None:
-                    exported_label_fields = "polylines"
-                else:
-                    exported_label_fields = "detections"
-
-        return exported_label_fields
-
-    def get_label_filename(output_type: fo.types) -> str:
-        if output_type == fo.types.CVATImageDataset:
-            # See: https://docs.voxel51.com/user_guide/export_datasets.html#cvatimagedataset
-            label_filename = "labels.xml"
-        elif output_type == fo.types.COCODetectionDataset:
-            label_filename = "labels.json"
-        else:
-            # For an input label file, multiple label output files are generated.
-            # Example: CVAT -> YOLOv5
-            label_filename = ""
-        return label_filename
-
-    def export_labels(output_type, label_output_path, label_fields) -> None:
-        labels.export(
-            dataset_type=output_type,
-            labels_path=label_output_path,
-            label_field=label_fields,
-            export_media=False,
+    if label_filename:
+        return create_single_file_response(
+            file=output_label_files[label_filename],
+            filename=label_filename,
         )
 
-    try:
-        input_type = eval(f"fo.types.{input_format}")
-        output_type = eval(f"fo.types.{output_format}")
-
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            labels = import_labels(tmp_dir, label_file, input_type)
-            label_fields = transform_labels(labels, input_type, output_type)
-            label_filename = get_label_filename(output_type)
-
-            output_dir = os.path.join(tmp_dir, "output")
-
-            label_output_path = os.path.join(output_dir, label_filename)
-            export_labels(output_type, label_output_path, label_fields)
-
-            if label_filename:
-                if os.path.isfile(label_output_path):
-                    with open(label_output_path, "rb") as fh:
-                        return create_single_file_response(
-                            file=fh.read(),
-                            filename=os.path.basename(label_output_path),
-                        )
-                else:
-                    raise RuntimeError(
-                        "Converted label file was not generated.")
-
-            output_label_filepaths = list(Path(output_dir).rglob("*.*"))
-            if output_label_filepaths:
-                output_label_files = {}
-                for output_label_filepath in output_label_filepaths:
-                    with open(output_label_filepath, "rb") as fh:
-                        output_label_files[output_label_filepath.name] = fh.read(
-                        )
-
-                return create_zip_file_response(
-                    files=output_label_files,
-                    filename="labels.zip",
-                )
-            else:
-                raise RuntimeError("Converted label files were not generated.")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return create_zip_file_response(
+        files=output_label_files,
+        filename="labels.zip",
+    )
 
 
 @router.post("/auto-annotation", status_code=status.HTTP_201_CREATED)
@@ -1109,6 +993,7 @@ def create_auto_annotation_model(
     _, task_location_url, _ = task_creator.create_background_task(
         _create_auto_annotation_model,
         task_title=f"Auto Annotation Model Deployment: {auto_annotation_archive.filename}",
+        queue=scheduler.BUILD,
         auto_annotation_archive=copy.deepcopy(auto_annotation_archive),
     )
 
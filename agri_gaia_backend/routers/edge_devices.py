@@ -12,18 +12,26 @@
 import logging
 import datetime
 
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from requests.exceptions import HTTPError
-from fastapi import APIRouter, Depends, Response, status
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from agri_gaia_backend.schemas.edge_device import EdgeDevice, EdgeDeviceCreate
 from agri_gaia_backend.schemas.container_deployment import ContainerDeployment
-from agri_gaia_backend.routers.common import check_exists, get_db
+from agri_gaia_backend.routers.common import (
+    cached_list_response,
+    check_exists,
+    get_async_db,
+    get_db,
+)
 from agri_gaia_backend.db import (
     models,
     edge_device_api as sql_api,
 )
+from agri_gaia_backend.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, Page
 from agri_gaia_backend.routers.common import check_exists
 from agri_gaia_backend.services.portainer.portainer_api import portainer
 
@@ -33,8 +41,7 @@ ROOT_PATH = "/edge-devices"
 router = APIRouter(prefix=ROOT_PATH)
 
 
-def _update_portainer_info(edge_devices: List[EdgeDevice], db: Session):
-    # query the last heartbeat and add to each device, if available
+def _fetch_portainer_info() -> Tuple[Dict, Dict]:
     try:
         endpoints = portainer.get_all_endpoints()
     except:
@@ -45,11 +52,25 @@ def _update_portainer_info(edge_devices: List[EdgeDevice], db: Session):
     except:
         tags = []
 
-    endpoint_keys = endpoints.keys()
     tag_dict = dict()
     for t in tags:
         tag_dict[t["ID"]] = t
 
+    return endpoints, tag_dict
+
+
+def _apply_portainer_info(
+    edge_devices: List[EdgeDevice], endpoints: Dict, tag_dict: Dict
+) -> List[EdgeDevice]:
+    """
+    Adds the last heartbeat and tags from portainer to each device, if available.
+
+    Returns:
+        The edge devices whose last heartbeat changed and need to be persisted.
+    """
+    updated_edge_devices = []
+    endpoint_keys = endpoints.keys()
+
     for e in edge_devices:
         e.tags = []
 
@@ -59,22 +80,85 @@ def _update_portainer_info(edge_devices: List[EdgeDevice], db: Session):
             # set last heartbeat
             last_heartbeat = endpoint["LastCheckInDate"]
             if last_heartbeat != 0:
-                e.last_heartbeat = datetime.datetime.utcfromtimestamp(last_heartbeat)
-                sql_api.update_edge_device(db, e)
+                last_heartbeat = datetime.datetime.utcfromtimestamp(last_heartbeat)
+                if e.last_heartbeat != last_heartbeat:
+                    e.last_heartbeat = last_heartbeat
+                    updated_edge_devices.append(e)
 
             # set tags
             for tag_id in endpoint["TagIds"]:
                 e.tags.append(tag_dict[tag_id]["Name"])
 
+    return updated_edge_devices
+
+
+def _update_portainer_info(edge_devices: List[EdgeDevice], db: Session):
+    endpoints, tag_dict = _fetch_portainer_info()
+    for e in _apply_portainer_info(edge_devices, endpoints, tag_dict):
+        sql_api.update_edge_device(db, e)
+
+
+def _heartbeats(endpoints: Dict) -> Dict[str, datetime.datetime]:
+    return {
+        name: datetime.datetime.utcfromtimestamp(endpoint["LastCheckInDate"])
+        for name, endpoint in endpoints.items()
+        if endpoint["LastCheckInDate"] != 0
+    }
+
+
+def _portainer_fingerprint(endpoints: Dict, tag_dict: Dict) -> Dict:
+    # Heartbeat and tags are taken from portainer and are not (only) stored in the database.
+    return {
+        name: (
+            endpoint["LastCheckInDate"],
+            [tag_dict[tag_id]["Name"] for tag_id in endpoint["TagIds"]],
+        )
+        for name, endpoint in endpoints.items()
+    }
+
 
 @router.get("", response_model=List[EdgeDevice])
-def get_all_edge_devices(
-    skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
+async def get_all_edge_devices(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    descending: bool = False,
+    include_total: bool = False,
+    skip: int = 0,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    edge_devices = sql_api.get_edge_devices(db, skip=skip, limit=limit)
-    _update_portainer_info(edge_devices, db)
+    # The portainer client is synchronous and must not block the event loop.
+    endpoints, tag_dict = await run_in_threadpool(_fetch_portainer_info)
+    # Does not change the table versions, the heartbeats are covered by the Portainer
+    # fingerprint in the ETag instead. As devices check in every few seconds, a 304 is
+    # only returned if no device checked in since the client's previous request.
+    await sql_api.update_heartbeats_async(db, _heartbeats(endpoints))
+
+    async def load_page() -> Page:
+        page = await sql_api.get_edge_devices_async(
+            db,
+            cursor=cursor,
+            limit=limit,
+            descending=descending,
+            skip=skip,
+            with_total=include_total,
+        )
+        _apply_portainer_info(page.items, endpoints, tag_dict)
+        return page
 
-    return edge_devices
+    return await cached_list_response(
+        request,
+        db,
+        (
+            models.EdgeDevice.__tablename__,
+            models.ContainerDeployment.__tablename__,
+            models.ContainerImage.__tablename__,
+            models.PortBinding.__tablename__,
+        ),
+        EdgeDevice,
+        load_page,
+        etag_extra=_portainer_fingerprint(endpoints, tag_dict),
+    )
 
 
 @router.get("/{edge_device_id}", response_model=EdgeDevice)
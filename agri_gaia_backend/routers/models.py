@@ -24,8 +24,9 @@ from agri_gaia_backend.db import container_api as container_sql_api
 from agri_gaia_backend.db import model_api as sql_api
 from agri_gaia_backend.db import dataset_api as dataset_sql_api
 from agri_gaia_backend.db import models
+from agri_gaia_backend.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from agri_gaia_backend.routers import common
-from agri_gaia_backend.routers.common import check_exists, get_db
+from agri_gaia_backend.routers.common import check_exists, get_async_db, get_db
 from agri_gaia_backend.schemas.keycloak_user import KeycloakUser
 from agri_gaia_backend.schemas.model import Model, ModelPatch
 from agri_gaia_backend.services import minio_api
@@ -39,10 +40,20 @@ from agri_gaia_backend.services.graph.sparql_operations import (
 from agri_gaia_backend.services.graph.sparql_operations import util as sparql_util
 from agri_gaia_backend.services.minio_api import MINIO_ENDPOINT
 from agri_gaia_backend.services.model import model_metadata
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.datastructures import UploadFile
 from fastapi.param_functions import File
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import tritonclient.http as httpclient
 from tritonclient.utils import InferenceServerException, triton_to_np_dtype
@@ -72,8 +83,31 @@ async def startup():
 
 
 @router.get("", response_model=List[Model])
-def get_all_models(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return sql_api.get_models(db, skip=skip, limit=limit)
+async def get_all_models(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    order_by: str = "id",
+    descending: bool = False,
+    include_total: bool = False,
+    skip: int = 0,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await common.cached_list_response(
+        request,
+        db,
+        (models.Model.__tablename__,),
+        Model,
+        lambda: sql_api.get_models_async(
+            db,
+            cursor=cursor,
+            limit=limit,
+            order_by=order_by,
+            descending=descending,
+            skip=skip,
+            with_total=include_total,
+        ),
+    )
 
 
 @router.get("/keyword")
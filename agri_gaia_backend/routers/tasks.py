@@ -14,20 +14,33 @@ from typing import List, Optional
 from fastapi import (
     APIRouter,
     Depends,
+    Header,
     HTTPException,
     Query,
+    Request,
     Response,
     status,
 )
+from fastapi.responses import StreamingResponse
 
 from agri_gaia_backend.routers.common import (
+    TaskCreator,
+    cached_list_response,
     check_exists,
+    get_async_db,
     get_db,
 )
 from agri_gaia_backend.db import tasks_api
+from agri_gaia_backend.db.models import Task, TaskStatus
+from agri_gaia_backend.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from agri_gaia_backend import schemas
 from agri_gaia_backend.routers.paths import TASKS_ROOT_PATH
+from agri_gaia_backend.schemas.keycloak_user import KeycloakUser
+from agri_gaia_backend.services.tasks import events
+from agri_gaia_backend.services.tasks.cancellation import cancellation_registry
+from agri_gaia_backend.services.tasks.events import task_events
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import logging
 
@@ -38,32 +51,107 @@ router = APIRouter(prefix=TASKS_ROOT_PATH)
 
 @router.get("", response_model=List[schemas.Task])
 async def get_tasks(
+    request: Request,
     initiator: str = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    order_by: str = "id",
+    descending: bool = False,
+    include_total: bool = False,
     skip: int = 0,
-    limit: int = 100,
     id: Optional[List[int]] = Query(default=None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Fetches database for background tasks of the backend.
 
+    The list is paginated by cursor. If there are more tasks, the cursor of the next page
+    is returned in the X-Next-Cursor and Link headers. Supports conditional requests
+    with If-None-Match, so polling an unchanged list is answered with 304 Not Modified.
+
     Args:
-        skip: How many task entries shall be skipped. Defaults to 0.
-        limit: What is the maximum number of tasks to be fetched? defaults to 100.
-        db: Database Session. Created automatically.
+        initiator: Only fetch tasks of this initiator.
+        cursor: Cursor of the page to fetch. Defaults to the first page.
+        limit: What is the maximum number of tasks to be fetched? Defaults to 100.
+        order_by: Either "id" or "created". Defaults to "id".
+        descending: Order descending instead of ascending. Defaults to False.
+        include_total: Return the number of all matching tasks in the X-Total-Count header.
+        skip: How many task entries shall be skipped. Only kept for compatibility, use cursor instead.
+        id: Only fetch the tasks with these ids.
+        db: Async Database Session. Created automatically.
 
     Returns:
         A list of tasks
     """
-    if initiator:
-        return tasks_api.get_tasks_by_initiator(db, initiator, skip, limit)
-    return tasks_api.get_tasks(db, skip, limit, id)
+    return await cached_list_response(
+        request,
+        db,
+        (Task.__tablename__,),
+        schemas.Task,
+        lambda: tasks_api.get_tasks_async(
+            db,
+            cursor=cursor,
+            limit=limit,
+            ids=id,
+            initiator=initiator,
+            order_by=order_by,
+            descending=descending,
+            skip=skip,
+            with_total=include_total,
+        ),
+    )
+
+
+@router.get("/events")
+async def get_task_events(
+    request: Request,
+    task_id: Optional[int] = None,
+    last_event_id: Optional[str] = Header(default=None),
+):
+    """
+    Streams the events of the current user's tasks as Server-Sent Events.
 
+    Events are "created", "status", "progress" and "completed" (the task completed
+    or failed), each with the task as data. Clients reconnecting with the Last-Event-ID
+    header receive the events they missed. If these are no longer available, a
+    "resync" event is sent and the client has to fetch the tasks again.
 
-@router.get("/{task_id}", response_model=schemas.Task)
+    Args:
+        request: The request. Used to determine the user and to detect disconnects.
+        task_id: Only stream the events of this task.
+        last_event_id: Id of the last received event. Sent by EventSource on reconnect.
+
+    Returns:
+        A text/event-stream response.
+    """
+    user: KeycloakUser = request.user
+    subscription = task_events.subscribe(user.username, last_event_id)
+
+    async def event_stream():
+        try:
+            async for event in subscription:
+                if await request.is_disconnected():
+                    break
+                if event is None:
+                    yield ": keepalive\n\n"
+                elif task_id is None or event.task_id in (task_id, 0):
+                    yield event.to_sse()
+        finally:
+            await subscription.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{task_id}", response_model=schemas.TaskDetail)
 def get_task(task_id: int, db: Session = Depends(get_db)):
     """
-    Fetches the database for the task with the given task_id
+    Fetches the database for the task with the given task_id.
+    In addition to the list entries, it contains the durations and byte counts of the
+    task's phases (e.g. download, preprocess, infer, upload, db).
 
     Args:
         task_id: the id of the task that shall be fetched
@@ -75,6 +163,36 @@ def get_task(task_id: int, db: Session = Depends(get_db)):
     return check_exists(tasks_api.get_task(db, task_id))
 
 
+@router.post("/{task_id}/cancel", status_code=status.HTTP_202_ACCEPTED)
+def cancel_task(task_id: int, db: Session = Depends(get_db)):
+    """
+    Requests the cancellation of a waiting or running task.
+
+    Tasks stop cooperatively, e.g. when they report progress next, and release partial
+    results. The task then has the status "cancelled". Until then its status is "cancelling".
+
+    Args:
+        task_id: the id of the task that shall be cancelled
+        db: Database Session: Created automatically
+
+    Returns:
+        202 if the cancellation was requested, 409 if the task already finished
+    """
+    task = check_exists(tasks_api.get_task(db, task_id))
+    if task.status == TaskStatus.cancelling:
+        return Response(status_code=status.HTTP_202_ACCEPTED)
+    if not tasks_api.request_task_cancellation(db, task):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Task already {task.status.value}.",
+        )
+
+    # Tasks started by another worker process poll their status in the database.
+    cancellation_registry.cancel(task_id)
+    TaskCreator.publish(events.STATUS, task)
+    return Response(status_code=status.HTTP_202_ACCEPTED)
+
+
 @router.delete("/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_task(task_id: int, db: Session = Depends(get_db)):
     """
@@ -88,6 +206,8 @@ def delete_task(task_id: int, db: Session = Depends(get_db)):
         204 if success, 500 otherwise
     """
     task = check_exists(tasks_api.get_task(db, task_id))
+    # A deleted task must not keep running in the background.
+    cancellation_registry.cancel(task_id)
     success = tasks_api.delete_task(db, task)
     if not success:
         raise HTTPException(
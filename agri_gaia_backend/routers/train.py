@@ -45,6 +45,11 @@ from agri_gaia_backend.routers.models import persist_model, persist_model_artifa
 from agri_gaia_backend.schemas.keycloak_user import KeycloakUser
 from agri_gaia_backend.schemas.train_container import TrainContainer
 from agri_gaia_backend.services.docker import image_builder
+from agri_gaia_backend.services.docker.log_stream import (
+    LogStreamLimitError,
+    container_logs,
+)
+from agri_gaia_backend.services.tasks import scheduler
 from agri_gaia_backend.services.docker.client import host_client as docker_host_client
 from agri_gaia_backend.util.train import (
     get_config_filepath,
@@ -69,8 +74,18 @@ from agri_gaia_backend.util.train import (
     read_train_container_config,
 )
 from docker.types import DeviceRequest, Ulimit
-from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Form
+from fastapi import (
+    APIRouter,
+    Depends,
+    Form,
+    Header,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
 from fastapi.datastructures import UploadFile
+from fastapi.responses import StreamingResponse
 from fastapi.param_functions import File
 from sqlalchemy.orm import Session
 from jsonschema import validate
@@ -281,6 +296,7 @@ async def run_train_container(
     _, task_location_url, _ = task_creator.create_background_task(
         _run_train_container,
         task_title=f"Run Train Container #{train_container_id}.",
+        queue=scheduler.DOCKER,
         db=db,
         user=user,
         train_container_id=train_container_id,
@@ -365,6 +381,8 @@ def stop_train_container(
     _, task_location_url, _ = task_creator.create_background_task(
         _stop_train_container,
         task_title=f"Stop Train Container #{train_container_id}.",
+        queue=scheduler.DOCKER,
+        priority=scheduler.Priority.HIGH,
         db=db,
         train_container_id=train_container_id,
     )
@@ -526,6 +544,71 @@ def get_train_container_logs(
     return {"logs": logs}
 
 
+@router.get("/containers/{train_container_id}/logs/stream")
+async def stream_train_container_logs(
+    request: Request,
+    train_container_id: int,
+    since: Optional[float] = None,
+    tail: Optional[int] = 100,
+    follow: bool = True,
+    last_event_id: Optional[str] = Header(default=None),
+    db: Session = Depends(get_db),
+) -> StreamingResponse:
+    """
+    Streams the logs of a train container as Server-Sent Events, one event per line.
+
+    Unlike /logs, which returns the complete log on every call, the stream follows the
+    container output, so clients only receive new lines. The event id of a line is its
+    timestamp. Clients reconnecting with the Last-Event-ID header receive the lines after it.
+
+    Args:
+        train_container_id: The id of the train container.
+        since: Only lines after this unix timestamp.
+        tail: Only the last lines of the existing output. Defaults to 100, negative for all lines.
+        follow: Keep streaming new lines until the container stops. Defaults to True.
+        last_event_id: Timestamp of the last received line. Sent by EventSource on reconnect.
+        db: Database Session. Created automatically.
+
+    Returns:
+        A text/event-stream response.
+    """
+    train_container = check_exists(sql_api.get_train_container(db, train_container_id))
+    if train_container.container_id is None:
+        raise HTTPException(status_code=404, detail="No logs found.")
+    container = get_container(train_container.container_id)
+    # Do not hold a database connection for the lifetime of the stream.
+    db.close()
+
+    try:
+        lines = container_logs.stream(
+            container,
+            since=since,
+            tail="all" if tail is None or tail < 0 else tail,
+            follow=follow,
+            last_event_id=last_event_id,
+        )
+    except LogStreamLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def event_stream():
+        try:
+            async for line in lines:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n" if line is None else line.to_sse()
+        except LogStreamLimitError as e:
+            # Reached the limit after the capacity check, the response has started.
+            yield f"event: error\ndata: {e}\n\n"
+        finally:
+            await lines.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/containers/{train_container_id}/config")
 def get_train_container_config(
     train_container_id: int,
@@ -630,6 +713,8 @@ async def process_train_config(
     _, task_location_url, _ = task_creator.create_background_task(
         build_train_image,
         task_title=f"Train Container Buildjob: {architecture} ({provider})",
+        queue=scheduler.BUILD,
+        priority=scheduler.Priority.LOW,
         db=db,
         provider=provider,
         category=category,
@@ -9,20 +9,20 @@
 #
 # SPDX-License-Identifier: MIT
 
+from collections import deque
+from contextlib import closing
+from dataclasses import asdict
 from enum import Enum
-import json
 import logging
+import math
 from random import randbytes
-import time
 import traceback
 import numpy as np
-from io import BytesIO
-from PIL import Image
 from typing import List, Optional, Union, Tuple
 
 from agri_gaia_backend.db import model_api as sql_api
 from agri_gaia_backend.db import dataset_api as dataset_sql_api
-from agri_gaia_backend.db import tasks_api
+from agri_gaia_backend.db import triton_repository_api
 from agri_gaia_backend.routers.common import (
     TaskCreator,
     check_exists,
@@ -31,6 +31,41 @@ from agri_gaia_backend.routers.common import (
 )
 from agri_gaia_backend.schemas.keycloak_user import KeycloakUser
 from agri_gaia_backend.services import minio_api
+from agri_gaia_backend.services.inference import model_repository, result_cache
+from agri_gaia_backend.services.inference.autotune import autotune_batch_size
+from agri_gaia_backend.services.inference.postprocessing import (
+    BoxFormat,
+    PostprocessingConfig,
+    PostprocessingTask,
+    postprocess_outputs,
+)
+from agri_gaia_backend.services.inference.readiness import wait_until_ready
+from agri_gaia_backend.services.inference.result_cache import ResultCache
+from agri_gaia_backend.services.inference.results import (
+    ResultFormat,
+    open_result_sink,
+)
+from agri_gaia_backend.services.inference.triton_client import (
+    TRITON_SHARED_MEMORY,
+    SharedMemoryInputs,
+    TritonProtocol,
+    triton_clients,
+)
+from agri_gaia_backend.services.inference.pipeline import (
+    INFERENCE_MAX_INFLIGHT_REQUESTS,
+    Pipeline,
+    batch_images,
+    fetch_objects,
+    preprocess_images,
+    report_throughput,
+)
+from agri_gaia_backend.services.inference.preprocessing import (
+    preprocess_encoded_images,
+)
+from agri_gaia_backend.services.tasks import scheduler
+from agri_gaia_backend.services.tasks.cancellation import CancellationToken
+from agri_gaia_backend.services.tasks.phases import phase
+from agri_gaia_backend.services.tasks.processes import process_pool
 from agri_gaia_backend.services.edc.connector import (
     create_catalog_entry_model,
     delete_catalog_entry_model,
@@ -39,9 +74,8 @@ from fastapi import APIRouter, Depends, Form, HTTPException, Request, Response,
 from fastapi.param_functions import File
 from sqlalchemy.orm import Session
 
-import tritonclient.http as httpclient
 from tritonclient.grpc import model_config_pb2
-from tritonclient.utils import InferenceServerException, triton_to_np_dtype
+from tritonclient.utils import InferenceServerException
 import tritonclient.grpc.model_config_pb2 as mc
 from google.protobuf import json_format
 
@@ -73,7 +107,18 @@ def get_tritonInfo(
     request: Request,
     models: List[int],
     datasets: List[int],
-    url: Optional[str] = "triton:8000",
+    url: Optional[str] = None,
+    protocol: Optional[TritonProtocol] = None,
+    use_shared_memory: bool = TRITON_SHARED_MEMORY,
+    autotune: bool = False,
+    result_format: ResultFormat = ResultFormat.ndjson,
+    use_cache: bool = False,
+    postprocessing: PostprocessingTask = PostprocessingTask.raw,
+    top_k: int = 5,
+    score_threshold: float = 0.25,
+    iou_threshold: float = 0.45,
+    max_detections: int = 100,
+    box_format: BoxFormat = BoxFormat.xyxy,
     db: Session = Depends(get_db),
     task_creator: TaskCreator = Depends(get_task_creator),
 ) -> None:
@@ -87,136 +132,205 @@ def get_tritonInfo(
         models,
         datasets,
         url,
+        protocol,
+        use_shared_memory,
+        autotune,
+        result_format,
+        use_cache,
+        postprocessing: PostprocessingConfig,
+        task_id: int,
+        cancellation_token: CancellationToken,
     ) -> dict:
         try:
-            for model_id in models:
-                token = user.minio_token
-                model = check_exists(sql_api.get_model(db, model_id))
-                model_name = str(model_id)
-
-                # initialize Triton connection
-                # Triton Command:
-                # docker run --gpus=1 --rm -p6000:8000 -p6001:8001 -p6002:8002 -v/:/models nvcr.io/nvidia/tritonserver:23.09-py3 tritonserver --model-repository=s3://<platform_path>:9000/triton --model-control-mode=poll
-                try:
-                    triton_client = httpclient.InferenceServerClient(
-                        url=url, verbose=True
+            # initialize Triton connection, clients are reused across runs
+            # Triton Command:
+            # docker run --gpus=1 --rm -p6000:8000 -p6001:8001 -p6002:8002 -v/:/models nvcr.io/nvidia/tritonserver:23.09-py3 tritonserver --model-repository=s3://<platform_path>:9000/triton --model-control-mode=poll
+            with triton_clients.client(url, protocol) as triton_client:
+                uploaded_models = {}
+                for model_id in models:
+                    token = user.minio_token
+                    model = check_exists(sql_api.get_model(db, model_id))
+                    model_name = str(model_id)
+
+                    # download the model file
+                    # get all filenames in the model directory
+                    bucket_name = model.bucket_name
+                    _validate_parameters(bucket_name, token)
+                    model_prefix = f"models/{model.id}"
+                    model_filepath = f"{model_prefix}/{model.file_name}"
+                    model_objects = minio_api.get_all_objects(
+                        bucket_name, prefix=model_prefix, token=token
                     )
-                except Exception as e:
-                    raise RuntimeError("Context creation failed: " + str(e))
-
-                # download the model file
-                # get all filenames in the model directory
-                bucket_name = model.bucket_name
-                _validate_parameters(bucket_name, token)
-                model_prefix = f"models/{model.id}"
-                model_filepath = f"{model_prefix}/{model.file_name}"
-                model_objects = minio_api.get_all_objects(
-                    bucket_name, prefix=model_prefix, token=token
-                )
 
-                if not len(model_objects):
-                    raise HTTPException(
-                        status_code=404,
-                        detail=f"No model objects found in bucket '{model_prefix}'.",
+                    if not len(model_objects):
+                        raise HTTPException(
+                            status_code=404,
+                            detail=(
+                                f"No model objects found in bucket '{model_prefix}'."
+                            ),
+                        )
+
+                    # get the actual model file and upload it to the triton bucket
+                    _upload_model_files_to_triton(
+                        db,
+                        bucket_name,
+                        token,
+                        model_objects,
+                        model_filepath,
+                        model,
+                        model_name,
                     )
+                    uploaded_models[model_id] = model
 
-                # get the actual model file and upload it to the triton bucket
-                _upload_model_files_to_triton(
-                    bucket_name, token, model_objects, model_filepath, model, model_name
+                model_repository.evict_models(
+                    db, token, keep=[str(model_id) for model_id in uploaded_models]
                 )
 
-                try:
-                    retries = 0
-                    while not triton_client.is_model_ready(model_name=model_name):
-                        time.sleep(0.5)
-                        retries += 1
-                        if retries > 300:
-                            raise RuntimeError(
-                                "Triton failed to load the model in time."
-                            )
-
-                    model_metadata = triton_client.get_model_metadata(
-                        model_name=model_name
+                # Triton loads the uploaded models concurrently.
+                with phase("model_load"):
+                    wait_until_ready(
+                        triton_client,
+                        [str(model_id) for model_id in uploaded_models],
+                        cancellation_token=cancellation_token,
                     )
-                except InferenceServerException as e:
-                    raise RuntimeError("Failed to retrieve the metadata: " + str(e))
 
-                try:
-                    model_config = triton_client.get_model_config(model_name=model_name)
-                except InferenceServerException as e:
-                    raise RuntimeError("Failed to retrieve the config: " + str(e))
+                for model_id, model in uploaded_models.items():
+                    token = user.minio_token
+                    model_name = str(model_id)
 
-                model_metadata, model_config = convert_http_metadata_config(
-                    model_metadata, model_config
-                )
+                    try:
+                        model_metadata = triton_client.get_model_metadata(model_name)
+                    except InferenceServerException as e:
+                        raise RuntimeError("Failed to retrieve the metadata: " + str(e))
 
-                # retrieve necessary values for preprocessing from config and metadata
-                (
-                    max_batch_size,
-                    input_name,
-                    output_name,
-                    c,
-                    h,
-                    w,
-                    format,
-                    dtype,
-                ) = parse_model(model_metadata, model_config, model)
-
-                # download the dataset files
-                for dataset_id in datasets:
-                    image_data, filenames = _load_image_data(
-                        token, dtype, c, h, w, db, dataset_id, format
+                    try:
+                        model_config = triton_client.get_model_config(model_name)
+                    except InferenceServerException as e:
+                        raise RuntimeError("Failed to retrieve the config: " + str(e))
+
+                    model_metadata, model_config = convert_http_metadata_config(
+                        model_metadata, model_config
                     )
 
-                    # Send requests of FLAGS.batch_size images. If the number of
-                    # images isn't an exact multiple of FLAGS.batch_size then just
-                    # start over with the first images until the batch is filled.
-                    # currently not supporting streaming
-                    responses = []
-                    filenames.sort()
+                    # retrieve necessary values for preprocessing from config
+                    # and metadata
+                    (
+                        max_batch_size,
+                        input_name,
+                        output_names,
+                        c,
+                        h,
+                        w,
+                        format,
+                        dtype,
+                    ) = parse_model(model_metadata, model_config, model)
 
                     supports_batching = model_config.max_batch_size > 0
-                    batch_size = (
-                        1
-                        if model_config.max_batch_size == 0
-                        else model_config.max_batch_size
-                    )
-
-                    # Holds the handles to the ongoing HTTP async requests.
-                    async_requests = _infer_requests_async(
+                    batch_size = _get_batch_size(
+                        db,
                         triton_client,
-                        model_config,
-                        requestGenerator,
-                        image_data,
+                        model_name,
+                        model_config.max_batch_size,
+                        autotune,
+                        lambda: _load_sample_image(token, db, datasets),
                         input_name,
-                        output_name,
+                        output_names,
+                        format,
                         dtype,
-                        filenames,
-                        model,
-                        batch_size,
-                        supports_batching,
-                        model_name,
+                        c,
+                        h,
+                        w,
                     )
 
-                    # Collect results from the ongoing async requests
-                    # for HTTP Async requests.
-                    for async_request in async_requests:
-                        responses.append(async_request.get_result())
+                    cache = None
+                    entry = triton_repository_api.get_entry(db, model_name)
+                    if use_cache and entry is not None:
+                        cache = ResultCache(
+                            db,
+                            result_cache.model_hash(entry),
+                            result_cache.preprocessing_key(
+                                format, dtype, c, h, w, output_names
+                            ),
+                        )
+
+                    for dataset_id in datasets:
+                        cancellation_token.raise_if_cancelled()
+                        dataset_bucket, filenames, etags = _list_image_files(
+                            token, db, dataset_id
+                        )
 
-                    bucket = user.minio_bucket_name
+                        def infer(batches):
+                            return _infer_batches(
+                                triton_client,
+                                batches,
+                                input_name,
+                                output_names,
+                                dtype,
+                                model_name,
+                                use_shared_memory,
+                            )
 
-                    _collect_results_from_async_requests(
-                        responses,
-                        on_progress_change,
-                        output_name,
-                        batch_size,
-                        supports_batching,
-                        db,
-                        bucket,
-                        token,
-                        model_id,
-                        dataset_id,
-                    )
+                        # Download, preprocessing and inference overlap, at most a
+                        # bounded number of images and requests are held in memory.
+                        pipeline = Pipeline()
+                        object_name = (
+                            f"inference/{task_id}/Model{model_id}_Dataset{dataset_id}"
+                            f".{result_format.value}"
+                        )
+                        # The results of a cancelled run are incomplete.
+                        cancellation_token.add_cleanup(
+                            lambda object_name=object_name: minio_api.delete_object(
+                                user.minio_bucket_name, object_name, token
+                            )
+                        )
+                        with open_result_sink(
+                            result_format, user.minio_bucket_name, object_name, token
+                        ) as sink:
+                            # Only images without a cached output are sent to Triton.
+                            uncached = filenames
+                            if cache is not None:
+                                uncached = cache.write_cached(
+                                    sink,
+                                    filenames,
+                                    etags,
+                                    lambda outputs: postprocess_outputs(
+                                        outputs, postprocessing
+                                    ),
+                                )
+                            if not uncached:
+                                logger.info(
+                                    f"The outputs of model {model_id} for all images "
+                                    f"of dataset {dataset_id} were cached."
+                                )
+                                continue
+
+                            with closing(
+                                pipeline.run(
+                                    uncached,
+                                    fetch_objects(dataset_bucket, token),
+                                    preprocess_images(format, dtype, c, h, w),
+                                    batch_images(batch_size, supports_batching),
+                                    infer,
+                                )
+                            ) as responses:
+                                _collect_results_from_async_requests(
+                                    responses,
+                                    math.ceil(len(uncached) / batch_size),
+                                    on_progress_change,
+                                    output_names,
+                                    supports_batching,
+                                    postprocessing,
+                                    sink,
+                                    cache,
+                                    etags,
+                                )
+
+                        throughput = report_throughput(pipeline.stats, len(uncached))
+                        logger.info(
+                            f"Inference of model {model_id} on {len(uncached)} of "
+                            f"{len(filenames)} images of dataset {dataset_id}, "
+                            f"images per second by stage: {throughput}"
+                        )
         except Exception as e:
             traceback.print_exception(type(e), e, e.__traceback__)
             on_error(str(e))
@@ -224,11 +338,26 @@ def get_tritonInfo(
     _, task_location_url, _ = task_creator.create_background_task(
         func=_run_inference,
         task_title=f"Inference for Model(s) {models} and Dataset(s) {datasets}.",
+        queue=scheduler.CPU,
+        priority=scheduler.Priority.LOW,
         db=db,
         user=user,
         models=models,
         datasets=datasets,
         url=url,
+        protocol=protocol,
+        use_shared_memory=use_shared_memory,
+        autotune=autotune,
+        result_format=result_format,
+        use_cache=use_cache,
+        postprocessing=PostprocessingConfig(
+            task=postprocessing,
+            top_k=top_k,
+            score_threshold=score_threshold,
+            iou_threshold=iou_threshold,
+            max_detections=max_detections,
+            box_format=box_format,
+        ),
     )
 
     headers = {"Location": task_location_url}
@@ -236,254 +365,244 @@ def get_tritonInfo(
 
 
 def _upload_model_files_to_triton(
-    bucket_name, token, model_objects, model_filepath, model, model_name
+    db, bucket_name, token, model_objects, model_filepath, model, model_name
 ):
-    for item in model_objects:
-        # currently only handling single files
-        if not item.is_dir:
-            model_filepath == model_objects[0].object_name
-            file_bytes = minio_api.get_object(
-                bucket_name, object_name=model_filepath, token=token
-            ).read()
-
-            # only four filetypes available in triton
-            file_ending = model_filepath.split(".")[-1]
-            if file_ending in ["plan", "onnx", "pt", "graphdef"]:
-                # pt and graphdef need a special model config
-                if file_ending in ["pt", "graphdef"]:
-                    # check if all needed attributes for config exist
-                    if not all(
-                        getattr(model, attr) is not None
-                        for attr in [
-                            "input_datatype",
-                            "input_shape",
-                            "input_semantics",
-                            "input_name",
-                            "output_name",
-                            "output_datatype",
-                            "output_shape",
-                        ]
-                    ):
-                        raise RuntimeError(
-                            "For Models of the format .pt or .graphdef the input tensor info and output tensor info must be defined"
-                        )
-
-                    backend = (
-                        "pytorch" if file_ending == "pt" else "tensorflow_graphdef"
-                    )
-
-                    # create the actual config as protobuf
-                    config = {
-                        "platform": backend,
-                        "max_batch_size": 0,
-                        "input": [
-                            {
-                                "name": model.input_name,
-                                "data_type": Datatypes[
-                                    model.input_datatype.value
-                                ].value,
-                                "dims": model.input_shape,
-                                "format": "FORMAT_" + model.input_semantics.value,
-                            }
-                        ],
-                        "output": [
-                            {
-                                "name": model.output_name,
-                                "data_type": Datatypes[
-                                    model.output_datatype.value
-                                ].value,
-                                "dims": model.output_shape,
-                            }
-                        ],
-                    }
-
-                    cf = model_config_pb2.ModelConfig()
-                    cf = json_format.ParseDict(config, cf)
-                    logger.info(cf)
-
-                    # upload the config to the correct endpoint
-                    minio_api.upload_data(
-                        bucket="triton",
-                        prefix=model_name,
-                        token=token,
-                        objectname="config.pbtxt",
-                        data=bytes(cf),
-                    )
+    # currently only handling single files
+    if all(item.is_dir for item in model_objects):
+        return
+
+    # only four filetypes available in triton
+    file_ending = model_filepath.split(".")[-1]
+    if file_ending not in ["plan", "onnx", "pt", "graphdef"]:
+        raise RuntimeError(
+            "File ending " + file_ending + " is not supported by the triton backend"
+        )
 
-                    logger.info("build model config")
+    config = None
+    # pt and graphdef need a special model config
+    if file_ending in ["pt", "graphdef"]:
+        # check if all needed attributes for config exist
+        if not all(
+            getattr(model, attr) is not None
+            for attr in [
+                "input_datatype",
+                "input_shape",
+                "input_semantics",
+                "input_name",
+                "output_name",
+                "output_datatype",
+                "output_shape",
+            ]
+        ):
+            raise RuntimeError(
+                "For Models of the format .pt or .graphdef the input tensor info and output tensor info must be defined"
+            )
 
-                # upload the actual model file
-                minio_api.upload_data(
-                    bucket="triton",
-                    prefix=f"{model_name}/1",
-                    token=token,
-                    objectname=f"model.{file_ending}",
-                    data=file_bytes,
-                )
-            else:
-                raise RuntimeError(
-                    "File ending "
-                    + file_ending
-                    + " is not supported by the triton backend"
-                )
+        backend = "pytorch" if file_ending == "pt" else "tensorflow_graphdef"
+
+        # create the actual config as protobuf
+        config = {
+            "platform": backend,
+            "max_batch_size": 0,
+            "input": [
+                {
+                    "name": model.input_name,
+                    "data_type": Datatypes[model.input_datatype.value].value,
+                    "dims": model.input_shape,
+                    "format": "FORMAT_" + model.input_semantics.value,
+                }
+            ],
+            "output": [
+                {
+                    "name": model.output_name,
+                    "data_type": Datatypes[model.output_datatype.value].value,
+                    "dims": model.output_shape,
+                }
+            ],
+        }
+
+        cf = model_config_pb2.ModelConfig()
+        cf = json_format.ParseDict(config, cf)
+        logger.info(cf)
+        config = bytes(cf)
+
+    # The model file is only copied if it or its config changed since the last run.
+    copied = model_repository.sync_model(
+        db, token, bucket_name, model_filepath, model_name, file_ending, config
+    )
+    if not copied:
+        logger.info(f"Model {model_name} is up to date in the Triton repository.")
 
 
-def _infer_requests_async(
+def _infer_batches(
     triton_client,
-    model_config,
-    requestGenerator,
-    image_data,
+    batches,
     input_name,
-    output_name,
+    output_names,
     dtype,
-    filenames,
-    model,
-    batch_size,
-    supports_batching,
     model_name,
+    use_shared_memory=False,
+    max_inflight=INFERENCE_MAX_INFLIGHT_REQUESTS,
 ):
-    async_requests = []
-    sent_count = 0
-    image_idx = 0
-    last_request = False
-
-    while not last_request:
-        input_filenames = []
-        repeated_image_data = []
-
-        for idx in range(batch_size):
-            input_filenames.append(filenames[image_idx])
-            repeated_image_data.append(image_data[image_idx])
-            image_idx = (image_idx + 1) % len(image_data)
-            if image_idx == 0:
-                last_request = True
-
-        if supports_batching:
-            batched_image_data = np.stack(repeated_image_data, axis=0)
-        else:
-            batched_image_data = repeated_image_data[0]
-
-        # Send request
-        try:
+    """
+    Sends a request per batch and yields (request id, batch, result) in order. At most
+    max_inflight requests are sent but not yet collected.
+    """
+    shared_memory = (
+        SharedMemoryInputs(triton_client, max_inflight) if use_shared_memory else None
+    )
+    pending = deque()
+
+    def collect():
+        request_id, batch, request = pending.popleft()
+        with phase("infer"):
+            result = request.get_result()
+        return request_id, batch, result
+
+    try:
+        for request_id, batch in enumerate(batches, start=1):
+            if len(pending) >= max_inflight:
+                yield collect()
+
             for inputs, outputs in requestGenerator(
-                batched_image_data, input_name, output_name, dtype
+                triton_client,
+                batch.data,
+                input_name,
+                output_names,
+                dtype,
+                shared_memory,
+                request_id,
             ):
-                sent_count += 1
-                async_requests.append(
-                    triton_client.async_infer(
-                        model_name,
-                        inputs,
-                        request_id=str(sent_count),
-                        outputs=outputs,
+                pending.append(
+                    (
+                        request_id,
+                        batch,
+                        triton_client.async_infer(
+                            model_name, inputs, outputs, request_id=str(request_id)
+                        ),
                     )
                 )
-        except InferenceServerException as e:
-            print("inference failed: " + str(e))
-            return None
 
-    return async_requests
+        while pending:
+            yield collect()
+    finally:
+        if shared_memory is not None:
+            shared_memory.close()
 
 
-def _load_image_data(token, dtype, c, h, w, db, dataset_id, format):
-    image_data = []
-    dataset_files = {}
-    filenames = []
+def _get_batch_size(
+    db,
+    triton_client,
+    model_name,
+    max_batch_size,
+    autotune,
+    load_sample_image,
+    input_name,
+    output_names,
+    format,
+    dtype,
+    c,
+    h,
+    w,
+):
+    """
+    Returns the batch size of the run. With autotune, the batch sizes up to
+    max_batch_size are probed and the chosen one is recorded for the model.
+    Otherwise the recorded batch size is used, or max_batch_size if there is none.
+    """
+    if max_batch_size <= 1:
+        return 1
+
+    entry = triton_repository_api.get_entry(db, model_name)
+    if not autotune:
+        if entry is not None and entry.batch_size is not None:
+            return min(entry.batch_size, max_batch_size)
+        return max_batch_size
+
+    encoded_image = load_sample_image()
+    if encoded_image is None:
+        return max_batch_size
+    image = process_pool.run(
+        preprocess_encoded_images, [encoded_image], format, dtype, c, h, w
+    )[0]
+
+    def send(batch):
+        inputs, outputs = next(
+            requestGenerator(triton_client, batch, input_name, output_names, dtype)
+        )
+        return triton_client.async_infer(
+            model_name, inputs, outputs, request_id="autotune"
+        )
 
-    dataset = check_exists(dataset_sql_api.get_dataset(db, dataset_id))
-    bucket_name = dataset.bucket_name
-    dataset_prefix = f"datasets/{dataset.id}"
+    with phase("autotune"):
+        batch_size, probes = autotune_batch_size(
+            send,
+            image,
+            max_batch_size,
+            max_inflight=INFERENCE_MAX_INFLIGHT_REQUESTS,
+        )
+    if entry is not None:
+        triton_repository_api.set_batch_size(
+            db, entry, batch_size, [asdict(probe) for probe in probes]
+        )
+    return batch_size
 
-    for item in minio_api.get_all_objects(
-        bucket_name, prefix=dataset_prefix, token=token
-    ):
-        if item.is_dir is False and "annotations" not in item.object_name:
-            dataset_files[item.object_name] = minio_api.get_object(
-                bucket=bucket_name,
-                token=token,
-                object_name=item.object_name,
-            ).read()
 
-            filenames.append(item.object_name)
-            img = Image.open(BytesIO(dataset_files[item.object_name]))
-            image_data.append(preprocess(img, format, dtype, c, h, w))
+def _load_sample_image(token, db, datasets):
+    # The first image of the run, used to probe batch sizes.
+    for dataset_id in datasets:
+        dataset_bucket, filenames, _ = _list_image_files(token, db, dataset_id)
+        if filenames:
+            with phase("download") as download:
+                data = minio_api.get_object(
+                    bucket=dataset_bucket, token=token, object_name=filenames[0]
+                ).read()
+                download.add_bytes(len(data))
+            return data
+    return None
 
-    return image_data, filenames
+
+def _list_image_files(token, db, dataset_id):
+    dataset = check_exists(dataset_sql_api.get_dataset(db, dataset_id))
+    dataset_prefix = f"datasets/{dataset.id}"
+
+    etags = {
+        item.object_name: item.etag
+        for item in minio_api.get_all_objects(
+            dataset.bucket_name, prefix=dataset_prefix, token=token
+        )
+        if item.is_dir is False and "annotations" not in item.object_name
+    }
+    return dataset.bucket_name, sorted(etags), etags
 
 
 def _collect_results_from_async_requests(
     responses,
+    num_requests,
     on_progress_change,
-    output_name,
-    batch_size,
+    output_names,
     supports_batching,
-    db,
-    bucket,
-    token,
-    model_id,
-    dataset_id,
+    postprocessing,
+    sink,
+    cache=None,
+    etags=None,
 ):
-    results = {}
-
-    for response in responses:
-        this_id = response.get_response()["id"]
-        print("Request {}, batch size {}".format(this_id, batch_size))
-        results[this_id] = postprocess(
-            response, output_name, batch_size, supports_batching
-        )
-        on_progress_change(int(this_id) / len(results))
-
-    logger.info("PASS")
-    logger.info(results)
-
-    tasks = tasks_api.get_tasks(db)
-    tasks.sort(key=lambda x: x.id)
-    logger.info(tasks)
-
-    minio_api.upload_data(
-        bucket,
-        prefix="inference/" + str(tasks[-1].id),
-        token=token,
-        data=json.dumps(results).encode("utf-8"),
-        objectname="Model" + str(model_id) + "_Dataset" + str(dataset_id) + ".json",
-    )
-
-
-def preprocess(img, format, dtype, c, h, w):
     """
-    Pre-process an image to meet the size, type and format
-    requirements specified by the parameters.
+    Writes the results of every batch to the sink as soon as its request completed,
+    and stores them in the cache if given.
     """
-    # np.set_printoptions(threshold='nan')
-
-    if c == 1:
-        sample_img = img.convert("L")
-    else:
-        sample_img = img.convert("RGB")
-
-    resized_img = sample_img.resize((w, h), Image.BILINEAR)
-    resized = np.array(resized_img)
-    if resized.ndim == 2:
-        resized = resized[:, :, np.newaxis]
-
-    npdtype = triton_to_np_dtype(dtype)
-    typed = resized.astype(npdtype)
-
-    scaled = typed
-
-    # Swap to CHW if necessary
-    if format == "NCHW":
-        ordered = np.transpose(scaled, (2, 0, 1))
-    else:
-        ordered = scaled
-
-    # workaround for batchsize 0
-    if len(ordered) == 3:
-        ordered = np.expand_dims(ordered, axis=0)
-
-    # Channels are in RGB order. Currently model configuration data
-    # doesn't provide any information as to other channel orderings
-    # (like BGR) so we just assume RGB.
-    return ordered
+    for completed, (request_id, batch, response) in enumerate(responses, start=1):
+        logger.debug(f"Request {request_id}, batch size {len(batch.filenames)}")
+        with phase("postprocess"):
+            outputs = postprocess(response, output_names, supports_batching)
+            results = postprocess_outputs(outputs, postprocessing)
+        with phase("upload") as upload:
+            written = sink.bytes_written
+            sink.write(batch.filenames, results)
+            upload.add_bytes(sink.bytes_written - written)
+        if cache is not None:
+            cache.store([etags[filename] for filename in batch.filenames], outputs)
+        on_progress_change(completed / num_requests)
 
 
 def convert_http_metadata_config(_metadata, _config):
@@ -506,15 +625,13 @@ def convert_http_metadata_config(_metadata, _config):
 def parse_model(model_metadata, model_config, model):
     """
     Check the configuration of a model to make sure it meets the
-    requirements for an image classification network (as expected by
-    this client)
+    requirements for an image model (as expected by this client).
+    All outputs of the model are requested, see postprocessing.py.
     """
     if len(model_metadata.inputs) != 1:
         raise Exception("expecting 1 input, got {}".format(len(model_metadata.inputs)))
-    if len(model_metadata.outputs) != 1:
-        raise Exception(
-            "expecting 1 output, got {}".format(len(model_metadata.outputs))
-        )
+    if not model_metadata.outputs:
+        raise Exception("expecting at least 1 output, got 0")
 
     if len(model_config.input) != 1:
         raise Exception(
@@ -525,30 +642,6 @@ def parse_model(model_metadata, model_config, model):
 
     input_metadata = model_metadata.inputs[0]
     input_config = model_config.input[0]
-    output_metadata = model_metadata.outputs[0]
-
-    if output_metadata.datatype != "FP32":
-        raise Exception(
-            "expecting output datatype to be FP32, model '"
-            + model_metadata.name
-            + "' output type is "
-            + output_metadata.datatype
-        )
-
-    # Output is expected to be a vector. But allow any number of
-    # dimensions as long as all but 1 is size 1 (e.g. { 10 }, { 1, 10
-    # }, { 10, 1, 1 } are all ok). Ignore the batch dimension if there
-    # is one.
-    output_batch_dim = model_config.max_batch_size > 0
-    non_one_cnt = 0
-    for dim in output_metadata.shape:
-        if output_batch_dim:
-            output_batch_dim = False
-        elif dim > 1:
-            non_one_cnt += 1
-            if non_one_cnt > 1:
-                raise Exception("expecting model output to be a vector")
-
     # Model input must have 3 dims, either CHW or HWC (not counting
     # the batch dimension), either CHW or HWC
     # currently handling the additional entry in shape metadata hardcoded
@@ -589,7 +682,7 @@ def parse_model(model_metadata, model_config, model):
     return (
         model_config.max_batch_size,
         input_metadata.name,
-        output_metadata.name,
+        [output.name for output in model_metadata.outputs],
         c,
         h,
         w,
@@ -598,24 +691,38 @@ def parse_model(model_metadata, model_config, model):
     )
 
 
-def postprocess(results, output_name, batch_size, supports_batching):
+def postprocess(results, output_names, supports_batching):
     """
-    Post-process results to show classifications.
+    Returns all outputs of the model by name, with one entry per image of the batch.
     """
+    outputs = {}
+    for name in output_names:
+        outputs[name] = results.as_numpy(name)
+        if not supports_batching:
+            # The request held a single image without batch dimension.
+            outputs[name] = outputs[name][np.newaxis]
+    return outputs
 
-    output_array = results.as_numpy(output_name)[0].tolist()
-
-    return output_array
 
-
-def requestGenerator(batched_image_data, input_name, output_name, dtype):
-    client = httpclient
+def requestGenerator(
+    triton_client,
+    batched_image_data,
+    input_name,
+    output_names,
+    dtype,
+    shared_memory=None,
+    request_id=0,
+):
+    client = triton_client.module
 
     # Set the input data
     inputs = [client.InferInput(input_name, batched_image_data.shape, dtype)]
-    inputs[0].set_data_from_numpy(batched_image_data)
+    if shared_memory is None:
+        inputs[0].set_data_from_numpy(batched_image_data)
+    else:
+        shared_memory.set_input(inputs[0], request_id, batched_image_data)
 
-    outputs = [client.InferRequestedOutput(output_name)]
+    outputs = [client.InferRequestedOutput(name) for name in output_names]
 
     yield inputs, outputs
 
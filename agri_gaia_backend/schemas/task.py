@@ -10,7 +10,7 @@
 # SPDX-License-Identifier: MIT
 
 import datetime
-from typing import Optional
+from typing import Dict, Optional
 from pydantic import BaseModel
 from agri_gaia_backend.db.models import TaskStatus
 
@@ -26,3 +26,13 @@ class Task(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class TaskPhase(BaseModel):
+    seconds: float
+    bytes: int
+    count: int
+
+
+class TaskDetail(Task):
+    phases: Optional[Dict[str, TaskPhase]]
@@ -19,6 +19,7 @@ from typing import Dict, Union
 
 import requests
 from agri_gaia_backend.util.common import is_json_response
+from agri_gaia_backend.util.server_timing import CVAT, downstream
 
 logger = logging.getLogger("api-logger")
 
@@ -41,6 +42,7 @@ class CvatAuth:
         yield "sessionid", self.sessionid
 
 
+@downstream(CVAT)
 class CvatClient:
     def __init__(
         self, protocol: str, host: str, port: int = None, verify_ssl: bool = True
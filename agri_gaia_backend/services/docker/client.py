@@ -16,6 +16,7 @@ import json
 from tenacity import after_log, retry, stop_after_attempt, wait_fixed
 from python_on_whales.docker_client import DockerClient
 from agri_gaia_backend.util.auth import service_account
+from agri_gaia_backend.util.server_timing import DOCKER, instrument_session
 
 import logging
 
@@ -107,6 +108,7 @@ def _create_api_client():
 
 build_container_client = _create_whales_client()
 
-registry_client = _create_api_client()
+registry_client = instrument_session(_create_api_client(), DOCKER)
 
 host_client = docker.from_env()
+instrument_session(host_client.api, DOCKER)
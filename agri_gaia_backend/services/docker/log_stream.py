@@ -0,0 +1,218 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import calendar
+import functools
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple, Union
+
+from docker.models.containers import Container
+from prometheus_client import Gauge
+
+from agri_gaia_backend.util.env import int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Every followed log stream blocks a thread while waiting for new output.
+CONTAINER_LOG_STREAMS_MAX = int_from_env("CONTAINER_LOG_STREAMS_MAX", 32)
+
+CONTAINER_LOG_STREAMS = Gauge(
+    "agri_gaia_container_log_streams",
+    "Container log streams currently followed by clients.",
+)
+
+
+class LogStreamLimitError(Exception):
+    pass
+
+
+@dataclass
+class LogLine:
+    # RFC3339 timestamp with nanoseconds, as reported by docker.
+    timestamp: str
+    text: str
+
+    def to_sse(self) -> str:
+        # The timestamp is the event id, so clients resume after the last received line.
+        return f"id: {self.timestamp}\ndata: {self.text}\n\n"
+
+
+def parse_timestamp(timestamp: str) -> Tuple[int, int]:
+    """
+    Parses a docker log timestamp, e.g. "2024-05-02T10:21:04.123456789Z".
+
+    Returns:
+        The unix time in seconds and the nanoseconds, comparable as a tuple.
+
+    Raises:
+        ValueError: If the timestamp is invalid.
+    """
+    seconds, _, fraction = timestamp.rstrip("Z").partition(".")
+    parsed = time.strptime(seconds, "%Y-%m-%dT%H:%M:%S")
+    nanos = int(fraction[:9].ljust(9, "0")) if fraction else 0
+    return calendar.timegm(parsed), nanos
+
+
+def _split_lines(chunks: Iterator[bytes]) -> Iterator[LogLine]:
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _to_log_line(line)
+    if buffer:
+        yield _to_log_line(buffer)
+
+
+def _to_log_line(line: bytes) -> LogLine:
+    timestamp, _, text = line.decode("utf-8", errors="replace").partition(" ")
+    # Progress bars rewrite the line with carriage returns, a terminal only shows the last
+    # segment. Carriage returns would also end the line in an event stream.
+    segments = [s for s in text.split("\r") if s]
+    return LogLine(timestamp, segments[-1] if segments else "")
+
+
+class ContainerLogStreamer:
+    """
+    Follows container logs for clients without blocking the event loop.
+
+    The docker log stream is read in a dedicated thread pool, since reads block until the
+    container writes new output. At most max_streams streams are followed at once.
+    """
+
+    def __init__(self, max_streams: int = CONTAINER_LOG_STREAMS_MAX) -> None:
+        self.max_streams = max_streams
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_streams, thread_name_prefix="container-logs"
+        )
+        self._lock = threading.Lock()
+        self._streams = 0
+
+    def _check_capacity(self) -> None:
+        if self._streams >= self.max_streams:
+            raise LogStreamLimitError(
+                "Too many container log streams. Try again later."
+            )
+
+    def _acquire(self) -> None:
+        with self._lock:
+            self._check_capacity()
+            self._streams += 1
+        CONTAINER_LOG_STREAMS.inc()
+
+    def _release(self) -> None:
+        with self._lock:
+            self._streams -= 1
+        CONTAINER_LOG_STREAMS.dec()
+
+    def stream(
+        self,
+        container: Container,
+        since: Optional[Union[int, float]] = None,
+        tail: Union[int, str] = "all",
+        follow: bool = True,
+        last_event_id: Optional[str] = None,
+        keepalive: float = 15.0,
+    ) -> AsyncIterator[Optional[LogLine]]:
+        """
+        Yields the log lines of the container. Yields None if there was no output for
+        keepalive seconds, so that the caller can send a keepalive.
+
+        The stream slot is taken and the docker log stream opened on the first iteration
+        and both are released when the iteration ends, so nothing leaks if the returned
+        iterator is never iterated, e.g. because the client disconnected before.
+
+        Args:
+            container: The container.
+            since: Only lines after this unix timestamp.
+            tail: Only the last lines of the existing output, "all" for all lines.
+            follow: Keep yielding new output until the container stops.
+            last_event_id: Timestamp of the last line the client received. Overrides
+                           since and tail, only newer lines are yielded.
+            keepalive: Seconds after which None is yielded.
+
+        Raises:
+            LogStreamLimitError: If too many streams are followed already. Raised
+                                 by the first iteration if the limit was reached since.
+        """
+        after = None
+        if last_event_id:
+            try:
+                after = parse_timestamp(last_event_id)
+                since, tail = after[0], "all"
+            except ValueError:
+                logger.warning(f"Ignoring invalid log event id '{last_event_id}'.")
+
+        # Fail early, before the caller starts a response.
+        self._check_capacity()
+        return self._follow(
+            functools.partial(
+                container.logs,
+                stream=True,
+                follow=follow,
+                timestamps=True,
+                since=since,
+                tail=tail,
+            ),
+            after,
+            keepalive,
+        )
+
+    async def _follow(
+        self,
+        open_logs: Callable[[], Iterator[bytes]],
+        after: Optional[Tuple[int, int]],
+        keepalive: float,
+    ) -> AsyncIterator[Optional[LogLine]]:
+        loop = asyncio.get_running_loop()
+        self._acquire()
+        chunks = None
+        pending = None
+        try:
+            chunks = await loop.run_in_executor(self._executor, open_logs)
+            lines = _split_lines(chunks)
+            while True:
+                if pending is None:
+                    pending = loop.run_in_executor(self._executor, next, lines, None)
+                try:
+                    line = await asyncio.wait_for(asyncio.shield(pending), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                pending = None
+
+                if line is None:
+                    return
+                if after is not None:
+                    # since has a resolution of seconds, skip what the client already has.
+                    try:
+                        if parse_timestamp(line.timestamp) <= after:
+                            continue
+                    except ValueError:
+                        pass
+                    after = None
+                yield line
+        finally:
+            # Unblocks the thread waiting for output, if the client disconnected.
+            if chunks is not None:
+                chunks.close()
+            if pending is not None:
+                pending.cancel()
+            self._release()
+
+
+container_logs = ContainerLogStreamer()
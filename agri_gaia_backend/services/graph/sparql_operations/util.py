@@ -20,6 +20,8 @@ from base64 import b64encode
 import logging
 import json
 
+from agri_gaia_backend.util.server_timing import FUSEKI, downstream
+
 FUSEKI_ADMIN_USER = os.environ.get("FUSEKI_ADMIN_USER")
 FUSEKI_ADMIN_PASSWORD = os.environ.get("FUSEKI_ADMIN_PASSWORD")
 
@@ -141,6 +143,7 @@ def query_attributes_for_class(class_name):
     return send_query(ONTOLOGIES_QUERY_ENDPOINT, query)
 
 
+@downstream(FUSEKI)
 def send_update(endpoint, update):
     return requests.post(
         endpoint,
@@ -221,6 +224,7 @@ def get_metadata_information_for_uris(uris: List[str]):
 #
 # endpoint: the fuseki query endpoint
 # query:    the query, to be executed
+@downstream(FUSEKI)
 def send_query(endpoint, query: str):
     response = requests.post(
         endpoint,
@@ -234,6 +238,7 @@ def send_query(endpoint, query: str):
     return result
 
 
+@downstream(FUSEKI)
 def send_graph_query(endpoint, query):
     response = requests.post(
         endpoint,
@@ -249,6 +254,7 @@ def send_graph_query(endpoint, query):
     return json.loads(response.content.decode("utf8").replace("'", '"'))
 
 
+@downstream(FUSEKI)
 def store_graph(graph, fuseki_dataset: str = "ds"):
     """
     Stores a graph to the triple store located using the given endpoint.
@@ -267,6 +273,7 @@ def store_graph(graph, fuseki_dataset: str = "ds"):
     )
 
 
+@downstream(FUSEKI)
 def store_json(metadata, fuseki_dataset: str = "ds"):
     """
     Stores metadata to the triple store located using the given endpoint.
@@ -289,12 +296,14 @@ def get_shapes():
     return _get_graph(SHAPES_ENDPOINT_GET)
 
 
+@downstream(FUSEKI)
 def delete_graph(graphname):
     return requests.delete(
         FUSEKI_ENDPOINT + "$/datasets/" + graphname, headers=_create_auth_header()
     )
 
 
+@downstream(FUSEKI)
 def createFusekiDataset(object_name):
     f = open(os.path.join("fuseki", "dataset_create.ttl"))
     assembler = f.read()
@@ -308,6 +317,7 @@ def createFusekiDataset(object_name):
     return response
 
 
+@downstream(FUSEKI)
 def shacl_validate(dataset_name, shape):
     return requests.post(
         FUSEKI_ENDPOINT + dataset_name + "/shacl?graph=default",
@@ -551,6 +561,7 @@ def _get_concept_of_keyword(endpoint: str, keyword: str, language: str):
     return concept, language
 
 
+@downstream(FUSEKI)
 def _get_graph(endpoint):
     resp = requests.get(
         endpoint,
@@ -0,0 +1,124 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import logging
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from agri_gaia_backend.util.env import float_from_env, int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Timed requests per probed batch size, after one warm-up request.
+TRITON_AUTOTUNE_REQUESTS = int_from_env("TRITON_AUTOTUNE_REQUESTS", 8)
+# The smallest batch size within this fraction of the best throughput is chosen,
+# since smaller batches have a lower latency and need less memory.
+TRITON_AUTOTUNE_TOLERANCE = float_from_env("TRITON_AUTOTUNE_TOLERANCE", 0.05)
+
+
+@dataclass
+class BatchSizeProbe:
+    batch_size: int
+    images_per_second: float
+    p50_latency_ms: float
+
+
+def candidate_batch_sizes(max_batch_size: int) -> List[int]:
+    """
+    Returns:
+        The powers of two below max_batch_size and max_batch_size itself.
+    """
+    sizes = []
+    size = 1
+    while size < max_batch_size:
+        sizes.append(size)
+        size *= 2
+    return sizes + [max_batch_size]
+
+
+def probe_batch_size(
+    send: Callable[[np.ndarray], object],
+    image: np.ndarray,
+    batch_size: int,
+    requests: int = TRITON_AUTOTUNE_REQUESTS,
+    max_inflight: int = 1,
+    clock: Callable[[], float] = time.perf_counter,
+) -> BatchSizeProbe:
+    """
+    Measures throughput and latency of batches of the given size, with up to
+    max_inflight requests in flight like during the inference.
+
+    Args:
+        send: Sends a batch and returns a handle whose get_result() waits for the result.
+        image: A preprocessed image, the batches consist of copies of it.
+        batch_size: The batch size to probe.
+        requests: Number of timed requests.
+        max_inflight: Requests sent but not yet collected.
+    """
+    batch = np.repeat(image[np.newaxis], batch_size, axis=0)
+    # The first request may include lazy initialization on the server.
+    send(batch).get_result()
+
+    latencies = []
+    pending = deque()
+    start = clock()
+    for _ in range(requests):
+        if len(pending) >= max_inflight:
+            sent, request = pending.popleft()
+            request.get_result()
+            latencies.append(clock() - sent)
+        pending.append((clock(), send(batch)))
+    while pending:
+        sent, request = pending.popleft()
+        request.get_result()
+        latencies.append(clock() - sent)
+    elapsed = clock() - start
+
+    return BatchSizeProbe(
+        batch_size=batch_size,
+        images_per_second=round(batch_size * requests / elapsed, 2),
+        p50_latency_ms=round(sorted(latencies)[len(latencies) // 2] * 1000, 3),
+    )
+
+
+def autotune_batch_size(
+    send: Callable[[np.ndarray], object],
+    image: np.ndarray,
+    max_batch_size: int,
+    tolerance: float = TRITON_AUTOTUNE_TOLERANCE,
+    **kwargs,
+) -> Tuple[int, List[BatchSizeProbe]]:
+    """
+    Probes the candidate batch sizes up to max_batch_size, see probe_batch_size for
+    the keyword arguments.
+
+    Returns:
+        The smallest batch size with a throughput within tolerance of the best one,
+        and the probes of all batch sizes.
+    """
+    probes = [
+        probe_batch_size(send, image, batch_size, **kwargs)
+        for batch_size in candidate_batch_sizes(max_batch_size)
+    ]
+    best = max(probe.images_per_second for probe in probes)
+    chosen = next(
+        probe for probe in probes if probe.images_per_second >= (1 - tolerance) * best
+    )
+    logger.info(
+        f"Chose batch size {chosen.batch_size} with {chosen.images_per_second} "
+        f"images/s, probes: {probes}"
+    )
+    return chosen.batch_size, probes
@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Sync of models into the triton bucket, the model repository Triton polls.
+# A manifest in the database (db/triton_repository_api.py) records the content hash
+# of every synced model, so unchanged models are not copied again.
+#
+# The content hash is the ETag of the model object in MinIO, which avoids downloading
+# the model to hash it. For objects uploaded in multiple parts the ETag depends on the
+# part size, not only the content. Uploading the same model again with another part
+# size therefore counts as a change: the model is copied again and its cached outputs
+# are dropped. A stale model is never kept, only the copy is repeated.
+
+import hashlib
+import logging
+import datetime
+
+from typing import Iterable, List, Optional
+
+from prometheus_client import Counter
+from sqlalchemy.orm import Session
+
+from agri_gaia_backend.db import inference_results_api, triton_repository_api
+from agri_gaia_backend.services import minio_api
+from agri_gaia_backend.services.inference import result_cache
+from agri_gaia_backend.services.tasks.phases import phase
+from agri_gaia_backend.util.env import float_from_env, int_from_env
+
+logger = logging.getLogger("api-logger")
+
+TRITON_BUCKET = "triton"
+
+# Least recently used models are removed from the repository above this size.
+TRITON_REPOSITORY_MAX_BYTES = int_from_env("TRITON_REPOSITORY_MAX_BYTES", 20 * 2**30)
+# Models used more recently are not evicted, a running inference may use them.
+TRITON_REPOSITORY_EVICTION_GRACE = float_from_env(
+    "TRITON_REPOSITORY_EVICTION_GRACE", 3600
+)
+
+TRITON_REPOSITORY_SYNCS = Counter(
+    "agri_gaia_triton_repository_syncs_total",
+    "Models synced into the Triton model repository, by whether they were copied.",
+    labelnames=("result",),
+)
+TRITON_REPOSITORY_EVICTIONS = Counter(
+    "agri_gaia_triton_repository_evictions_total",
+    "Models removed from the Triton model repository to stay within its budget.",
+)
+
+
+def _hash_config(config: Optional[bytes]) -> Optional[str]:
+    return hashlib.sha256(config).hexdigest() if config is not None else None
+
+
+def sync_model(
+    db: Session,
+    token,
+    source_bucket: str,
+    source_object: str,
+    model_name: str,
+    file_ending: str,
+    config: Optional[bytes] = None,
+) -> bool:
+    """
+    Makes sure the triton bucket holds the model file and config of the model.
+    Does nothing if both are unchanged since the last sync. Otherwise the model file
+    is copied on the server, it is neither downloaded nor uploaded.
+
+    Args:
+        db: The database session.
+        token: MinIO token with access to the source bucket and the triton bucket.
+        source_bucket: The bucket of the model file.
+        source_object: The object name of the model file.
+        model_name: The name of the model in Triton.
+        file_ending: The ending of the model file, e.g. "onnx".
+        config: The config.pbtxt, None if Triton derives the config itself.
+
+    Returns:
+        Whether the model was copied.
+    """
+    source = minio_api.stat_object(source_bucket, source_object, token)
+    config_hash = _hash_config(config)
+    object_name = f"{model_name}/1/model.{file_ending}"
+
+    entry = triton_repository_api.get_entry(db, model_name)
+    if (
+        entry is not None
+        and entry.content_hash == source.etag
+        and entry.config_hash == config_hash
+        and entry.object_name == object_name
+        # The repository may have been cleaned up manually.
+        and minio_api.exists(TRITON_BUCKET, object_name, token)
+    ):
+        triton_repository_api.touch_entry(db, entry)
+        TRITON_REPOSITORY_SYNCS.labels(result="unchanged").inc()
+        return False
+
+    if entry is not None and (
+        entry.content_hash != source.etag or entry.config_hash != config_hash
+    ):
+        # Outputs of the previous version are not used anymore.
+        inference_results_api.delete_outputs(db, result_cache.model_hash(entry))
+    # Removes files of the previous version, e.g. a model file with another ending.
+    minio_api.delete_all_objects(TRITON_BUCKET, model_name, token)
+    if config is not None:
+        minio_api.upload_data(
+            bucket=TRITON_BUCKET,
+            prefix=model_name,
+            token=token,
+            objectname="config.pbtxt",
+            data=config,
+        )
+    with phase("upload") as upload:
+        minio_api.copy_object(
+            TRITON_BUCKET, object_name, source_bucket, source_object, token
+        )
+        upload.add_bytes(source.size)
+
+    triton_repository_api.save_entry(
+        db, model_name, source.etag, config_hash, object_name, source.size
+    )
+    TRITON_REPOSITORY_SYNCS.labels(result="copied").inc()
+    return True
+
+
+def evict_models(
+    db: Session,
+    token,
+    keep: Iterable[str] = (),
+    max_bytes: int = TRITON_REPOSITORY_MAX_BYTES,
+    grace: float = TRITON_REPOSITORY_EVICTION_GRACE,
+) -> List[str]:
+    """
+    Removes the least recently used models from the triton bucket until the
+    repository is within max_bytes. Triton unloads removed models on its next poll.
+
+    Args:
+        db: The database session.
+        token: MinIO token with access to the triton bucket.
+        keep: Names of models which must not be removed, e.g. those of the current run.
+        max_bytes: The budget of the repository.
+        grace: Models used within these seconds are not removed.
+
+    Returns:
+        The names of the removed models.
+    """
+    total = triton_repository_api.get_total_size(db)
+    if total <= max_bytes:
+        return []
+
+    keep = set(keep)
+    used_after = datetime.datetime.now() - datetime.timedelta(seconds=grace)
+    evicted = []
+    for entry in triton_repository_api.get_entries_by_last_used(db):
+        if total <= max_bytes or entry.last_used > used_after:
+            break
+        if entry.model_name in keep:
+            continue
+        try:
+            minio_api.delete_all_objects(TRITON_BUCKET, entry.model_name, token)
+        except Exception as e:
+            logger.warning(f"Evicting model {entry.model_name} failed: {e}")
+            continue
+        total -= entry.size
+        evicted.append(entry.model_name)
+        triton_repository_api.delete_entry(db, entry)
+        TRITON_REPOSITORY_EVICTIONS.inc()
+
+    if evicted:
+        logger.info(f"Evicted models {evicted} from the Triton model repository.")
+    if total > max_bytes:
+        logger.warning(
+            f"The Triton model repository holds {total} bytes, more than its budget "
+            f"of {max_bytes} bytes, but the remaining models are in use."
+        )
+    return evicted
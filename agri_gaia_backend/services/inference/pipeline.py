@@ -0,0 +1,361 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Streaming inference pipeline: fetch -> preprocess -> batch -> infer -> sink.
+# Every stage is a generator consuming the items of the previous stage. The stages run
+# concurrently and are connected by bounded queues, so download, preprocessing and
+# inference overlap and the memory used does not grow with the size of the dataset.
+
+import time
+import queue
+import logging
+import itertools
+import threading
+import contextvars
+
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Summary
+
+from agri_gaia_backend.services import minio_api
+from agri_gaia_backend.services.inference.preprocessing import (
+    PREPROCESSING_CHUNK_SIZE,
+    preprocess_encoded_images,
+)
+from agri_gaia_backend.services.tasks.phases import phase
+from agri_gaia_backend.services.tasks.processes import (
+    TASK_PROCESS_POOL_SIZE,
+    process_pool,
+)
+from agri_gaia_backend.util.env import int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Items buffered between two stages.
+INFERENCE_PIPELINE_QUEUE_SIZE = int_from_env("INFERENCE_PIPELINE_QUEUE_SIZE", 64)
+# Concurrent object downloads.
+INFERENCE_FETCH_CONCURRENCY = int_from_env("INFERENCE_FETCH_CONCURRENCY", 8)
+# Preprocessing chunks in the process pool at the same time.
+INFERENCE_PREPROCESS_CONCURRENCY = int_from_env(
+    "INFERENCE_PREPROCESS_CONCURRENCY", TASK_PROCESS_POOL_SIZE
+)
+# Inference requests sent to the server but not yet collected.
+INFERENCE_MAX_INFLIGHT_REQUESTS = int_from_env("INFERENCE_MAX_INFLIGHT_REQUESTS", 4)
+
+INFERENCE_STAGE_THROUGHPUT = Summary(
+    "agri_gaia_inference_stage_images_per_second",
+    "Images per second of busy time of an inference pipeline stage.",
+    labelnames=("stage",),
+)
+
+# Marks the end of the items in a queue.
+_END = object()
+
+
+class _Stopped(Exception):
+    pass
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    # Time spent producing items, including the time waiting for input.
+    seconds: float = 0.0
+    # Time spent waiting for the previous stage.
+    waiting: float = 0.0
+
+    @property
+    def busy_seconds(self) -> float:
+        return max(self.seconds - self.waiting, 0.0)
+
+
+@dataclass
+class Batch:
+    # Object names of the images in the batch, without padding.
+    filenames: List[str]
+    data: np.ndarray
+
+
+def ordered_map(
+    fn: Callable, items: Iterable, executor: Executor, window: int
+) -> Iterator:
+    """
+    Like executor.map, but consumes the items lazily: at most window calls of fn
+    are pending at any time. The results are yielded in the order of the items.
+    fn runs in a copy of the context of the caller, see services/tasks/phases.py.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(contextvars.copy_context().run, fn, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class Pipeline:
+    """
+    Runs generator stages concurrently, connected by bounded queues.
+
+    Every stage but the last runs in its own thread. The last stage runs in the thread
+    iterating over the result of run(), e.g. because its client is bound to that thread.
+    If a stage raises, the other stages are stopped and the exception is raised by the
+    iterator. If the iterator is closed early, the stages are stopped as well.
+
+    The busy time of every stage, i.e. the time it did not wait for its input or for
+    the next stage, is recorded in stats to find the bottleneck.
+    """
+
+    def __init__(self, queue_size: int = INFERENCE_PIPELINE_QUEUE_SIZE) -> None:
+        self.queue_size = queue_size
+        self.stats: List[StageStats] = []
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._threads: List[threading.Thread] = []
+
+    def run(
+        self, source: Iterable, *stages: Callable[[Iterator], Iterator]
+    ) -> Iterator:
+        """
+        Args:
+            source: The input items of the first stage.
+            stages: Generator functions, each called with an iterator over the items of
+                    the previous stage.
+
+        Returns:
+            An iterator over the items yielded by the last stage.
+        """
+        self.stats = [
+            StageStats(getattr(stage, "__name__", f"stage{i}"))
+            for i, stage in enumerate(stages)
+        ]
+        items = iter(source)
+        for stage, stats, next_stats in zip(stages, self.stats, self.stats[1:]):
+            output = queue.Queue(self.queue_size)
+            thread = threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self._run_stage, stage, stats, items, output),
+                name=f"inference-{stats.name}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+            items = self._drain(output, next_stats)
+        return self._finish(self._timed(stages[-1](items), self.stats[-1]))
+
+    def close(self) -> None:
+        """
+        Stops all stages and waits for their threads.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _run_stage(
+        self,
+        stage: Callable[[Iterator], Iterator],
+        stats: StageStats,
+        items: Iterator,
+        output: queue.Queue,
+    ) -> None:
+        outputs = stage(items)
+        try:
+            for item in self._timed(outputs, stats):
+                self._put(output, item)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+        finally:
+            # Cancels the pending work of the stage.
+            outputs.close()
+            try:
+                self._put(output, _END)
+            except _Stopped:
+                pass
+
+    def _put(self, output: queue.Queue, item) -> None:
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _drain(self, input: queue.Queue, stats: StageStats) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            item = self._get(input)
+            stats.waiting += time.perf_counter() - start
+            if item is _END:
+                return
+            yield item
+
+    def _get(self, input: queue.Queue):
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                return input.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    @staticmethod
+    def _timed(items: Iterator, stats: StageStats) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                stats.seconds += time.perf_counter() - start
+            stats.items += 1
+            yield item
+
+    def _finish(self, items: Iterator) -> Iterator:
+        try:
+            yield from items
+        except _Stopped:
+            pass
+        finally:
+            self.close()
+        if self._error is not None:
+            raise self._error
+
+
+def report_throughput(stats: List[StageStats], images: int) -> Dict[str, float]:
+    """
+    Observes the images per second of busy time of every stage, all stages process
+    every image once.
+
+    Returns:
+        The images per second by stage name.
+    """
+    throughput = {}
+    for stage in stats:
+        if stage.busy_seconds > 0:
+            throughput[stage.name] = round(images / stage.busy_seconds, 1)
+            INFERENCE_STAGE_THROUGHPUT.labels(stage=stage.name).observe(
+                throughput[stage.name]
+            )
+    return throughput
+
+
+def fetch_objects(
+    bucket: str, token, concurrency: int = INFERENCE_FETCH_CONCURRENCY
+) -> Callable[[Iterator[str]], Iterator[Tuple[str, bytes]]]:
+    """
+    Returns a stage downloading the objects with the given names.
+    Yields (object name, content) in the order of the names.
+    """
+
+    def download(object_name: str) -> Tuple[str, bytes]:
+        with phase("download") as p:
+            data = minio_api.get_object(
+                bucket=bucket, token=token, object_name=object_name
+            ).read()
+            p.add_bytes(len(data))
+        return object_name, data
+
+    def fetch(object_names: Iterator[str]) -> Iterator[Tuple[str, bytes]]:
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="inference-fetch"
+        ) as executor:
+            yield from ordered_map(download, object_names, executor, concurrency)
+
+    return fetch
+
+
+def _chunks(items: Iterator, size: int) -> Iterator[list]:
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def preprocess_images(
+    format, dtype, c, h, w, concurrency: int = INFERENCE_PREPROCESS_CONCURRENCY
+) -> Callable[[Iterator[Tuple[str, bytes]]], Iterator[Tuple[str, np.ndarray]]]:
+    """
+    Returns a stage decoding and resizing the images in the process pool,
+    see preprocessing.py. Yields (object name, image) in the order of the input.
+    The images are views into the array returned for their chunk.
+    """
+
+    def preprocess_chunk(
+        chunk: List[Tuple[str, bytes]],
+    ) -> List[Tuple[str, np.ndarray]]:
+        filenames = [filename for filename, _ in chunk]
+        encoded_images = [data for _, data in chunk]
+        with phase("preprocess"):
+            images = process_pool.run(
+                preprocess_encoded_images, encoded_images, format, dtype, c, h, w
+            )
+        return list(zip(filenames, images))
+
+    def preprocess(
+        files: Iterator[Tuple[str, bytes]],
+    ) -> Iterator[Tuple[str, np.ndarray]]:
+        # The threads only wait for the process pool.
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="inference-preprocess"
+        ) as executor:
+            for images in ordered_map(
+                preprocess_chunk,
+                _chunks(files, PREPROCESSING_CHUNK_SIZE),
+                executor,
+                concurrency,
+            ):
+                yield from images
+
+    return preprocess
+
+
+def batch_images(
+    batch_size: int, supports_batching: bool
+) -> Callable[[Iterator[Tuple[str, np.ndarray]]], Iterator[Batch]]:
+    """
+    Returns a stage grouping the images into batches of batch_size. The last batch
+    only holds the remaining images, it is not filled up with duplicates.
+    Without batching support, the batch data is the single image.
+    """
+
+    def to_batch(filenames: List[str], images: List[np.ndarray]) -> Batch:
+        if not supports_batching:
+            return Batch(filenames, images[0])
+        # Written in place instead of collecting the images and stacking them.
+        data = np.empty((len(images), *images[0].shape), dtype=images[0].dtype)
+        for i, image in enumerate(images):
+            data[i] = image
+        return Batch(filenames, data)
+
+    def batch(images: Iterator[Tuple[str, np.ndarray]]) -> Iterator[Batch]:
+        for chunk in _chunks(images, batch_size):
+            yield to_batch(
+                [filename for filename, _ in chunk], [image for _, image in chunk]
+            )
+
+    return batch
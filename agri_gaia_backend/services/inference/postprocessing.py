@@ -0,0 +1,281 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Decoding of the outputs of a batch into compact typed arrays. Every step works on the
+# whole batch with numpy, the outputs are not converted image by image.
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class PostprocessingTask(str, Enum):
+    # All outputs as returned by the model.
+    raw = "raw"
+    # The top_k classes and their scores of every output.
+    classification = "classification"
+    # Boxes, scores and classes after thresholding and non-maximum suppression.
+    detection = "detection"
+    # The class of every pixel of every output with a spatial layout.
+    segmentation = "segmentation"
+
+
+class BoxFormat(str, Enum):
+    # Corners: x1, y1, x2, y2.
+    xyxy = "xyxy"
+    # Center and size: cx, cy, w, h, e.g. YOLO.
+    cxcywh = "cxcywh"
+
+
+@dataclass
+class PostprocessingConfig:
+    task: PostprocessingTask = PostprocessingTask.raw
+    top_k: int = 5
+    score_threshold: float = 0.25
+    iou_threshold: float = 0.45
+    max_detections: int = 100
+    box_format: BoxFormat = BoxFormat.xyxy
+
+
+@dataclass
+class BatchResults:
+    """
+    The results of a batch as arrays by name.
+
+    The first dimension of every array is the image, unless counts is given. Then the
+    results are ragged, e.g. detections, and the rows of every array are the rows of
+    the images one after another, counts holds the number of rows of every image.
+    """
+
+    arrays: Dict[str, np.ndarray]
+    counts: Optional[np.ndarray] = None
+
+    @property
+    def images(self) -> int:
+        if self.counts is not None:
+            return len(self.counts)
+        return len(next(iter(self.arrays.values()))) if self.arrays else 0
+
+    def to_lists(self) -> List[Dict[str, list]]:
+        """
+        Returns:
+            The results of every image as lists, e.g. for JSON.
+        """
+        # One conversion per array is faster than one per image.
+        lists = {name: array.tolist() for name, array in self.arrays.items()}
+        if self.counts is None:
+            return [
+                {name: values[i] for name, values in lists.items()}
+                for i in range(self.images)
+            ]
+        offsets = np.concatenate([[0], np.cumsum(self.counts)]).tolist()
+        return [
+            {name: values[start:end] for name, values in lists.items()}
+            for start, end in zip(offsets, offsets[1:])
+        ]
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Args:
+        scores: Scores of shape (images, ...), the other dimensions are flattened.
+        k: Number of classes per image.
+
+    Returns:
+        The indices (int32) and scores (float32) of the k best classes of every image,
+        sorted by descending score.
+    """
+    scores = scores.reshape(len(scores), -1)
+    k = min(k, scores.shape[1])
+    # Partial sort, only the k best scores are sorted afterwards.
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-best, axis=1, kind="stable")
+    return (
+        np.take_along_axis(indices, order, axis=1).astype(np.int32),
+        np.take_along_axis(best, order, axis=1).astype(np.float32),
+    )
+
+
+def segmentation_masks(logits: np.ndarray) -> np.ndarray:
+    """
+    Args:
+        logits: Scores of shape (images, classes, height, width).
+
+    Returns:
+        The class of every pixel, as uint8 if there are at most 256 classes.
+    """
+    dtype = np.uint8 if logits.shape[1] <= 256 else np.uint16
+    return logits.argmax(axis=1).astype(dtype)
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float,
+    max_keep: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Greedy non-maximum suppression of boxes (n, 4) in xyxy format. Every iteration
+    keeps the best remaining box and removes all boxes overlapping it, the overlaps
+    are computed for all boxes at once. Stops after max_keep boxes, so the iterations
+    are bounded by the kept boxes.
+
+    Returns:
+        The indices of the kept boxes, by descending score.
+    """
+    order = np.argsort(-scores, kind="stable")
+    # Coordinates sorted by score and filtered together with order, so the best
+    # remaining box is always the first one.
+    x1, y1, x2, y2 = boxes[order].T.copy()
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while order.size and (max_keep is None or len(keep) < max_keep):
+        keep.append(order[0])
+        width = np.minimum(x2[0], x2[1:]) - np.maximum(x1[0], x1[1:])
+        height = np.minimum(y2[0], y2[1:]) - np.maximum(y1[0], y1[1:])
+        intersection = np.maximum(width, 0) * np.maximum(height, 0)
+        iou = intersection / np.maximum(areas[0] + areas[1:] - intersection, 1e-9)
+        remaining = iou <= iou_threshold
+        order, x1, y1, x2, y2, areas = (
+            column[1:][remaining] for column in (order, x1, y1, x2, y2, areas)
+        )
+    return np.array(keep, dtype=np.int64)
+
+
+def _to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    center, size = boxes[..., :2], boxes[..., 2:4]
+    return np.concatenate([center - size / 2, center + size / 2], axis=-1)
+
+
+def _detection_candidates(
+    outputs: Dict[str, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns:
+        The boxes (images, candidates, 4) and scores (images, candidates, classes).
+        Supported are an output with the boxes and one with the scores, or a single
+        output with the box followed by the class scores of every candidate, also
+        transposed as (images, 4 + classes, candidates) like YOLOv8.
+
+    Raises:
+        ValueError: If the outputs have another layout, e.g. further outputs like the
+                    num_detections of models with NMS built in.
+    """
+    if len(outputs) > 2:
+        raise ValueError(
+            f"Expected one or two detection outputs, got {', '.join(outputs)}."
+        )
+    if len(outputs) == 2:
+        box_names = [name for name, a in outputs.items() if a.shape[-1] == 4]
+        if len(box_names) > 1:
+            box_names = [name for name in box_names if "box" in name.lower()]
+        if len(box_names) != 1:
+            raise ValueError(
+                f"Expected exactly one of the outputs {', '.join(outputs)} to be "
+                "boxes of 4 coordinates."
+            )
+        boxes = outputs[box_names[0]]
+        (scores,) = (a for name, a in outputs.items() if name != box_names[0])
+        if scores.ndim == 2:
+            scores = scores[..., np.newaxis]
+        if boxes.ndim != 3 or scores.shape[:2] != boxes.shape[:2]:
+            raise ValueError(
+                f"Expected boxes (images, candidates, 4) and scores of the same "
+                f"candidates, got {boxes.shape} and {scores.shape}."
+            )
+        return boxes, scores
+
+    (predictions,) = outputs.values()
+    if predictions.ndim != 3:
+        raise ValueError(
+            f"Expected detections of shape (images, candidates, 4 + classes), "
+            f"got {predictions.shape}."
+        )
+    if predictions.shape[1] < predictions.shape[2]:
+        predictions = predictions.transpose(0, 2, 1)
+    return predictions[..., :4], predictions[..., 4:]
+
+
+def decode_detections(
+    outputs: Dict[str, np.ndarray], config: PostprocessingConfig
+) -> BatchResults:
+    """
+    Keeps the candidates whose best class score reaches the threshold, suppresses
+    overlapping boxes of the same class and image, and keeps the best max_detections
+    boxes of every image, by descending score.
+    """
+    boxes, scores = _detection_candidates(outputs)
+    if config.box_format == BoxFormat.cxcywh:
+        boxes = _to_xyxy(boxes)
+    images, _, classes = scores.shape
+
+    best_scores = scores.max(axis=-1)
+    image_index, candidate = np.nonzero(best_scores >= config.score_threshold)
+    boxes = boxes[image_index, candidate].astype(np.float32)
+    best_scores = best_scores[image_index, candidate].astype(np.float32)
+    # Only the classes of the remaining candidates are needed.
+    best_classes = scores[image_index, candidate].argmax(axis=-1).astype(np.int32)
+
+    # The candidates are ordered by image, every image is suppressed separately.
+    bounds = np.searchsorted(image_index, np.arange(images + 1))
+    kept = []
+    for start, end in zip(bounds, bounds[1:]):
+        if start == end:
+            continue
+        # Boxes of different classes are moved apart, so that they never overlap and
+        # a single suppression handles all classes at once.
+        offset = (np.abs(boxes[start:end]).max() + 1) * best_classes[start:end]
+        kept.append(
+            start
+            + nms(
+                boxes[start:end] + offset[:, np.newaxis],
+                best_scores[start:end],
+                config.iou_threshold,
+                config.max_detections,
+            )
+        )
+    kept = np.concatenate(kept) if kept else np.zeros(0, dtype=np.int64)
+    image_index, boxes = image_index[kept], boxes[kept]
+    best_scores, best_classes = best_scores[kept], best_classes[kept]
+
+    return BatchResults(
+        {"boxes": boxes, "scores": best_scores, "classes": best_classes},
+        counts=np.bincount(image_index, minlength=images).astype(np.int32),
+    )
+
+
+def postprocess_outputs(
+    outputs: Dict[str, np.ndarray], config: PostprocessingConfig
+) -> BatchResults:
+    """
+    Decodes the outputs of a batch.
+
+    Args:
+        outputs: All outputs of the model by name, the first dimension is the image.
+        config: The decoding.
+    """
+    if config.task == PostprocessingTask.detection:
+        return decode_detections(outputs, config)
+
+    arrays = {}
+    for name, output in outputs.items():
+        if config.task == PostprocessingTask.classification:
+            arrays[f"{name}.indices"], arrays[f"{name}.scores"] = top_k(
+                output, config.top_k
+            )
+        elif config.task == PostprocessingTask.segmentation and output.ndim == 4:
+            arrays[f"{name}.mask"] = segmentation_masks(output)
+        else:
+            arrays[name] = output
+    return BatchResults(arrays)
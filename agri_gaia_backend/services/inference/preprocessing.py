@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Image preprocessing for Triton inference. CPU-bound, therefore run in the process pool
+# (services/tasks/processes.py). Keep the imports of this module lightweight.
+
+import numpy as np
+
+from io import BytesIO
+from typing import List
+from PIL import Image
+from tritonclient.utils import triton_to_np_dtype
+
+from agri_gaia_backend.util.env import bool_from_env, int_from_env
+
+# Number of images preprocessed by one process pool job.
+PREPROCESSING_CHUNK_SIZE = int_from_env("PREPROCESSING_CHUNK_SIZE", 32)
+
+# JPEGs larger than the model input are decoded at a reduced scale (1/2, 1/4 or 1/8),
+# which is much faster than decoding the full image and resizing it afterwards.
+PREPROCESSING_JPEG_DRAFT = not bool_from_env("PREPROCESSING_DISABLE_JPEG_DRAFT")
+
+
+def preprocess(img, format, dtype, c, h, w):
+    """
+    Pre-process an image to meet the size, type and format
+    requirements specified by the parameters.
+    """
+    # np.set_printoptions(threshold='nan')
+
+    if PREPROCESSING_JPEG_DRAFT:
+        # Only has an effect for JPEGs, the decoded image is never smaller than (w, h).
+        img.draft("L" if c == 1 else "RGB", (w, h))
+
+    if c == 1:
+        sample_img = img.convert("L")
+    else:
+        sample_img = img.convert("RGB")
+
+    resized_img = sample_img.resize((w, h), Image.BILINEAR)
+    resized = np.array(resized_img)
+    if resized.ndim == 2:
+        resized = resized[:, :, np.newaxis]
+
+    npdtype = triton_to_np_dtype(dtype)
+    typed = resized.astype(npdtype)
+
+    scaled = typed
+
+    # Swap to CHW if necessary
+    if format == "NCHW":
+        ordered = np.transpose(scaled, (2, 0, 1))
+    else:
+        ordered = scaled
+
+    # workaround for batchsize 0
+    if len(ordered) == 3:
+        ordered = np.expand_dims(ordered, axis=0)
+
+    # Channels are in RGB order. Currently model configuration data
+    # doesn't provide any information as to other channel orderings
+    # (like BGR) so we just assume RGB.
+    return ordered
+
+
+def preprocess_encoded_images(
+    encoded_images: List[bytes], format, dtype, c, h, w
+) -> np.ndarray:
+    """
+    Decodes and preprocesses a chunk of images. Entry point for the process pool.
+    The images are written into one preallocated array, which is sent back to the
+    calling process as a single buffer.
+
+    Args:
+        encoded_images: The encoded image files, e.g. JPEG or PNG.
+        format: The input format of the model, "NCHW" or "NHWC".
+        dtype: The Triton datatype of the model input.
+        c: Number of channels.
+        h: Height of the model input.
+        w: Width of the model input.
+
+    Returns:
+        The preprocessed images in the same order, stacked along the first axis.
+    """
+    images = None
+    for i, data in enumerate(encoded_images):
+        image = preprocess(Image.open(BytesIO(data)), format, dtype, c, h, w)
+        if images is None:
+            images = np.empty((len(encoded_images), *image.shape), dtype=image.dtype)
+        images[i] = image
+    return images
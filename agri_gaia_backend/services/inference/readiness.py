@@ -0,0 +1,128 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import heapq
+import random
+import logging
+
+from typing import Callable, List, Optional
+
+from prometheus_client import Histogram
+
+from agri_gaia_backend.services.inference.triton_client import TritonClient
+from agri_gaia_backend.services.tasks.cancellation import CancellationToken
+from agri_gaia_backend.util.env import float_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Seconds Triton may take to load the uploaded models.
+TRITON_MODEL_LOAD_TIMEOUT = float_from_env("TRITON_MODEL_LOAD_TIMEOUT", 300)
+# Delay of the first readiness check, doubled after every check up to the maximum.
+TRITON_READY_INITIAL_DELAY = float_from_env("TRITON_READY_INITIAL_DELAY", 0.05)
+TRITON_READY_MAX_DELAY = float_from_env("TRITON_READY_MAX_DELAY", 5.0)
+
+TRITON_MODEL_LOAD_SECONDS = Histogram(
+    "agri_gaia_triton_model_load_seconds",
+    "Time from uploading a model until Triton reported it ready.",
+    labelnames=("result",),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+
+class ModelLoadTimeoutError(RuntimeError):
+    pass
+
+
+def backoff_delay(
+    attempt: int,
+    initial_delay: float = TRITON_READY_INITIAL_DELAY,
+    max_delay: float = TRITON_READY_MAX_DELAY,
+    rng: random.Random = random,
+) -> float:
+    """
+    Exponential backoff with jitter: a random delay between half and the full
+    initial_delay * 2^attempt, at most max_delay. The jitter keeps concurrent
+    runs from checking in lockstep.
+    """
+    delay = min(max_delay, initial_delay * 2**attempt)
+    return rng.uniform(delay / 2, delay)
+
+
+def wait_until_ready(
+    client: TritonClient,
+    model_names: List[str],
+    timeout: float = TRITON_MODEL_LOAD_TIMEOUT,
+    cancellation_token: Optional[CancellationToken] = None,
+    clock: Callable[[], float] = time.monotonic,
+    rng: random.Random = random,
+) -> None:
+    """
+    Waits until Triton reports all models ready. The models are checked concurrently,
+    each with its own backoff, so that a model loading slowly does not delay noticing
+    that the others are ready.
+
+    Errors of a check, e.g. while Triton restarts, count as not ready. The load duration
+    of each model is logged and observed in TRITON_MODEL_LOAD_SECONDS.
+
+    Args:
+        client: The Triton client.
+        model_names: The models, which were just uploaded.
+        timeout: Seconds after which waiting fails.
+        cancellation_token: Token of the background task, waiting stops if it is cancelled.
+        clock: Monotonic clock, replaced in tests.
+        rng: Random source of the backoff jitter, replaced in tests.
+
+    Raises:
+        ModelLoadTimeoutError: If a model is not ready after timeout seconds.
+        TaskCancelledError: If the task was cancelled.
+    """
+    start = clock()
+    deadline = start + timeout
+    # (time of the next check, model name, checks so far)
+    checks = [(start, name, 0) for name in model_names]
+    heapq.heapify(checks)
+
+    while checks:
+        due, name, attempt = heapq.heappop(checks)
+        now = clock()
+        if due > now:
+            # A slow check may have passed the deadline already, the check is then
+            # done right away to decide whether the model failed to load.
+            delay = max(0.0, min(due, deadline) - now)
+            if cancellation_token is not None:
+                cancellation_token.wait(delay)
+            else:
+                time.sleep(delay)
+
+        try:
+            ready = client.is_model_ready(name)
+        except Exception as e:
+            logger.debug(f"Readiness check of model {name} failed: {e}")
+            ready = False
+
+        now = clock()
+        if ready:
+            TRITON_MODEL_LOAD_SECONDS.labels(result="ready").observe(now - start)
+            logger.info(f"Triton loaded model {name} in {now - start:.2f}s.")
+            continue
+
+        if now >= deadline:
+            pending = sorted([name] + [n for _, n, _ in checks])
+            for _ in pending:
+                TRITON_MODEL_LOAD_SECONDS.labels(result="timeout").observe(now - start)
+            raise ModelLoadTimeoutError(
+                f"Triton failed to load the model(s) {', '.join(pending)} "
+                f"within {timeout:g}s."
+            )
+        heapq.heappush(
+            checks, (now + backoff_delay(attempt, rng=rng), name, attempt + 1)
+        )
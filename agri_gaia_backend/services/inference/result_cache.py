@@ -0,0 +1,248 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Cache of model outputs per image in the database (db/inference_results_api.py).
+# An output is reused if the model, the preprocessing and the content of the image
+# are the same, so that rerunning a model on a grown dataset only infers new images.
+# Only used by runs which request it, since the outputs are stored in Postgres. Large
+# outputs (e.g. segmentation logits) are not cached, old outputs are evicted.
+
+import io
+import json
+import time
+import logging
+import datetime
+import threading
+
+from typing import Callable, Dict, List
+
+import numpy as np
+from prometheus_client import Counter
+from sqlalchemy.orm import Session
+
+from agri_gaia_backend.db import inference_results_api
+from agri_gaia_backend.db.database import SessionLocal
+from agri_gaia_backend.db.models import TritonRepositoryEntry
+from agri_gaia_backend.services.inference.postprocessing import BatchResults
+from agri_gaia_backend.services.inference.preprocessing import (
+    PREPROCESSING_JPEG_DRAFT,
+)
+from agri_gaia_backend.services.inference.results import ResultSink
+from agri_gaia_backend.services.tasks.phases import phase
+from agri_gaia_backend.util.env import float_from_env, int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Images looked up per query, the cached outputs of one chunk are held in memory.
+INFERENCE_CACHE_LOOKUP_SIZE = int_from_env("INFERENCE_CACHE_LOOKUP_SIZE", 512)
+# Outputs of an image larger than this are not cached.
+INFERENCE_CACHE_MAX_OUTPUT_BYTES = int_from_env(
+    "INFERENCE_CACHE_MAX_OUTPUT_BYTES", 256 * 1024
+)
+# Outputs are not reused and deleted after INFERENCE_CACHE_TTL_DAYS. Beyond a total
+# size of INFERENCE_CACHE_MAX_BYTES the oldest outputs are deleted.
+INFERENCE_CACHE_TTL_DAYS = float_from_env("INFERENCE_CACHE_TTL_DAYS", 7)
+INFERENCE_CACHE_MAX_BYTES = int_from_env("INFERENCE_CACHE_MAX_BYTES", 1024**3)
+INFERENCE_CACHE_EVICTION_INTERVAL = float_from_env(
+    "INFERENCE_CACHE_EVICTION_INTERVAL", 3600
+)
+
+INFERENCE_CACHE_IMAGES = Counter(
+    "agri_gaia_inference_cache_images_total",
+    "Images of inference runs, by whether their output was cached.",
+    labelnames=("result",),
+)
+INFERENCE_CACHE_EVICTED = Counter(
+    "agri_gaia_inference_cache_evicted_total",
+    "Cached outputs deleted because they expired or the cache was full.",
+)
+
+
+def _expiry() -> datetime.datetime:
+    return datetime.datetime.now() - datetime.timedelta(days=INFERENCE_CACHE_TTL_DAYS)
+
+
+def model_hash(entry: TritonRepositoryEntry) -> str:
+    return f"{entry.content_hash}:{entry.config_hash or ''}"
+
+
+def preprocessing_key(format, dtype, c, h, w, output_names: List[str]) -> str:
+    return json.dumps(
+        {
+            "format": str(format),
+            "dtype": dtype,
+            "shape": [int(c), int(h), int(w)],
+            "jpeg_draft": PREPROCESSING_JPEG_DRAFT,
+            "outputs": sorted(output_names),
+        },
+        sort_keys=True,
+    )
+
+
+def _dump(outputs: Dict[str, np.ndarray]) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **outputs)
+    return buffer.getvalue()
+
+
+def _load(data: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as outputs:
+        return dict(outputs)
+
+
+def _stack(outputs: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {name: np.stack([o[name] for o in outputs]) for name in outputs[0]}
+
+
+def _signature(outputs: Dict[str, np.ndarray]) -> tuple:
+    return tuple((name, a.shape, a.dtype.str) for name, a in sorted(outputs.items()))
+
+
+class ResultCache:
+    """
+    The cached outputs of a model with the given preprocessing. The raw outputs are
+    cached, so they can be postprocessed differently by later runs.
+    """
+
+    def __init__(self, db: Session, model_hash: str, preprocessing: str) -> None:
+        self.db = db
+        self.model_hash = model_hash
+        self.preprocessing = preprocessing
+        self._too_large = False
+
+    def write_cached(
+        self,
+        sink: ResultSink,
+        filenames: List[str],
+        etags: Dict[str, str],
+        postprocess: Callable[[Dict[str, np.ndarray]], BatchResults],
+    ) -> List[str]:
+        """
+        Writes the postprocessed cached outputs of the images to the sink.
+
+        Args:
+            sink: The sink of the run.
+            filenames: The images of the run.
+            etags: The ETag by filename.
+            postprocess: Decodes the outputs of a batch, see postprocessing.py.
+
+        Returns:
+            The images without a cached output, in the given order.
+        """
+        uncached = []
+        for start in range(0, len(filenames), INFERENCE_CACHE_LOOKUP_SIZE):
+            chunk = filenames[start : start + INFERENCE_CACHE_LOOKUP_SIZE]
+            with phase("db"):
+                outputs = inference_results_api.get_outputs(
+                    self.db,
+                    self.model_hash,
+                    self.preprocessing,
+                    list({etags[filename] for filename in chunk}),
+                    created_after=_expiry(),
+                )
+            cached = [filename for filename in chunk if etags[filename] in outputs]
+            uncached.extend(
+                filename for filename in chunk if etags[filename] not in outputs
+            )
+            if cached:
+                loaded = [_load(outputs[etags[filename]]) for filename in cached]
+                if len({_signature(o) for o in loaded}) == 1:
+                    batches = [(cached, loaded)]
+                else:
+                    # Outputs of dynamic shape cannot be stacked.
+                    batches = [([f], [o]) for f, o in zip(cached, loaded)]
+                for batch_filenames, batch_outputs in batches:
+                    with phase("postprocess"):
+                        results = postprocess(_stack(batch_outputs))
+                    sink.write(batch_filenames, results)
+
+        INFERENCE_CACHE_IMAGES.labels(result="hit").inc(len(filenames) - len(uncached))
+        INFERENCE_CACHE_IMAGES.labels(result="miss").inc(len(uncached))
+        return uncached
+
+    def store(self, etags: List[str], outputs: Dict[str, np.ndarray]) -> None:
+        """
+        Stores the raw outputs of a batch by name, the first dimension of every output
+        is aligned with etags. Nothing is stored if the outputs of an image are larger
+        than INFERENCE_CACHE_MAX_OUTPUT_BYTES.
+        """
+        image_bytes = sum(
+            output[0].nbytes for output in outputs.values() if len(output)
+        )
+        if image_bytes > INFERENCE_CACHE_MAX_OUTPUT_BYTES:
+            if not self._too_large:
+                self._too_large = True
+                logger.info(
+                    f"Not caching outputs of {image_bytes} bytes per image, more "
+                    f"than {INFERENCE_CACHE_MAX_OUTPUT_BYTES} bytes."
+                )
+            return
+        with phase("db"):
+            inference_results_api.save_outputs(
+                self.db,
+                self.model_hash,
+                self.preprocessing,
+                {
+                    etag: _dump({name: output[i] for name, output in outputs.items()})
+                    for i, etag in enumerate(etags)
+                },
+            )
+
+
+def evict_cached_outputs(
+    ttl_days: float = INFERENCE_CACHE_TTL_DAYS,
+    max_bytes: int = INFERENCE_CACHE_MAX_BYTES,
+) -> int:
+    """
+    Deletes the cached outputs older than ttl_days and the oldest outputs beyond a
+    total size of max_bytes.
+
+    Returns:
+        The number of deleted outputs.
+    """
+    created_before = datetime.datetime.now() - datetime.timedelta(days=ttl_days)
+    with SessionLocal() as db:
+        evicted = inference_results_api.delete_expired_outputs(
+            db, created_before, max_bytes
+        )
+    INFERENCE_CACHE_EVICTED.inc(evicted)
+    if evicted:
+        logger.info(f"Evicted {evicted} cached inference outputs.")
+    return evicted
+
+
+def _evict_periodically(interval: float) -> None:
+    while True:
+        try:
+            evict_cached_outputs()
+        except Exception as e:
+            logger.exception(e)
+        time.sleep(interval)
+
+
+_eviction_job = None
+
+
+def start_result_cache_eviction_job() -> None:
+    """
+    Starts a daemon thread which evicts cached outputs every
+    INFERENCE_CACHE_EVICTION_INTERVAL seconds. Calling it more than once has no effect.
+    """
+    global _eviction_job
+    if _eviction_job is not None:
+        return
+    _eviction_job = threading.Thread(
+        target=_evict_periodically,
+        args=(max(INFERENCE_CACHE_EVICTION_INTERVAL, 60.0),),
+        name="inference-cache-eviction",
+        daemon=True,
+    )
+    _eviction_job.start()
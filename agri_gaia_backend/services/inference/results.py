@@ -0,0 +1,158 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Sinks streaming inference results to MinIO while the batches complete, so that the
+# results of a run are not held in memory until its end.
+
+import json
+import logging
+import zipfile
+
+from enum import Enum
+from typing import List
+
+import numpy as np
+
+from agri_gaia_backend.services import minio_api
+from agri_gaia_backend.services.inference.postprocessing import BatchResults
+from agri_gaia_backend.util.env import int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Bytes uploaded per part, at least 5 MiB. A sink holds at most one part in memory.
+INFERENCE_RESULT_PART_SIZE = int_from_env("INFERENCE_RESULT_PART_SIZE", 8 * 1024**2)
+
+
+class ResultFormat(str, Enum):
+    # One JSON object per image: {"filename": ..., "outputs": {<name>: [...], ...}}
+    ndjson = "ndjson"
+    # Arrays filenames_<n>, <name>_<n> and for ragged results counts_<n> per request,
+    # for large output tensors.
+    npz = "npz"
+
+
+def encode_ndjson(filenames: List[str], results: BatchResults) -> bytes:
+    return "".join(
+        json.dumps({"filename": filename, "outputs": outputs}) + "\n"
+        for filename, outputs in zip(filenames, results.to_lists())
+    ).encode("utf-8")
+
+
+def write_npz_arrays(
+    file: zipfile.ZipFile, request: int, filenames: List[str], results: BatchResults
+) -> None:
+    """
+    Writes the results of a request as .npy entries of the zip file.
+    """
+    arrays = {"filenames": np.array(filenames), **results.arrays}
+    if results.counts is not None:
+        arrays["counts"] = results.counts
+    for name, array in arrays.items():
+        with file.open(f"{name}_{request}.npy", "w", force_zip64=True) as entry:
+            np.lib.format.write_array(entry, np.asarray(array), allow_pickle=False)
+
+
+class ResultSink:
+    """
+    Writes the outputs of a run to an object, see open_result_sink.
+
+    Used as a context manager. If the run fails, the results written so far are
+    kept, so that a failure does not lose the completed batches.
+    """
+
+    content_type = "application/octet-stream"
+
+    def __init__(
+        self,
+        bucket: str,
+        object_name: str,
+        token,
+        part_size: int = INFERENCE_RESULT_PART_SIZE,
+    ) -> None:
+        self.object_name = object_name
+        self.images = 0
+        self._upload = minio_api.MultipartUpload(
+            bucket, object_name, token, self.content_type, part_size
+        )
+
+    def write(self, filenames: List[str], results: BatchResults) -> None:
+        """
+        Args:
+            filenames: The images of a batch.
+            results: The postprocessed results of the batch.
+        """
+        raise NotImplementedError()
+
+    @property
+    def bytes_written(self) -> int:
+        return self._upload.tell()
+
+    def close(self) -> None:
+        self._upload.close()
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        if self.images == 0:
+            self._upload.abort()
+            return
+        try:
+            self.close()
+            logger.info(
+                f"Kept the results of {self.images} images in {self.object_name}, "
+                "the run failed."
+            )
+        except Exception as e:
+            logger.warning(f"Storing the results in {self.object_name} failed: {e}")
+            self._upload.abort()
+
+
+class NdjsonResultSink(ResultSink):
+    content_type = "application/x-ndjson"
+
+    def write(self, filenames: List[str], results: BatchResults) -> None:
+        # Whole lines only, the object of a failed run holds complete records.
+        self._upload.write(encode_ndjson(filenames, results))
+        self.images += len(filenames)
+
+
+class NpzResultSink(ResultSink):
+    content_type = "application/zip"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # The upload cannot seek, zipfile writes the sizes after the data instead.
+        self._zip = zipfile.ZipFile(self._upload, "w")
+        self._requests = 0
+
+    def write(self, filenames: List[str], results: BatchResults) -> None:
+        self._requests += 1
+        write_npz_arrays(self._zip, self._requests, filenames, results)
+        self.images += len(filenames)
+
+    def close(self) -> None:
+        self._zip.close()
+        super().close()
+
+
+def open_result_sink(
+    format: ResultFormat, bucket: str, object_name: str, token
+) -> ResultSink:
+    """
+    Returns a sink writing the results to the object in the given format.
+    """
+    if format == ResultFormat.npz:
+        return NpzResultSink(bucket, object_name, token)
+    return NdjsonResultSink(bucket, object_name, token)
@@ -0,0 +1,275 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Triton inference server clients for HTTP and gRPC, a pool of reusable clients and
+# optional system shared memory for the input tensors.
+
+import os
+import uuid
+import logging
+import threading
+
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from enum import Enum
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import tritonclient.grpc as grpcclient
+import tritonclient.http as httpclient
+
+from agri_gaia_backend.util.env import bool_from_env, int_from_env
+
+logger = logging.getLogger("api-logger")
+
+
+class TritonProtocol(str, Enum):
+    http = "http"
+    grpc = "grpc"
+
+
+TRITON_PROTOCOL = TritonProtocol(os.getenv("TRITON_PROTOCOL", TritonProtocol.http))
+TRITON_URLS = {
+    TritonProtocol.http: os.getenv("TRITON_HTTP_URL", "triton:8000"),
+    TritonProtocol.grpc: os.getenv("TRITON_GRPC_URL", "triton:8001"),
+}
+# Logs every request and response, including the tensors.
+TRITON_CLIENT_VERBOSE = bool_from_env("TRITON_CLIENT_VERBOSE")
+# Passes the input tensors through system shared memory instead of the request body.
+# Requires Triton to run on the same host and to share /dev/shm (IPC namespace).
+TRITON_SHARED_MEMORY = bool_from_env("TRITON_SHARED_MEMORY")
+# Idle clients kept per server (and per thread for HTTP).
+TRITON_CLIENT_POOL_SIZE = int_from_env("TRITON_CLIENT_POOL_SIZE", 4)
+# Concurrent requests of one HTTP client.
+TRITON_HTTP_CONCURRENCY = int_from_env("TRITON_HTTP_CONCURRENCY", 4)
+
+
+class _GrpcInferRequest:
+    """
+    Result handle of a gRPC request, like the InferAsyncRequest of the HTTP client.
+    """
+
+    def __init__(self) -> None:
+        self._future = Future()
+
+    def _on_done(self, result, error) -> None:
+        if error is not None:
+            self._future.set_exception(error)
+        else:
+            self._future.set_result(result)
+
+    def get_result(self, block: bool = True, timeout: Optional[float] = None):
+        return self._future.result(timeout if block else 0)
+
+
+def _int_shapes(tensors: List[dict], key: str) -> None:
+    # int64 values are strings in the JSON of protobuf messages.
+    for tensor in tensors:
+        tensor[key] = [int(dim) for dim in tensor.get(key, [])]
+
+
+class TritonClient:
+    """
+    Wraps the HTTP and gRPC clients of tritonclient with the same interface.
+    Metadata and config are returned as dicts in the format of the HTTP API.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        protocol: TritonProtocol = TRITON_PROTOCOL,
+        verbose: bool = TRITON_CLIENT_VERBOSE,
+    ) -> None:
+        self.url = url
+        self.protocol = protocol
+        if protocol == TritonProtocol.grpc:
+            self.module = grpcclient
+            self._client = grpcclient.InferenceServerClient(url=url, verbose=verbose)
+        else:
+            self.module = httpclient
+            self._client = httpclient.InferenceServerClient(
+                url=url, verbose=verbose, concurrency=TRITON_HTTP_CONCURRENCY
+            )
+
+    def is_model_ready(self, model_name: str) -> bool:
+        return self._client.is_model_ready(model_name=model_name)
+
+    def get_model_metadata(self, model_name: str) -> dict:
+        if self.protocol == TritonProtocol.http:
+            return self._client.get_model_metadata(model_name=model_name)
+        metadata = self._client.get_model_metadata(model_name=model_name, as_json=True)
+        _int_shapes(metadata.get("inputs", []), "shape")
+        _int_shapes(metadata.get("outputs", []), "shape")
+        return metadata
+
+    def get_model_config(self, model_name: str) -> dict:
+        if self.protocol == TritonProtocol.http:
+            return self._client.get_model_config(model_name=model_name)
+        config = self._client.get_model_config(model_name=model_name, as_json=True)[
+            "config"
+        ]
+        # Default values are omitted in the JSON of protobuf messages.
+        config.setdefault("max_batch_size", 0)
+        for tensor in config.setdefault("input", []):
+            tensor.setdefault("format", "FORMAT_NONE")
+        _int_shapes(config["input"], "dims")
+        _int_shapes(config.setdefault("output", []), "dims")
+        return config
+
+    def async_infer(self, model_name: str, inputs, outputs, request_id: str):
+        """
+        Sends an inference request without waiting for the response.
+
+        Returns:
+            A handle whose get_result() waits for and returns the InferResult.
+        """
+        if self.protocol == TritonProtocol.http:
+            return self._client.async_infer(
+                model_name, inputs, request_id=request_id, outputs=outputs
+            )
+        request = _GrpcInferRequest()
+        self._client.async_infer(
+            model_name,
+            inputs,
+            callback=request._on_done,
+            request_id=request_id,
+            outputs=outputs,
+        )
+        return request
+
+    def register_system_shared_memory(self, name: str, key: str, byte_size: int):
+        self._client.register_system_shared_memory(name, key, byte_size)
+
+    def unregister_system_shared_memory(self, name: str):
+        self._client.unregister_system_shared_memory(name)
+
+    def close(self) -> None:
+        try:
+            self._client.close()
+        except Exception as e:
+            logger.warning(f"Closing the Triton client for {self.url} failed: {e}")
+
+
+class SharedMemoryInputs:
+    """
+    Ring of system shared memory regions registered at the server, one per request
+    in flight. A region is reused once the request using it was collected.
+    """
+
+    def __init__(self, client: TritonClient, slots: int) -> None:
+        # Loads the native library, only needed if shared memory is used.
+        import tritonclient.utils.shared_memory as shm
+
+        self._shm = shm
+        self.client = client
+        self.slots = slots
+        self._prefix = f"agri_gaia_{uuid.uuid4().hex}"
+        self._regions: Dict[int, Tuple[str, object, int]] = {}
+
+    def _region(self, slot: int, byte_size: int) -> Tuple[str, object]:
+        region = self._regions.get(slot)
+        if region is not None and region[2] != byte_size:
+            self._destroy(slot)
+            region = None
+        if region is None:
+            name = f"{self._prefix}_{slot}"
+            handle = self._shm.create_shared_memory_region(name, f"/{name}", byte_size)
+            try:
+                self.client.register_system_shared_memory(name, f"/{name}", byte_size)
+            except Exception:
+                self._shm.destroy_shared_memory_region(handle)
+                raise
+            region = (name, handle, byte_size)
+            self._regions[slot] = region
+        return region[0], region[1]
+
+    def set_input(self, infer_input, request_id: int, data: np.ndarray) -> None:
+        """
+        Copies the data into the region of the request and points the input at it.
+        """
+        data = np.ascontiguousarray(data)
+        name, handle = self._region(request_id % self.slots, data.nbytes)
+        self._shm.set_shared_memory_region(handle, [data])
+        infer_input.set_shared_memory(name, data.nbytes)
+
+    def _destroy(self, slot: int) -> None:
+        name, handle, _ = self._regions.pop(slot)
+        try:
+            self.client.unregister_system_shared_memory(name)
+        finally:
+            self._shm.destroy_shared_memory_region(handle)
+
+    def close(self) -> None:
+        for slot in list(self._regions):
+            try:
+                self._destroy(slot)
+            except Exception as e:
+                logger.warning(f"Releasing shared memory region failed: {e}")
+
+
+class TritonClientPool:
+    """
+    Keeps idle clients for reuse, so that connections are not set up for every run.
+
+    gRPC clients are thread-safe and shared by all threads. HTTP clients send requests
+    from greenlets bound to the thread which created them, so they are only reused by
+    the same thread.
+    """
+
+    def __init__(self, size: int = TRITON_CLIENT_POOL_SIZE) -> None:
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle: Dict[tuple, List[TritonClient]] = defaultdict(list)
+
+    @staticmethod
+    def _key(url: str, protocol: TritonProtocol) -> tuple:
+        if protocol == TritonProtocol.http:
+            return protocol, url, threading.get_ident()
+        return protocol, url
+
+    @contextmanager
+    def client(
+        self, url: Optional[str] = None, protocol: Optional[TritonProtocol] = None
+    ) -> Iterator[TritonClient]:
+        """
+        Yields an idle client for the server or creates one.
+        The client is returned to the pool afterwards, unless an exception was raised.
+
+        Args:
+            url: The URL of the server, defaults to TRITON_HTTP_URL or TRITON_GRPC_URL.
+            protocol: The protocol, defaults to TRITON_PROTOCOL.
+        """
+        protocol = TritonProtocol(protocol or TRITON_PROTOCOL)
+        url = url or TRITON_URLS[protocol]
+        key = self._key(url, protocol)
+        with self._lock:
+            idle = self._idle[key]
+            client = idle.pop() if idle else None
+        if client is None:
+            client = TritonClient(url, protocol)
+
+        try:
+            yield client
+        except BaseException:
+            # The connection may be broken.
+            client.close()
+            raise
+
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.size:
+                idle.append(client)
+                return
+        client.close()
+
+
+triton_clients = TritonClientPool()
@@ -12,8 +12,10 @@
 import io
 import minio
 
-from typing import Optional, Union
+from typing import List, Optional, Union
+from minio.commonconfig import CopySource
 from agri_gaia_backend.services.minio_api.client import *
+from agri_gaia_backend.util.server_timing import MINIO, downstream
 
 import logging
 
@@ -38,6 +40,7 @@ def get_access(token):
     return mclient
 
 
+@downstream(MINIO)
 def valid_params(bucket, token):
     """
     Validates the Parameters, which can be used to connect to a minio instance.
@@ -50,6 +53,7 @@ def valid_params(bucket, token):
     minio_client.bucket_exists(bucket)
 
 
+@downstream(MINIO)
 def upload_file(bucket, prefix, token, file, objectname: Optional[str] = None):
     """
     Uploads a single file to the defined MinIO location
@@ -74,6 +78,7 @@ def upload_file(bucket, prefix, token, file, objectname: Optional[str] = None):
     )
 
 
+@downstream(MINIO)
 def upload_data(
     bucket: str,
     prefix: str,
@@ -109,6 +114,7 @@ def upload_data(
     )
 
 
+@downstream(MINIO)
 def download_file(bucket, token, minio_item):
     """
     Downloads a single file from the defined MinIO location.
@@ -124,6 +130,7 @@ def download_file(bucket, token, minio_item):
     return get_object(bucket, minio_item.object_name, token)
 
 
+@downstream(MINIO)
 def delete_all_objects(bucket, prefix, token):
     """
     Delete all files starting with given dataset as prefix from minio
@@ -139,6 +146,7 @@ def delete_all_objects(bucket, prefix, token):
         minio_client.remove_object(bucket, item.object_name)
 
 
+@downstream(MINIO)
 def delete_object(bucket, object_name, token):
     """
     deletes the object for the given bucket and object name
@@ -151,6 +159,7 @@ def delete_object(bucket, object_name, token):
     minio_client.remove_object(bucket, object_name)
 
 
+@downstream(MINIO)
 def get_all_objects(bucket, prefix, token):
     """
     Returns a list of all objects contained in a dataset of an defined MinIO bucket
@@ -165,6 +174,7 @@ def get_all_objects(bucket, prefix, token):
     return list(minio_client.list_objects(bucket, prefix=prefix, recursive=True))
 
 
+@downstream(MINIO)
 def get_object(bucket, object_name, token):
     """
     Returns the object for the given bucket and object name
@@ -179,11 +189,13 @@ def get_object(bucket, object_name, token):
     return minio_client.get_object(bucket, object_name)
 
 
+@downstream(MINIO)
 def stat_object(bucket: str, object_name: str, token: str) -> minio.datatypes.Object:
     minio_client = get_access(token)
     return minio_client.stat_object(bucket_name=bucket, object_name=object_name)
 
 
+@downstream(MINIO)
 def exists(bucket: str, object_name: str, token: str) -> bool:
     minio_client = get_access(token)
     try:
@@ -192,3 +204,126 @@ def exists(bucket: str, object_name: str, token: str) -> bool:
         if e.code == "NoSuchKey":
             return False
     return True
+
+
+@downstream(MINIO)
+def copy_object(
+    bucket: str, object_name: str, source_bucket: str, source_object: str, token: str
+) -> None:
+    """
+    Copies an object on the server, without downloading and uploading its content.
+
+    Args:
+        bucket: The bucket of the copy.
+        object_name: The name of the copy.
+        source_bucket: The bucket of the object to copy.
+        source_object: The name of the object to copy.
+        token: has to be a valid token and must be passed as a dict object
+    """
+    minio_client = get_access(token)
+    minio_client.copy_object(
+        bucket, object_name, CopySource(source_bucket, source_object)
+    )
+
+
+# Smallest size of a part of a multipart upload but the last, required by S3.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+@downstream(MINIO)
+class MultipartUpload:
+    """
+    Writable file object uploading the written data to an object, part by part.
+
+    Only the data of the current part is held in memory. Data smaller than one part
+    is uploaded in a single request by close(). The object only becomes visible once
+    close() completes the upload, abort() discards the uploaded parts.
+
+    The minio client has no public API for uploads of unknown length from a writer,
+    so the S3 multipart calls of the client are used directly.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        object_name: str,
+        token: str,
+        content_type: str = "application/octet-stream",
+        part_size: int = MIN_PART_SIZE,
+    ) -> None:
+        self.bucket = bucket
+        self.object_name = object_name
+        self.content_type = content_type
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self._client = get_access(token)
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[minio.datatypes.Part] = []
+        self._written = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._written += len(data)
+        if len(self._buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def tell(self) -> int:
+        return self._written
+
+    def flush(self) -> None:
+        # Parts are uploaded once they are full, S3 rejects smaller ones.
+        pass
+
+    def _upload_part(self) -> None:
+        if self._upload_id is None:
+            self._upload_id = self._client._create_multipart_upload(
+                self.bucket, self.object_name, {"Content-Type": self.content_type}
+            )
+        part_number = len(self._parts) + 1
+        etag = self._client._upload_part(
+            self.bucket,
+            self.object_name,
+            bytes(self._buffer),
+            None,
+            self._upload_id,
+            part_number,
+        )
+        self._parts.append(minio.datatypes.Part(part_number, etag))
+        self._buffer = bytearray()
+
+    def close(self) -> None:
+        """
+        Uploads the remaining data and completes the upload.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self._upload_id is None:
+            self._client.put_object(
+                self.bucket,
+                self.object_name,
+                io.BytesIO(self._buffer),
+                len(self._buffer),
+                content_type=self.content_type,
+            )
+            return
+        if self._buffer:
+            self._upload_part()
+        self._client._complete_multipart_upload(
+            self.bucket, self.object_name, self._upload_id, self._parts
+        )
+
+    def abort(self) -> None:
+        """
+        Discards the data, the object is not created.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            self._client._abort_multipart_upload(
+                self.bucket, self.object_name, self._upload_id
+            )
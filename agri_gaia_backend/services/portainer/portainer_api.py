@@ -28,6 +28,7 @@ from agri_gaia_backend.schemas.container_deployment import ContainerDeployment
 from agri_gaia_backend.schemas.container_image import ContainerImage
 from agri_gaia_backend.schemas.edge_device import EdgeDevice
 from agri_gaia_backend.util.env import bool_from_env
+from agri_gaia_backend.util.server_timing import PORTAINER, downstream
 
 from agri_gaia_backend.util.auth.service_account import (
     REALM_SERVICE_ACCOUNT_USERNAME,
@@ -75,6 +76,7 @@ def _update_edge_key(endpoint: dict):
     endpoint["EdgeKey"] = edge_key_encoded
 
 
+@downstream(PORTAINER)
 class PortainerAPI:
     def __init__(self) -> None:
         self.jwt = None
@@ -0,0 +1,213 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import logging
+import threading
+
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import Counter
+
+from agri_gaia_backend.services.tasks.scheduler import BUILD, CPU, DOCKER, IO
+from agri_gaia_backend.util.env import float_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Wall-clock limit of a running task in seconds per scheduler queue. 0 disables the limit.
+# Every queue of the scheduler needs an entry.
+TASK_TIMEOUTS = {
+    IO: float_from_env("TASK_TIMEOUT_IO", 6 * 3600),
+    CPU: float_from_env("TASK_TIMEOUT_CPU", 12 * 3600),
+    DOCKER: float_from_env("TASK_TIMEOUT_DOCKER", 12 * 3600),
+    BUILD: float_from_env("TASK_TIMEOUT_BUILD", 24 * 3600),
+}
+# How often a running task checks the database for a cancellation requested by another worker.
+TASK_CANCEL_POLL_INTERVAL = float_from_env("TASK_CANCEL_POLL_INTERVAL", 5.0)
+
+TASK_CANCELLATIONS = Counter(
+    "agri_gaia_task_cancellations_total",
+    "Background tasks which were cancelled, by reason.",
+    labelnames=("reason",),
+)
+
+# Cancellation reasons
+REQUESTED = "requested"
+TIMEOUT = "timeout"
+
+
+class TaskCancelledError(Exception):
+    pass
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation of a background task.
+
+    Python threads cannot be stopped from the outside, so task functions have to check
+    the token between steps (raise_if_cancelled, wait). Reporting progress checks the
+    token as well, so every task reporting progress can be cancelled between updates.
+
+    Task functions register cleanup hooks (add_cleanup) for resources which would be
+    left behind by an incomplete run, e.g. partially uploaded objects. The hooks are run
+    in reverse order if the task was cancelled.
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        poll: Optional[Callable[[], bool]] = None,
+        poll_interval: float = TASK_CANCEL_POLL_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.timeout = timeout
+        self.clock = clock
+        self.reason: Optional[str] = None
+
+        self._event = threading.Event()
+        self._deadline: Optional[float] = None
+        self._poll = poll
+        self._poll_interval = poll_interval
+        self._last_poll = float("-inf")
+        self._lock = threading.Lock()
+        self._cleanups: List[Callable[[], None]] = []
+
+    def start(self) -> None:
+        """
+        Starts the wall-clock limit. Called when the task starts running,
+        the time waiting in the scheduler queue does not count.
+        """
+        if self.timeout:
+            self._deadline = self.clock() + self.timeout
+
+    def cancel(self, reason: str = REQUESTED) -> bool:
+        """
+        Requests the cancellation of the task.
+
+        Returns:
+            False if the task was cancelled before.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+        TASK_CANCELLATIONS.labels(reason=reason).inc()
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+
+        if self._deadline is not None and self.clock() >= self._deadline:
+            self.cancel(TIMEOUT)
+        elif self._poll is not None and (
+            self.clock() - self._last_poll >= self._poll_interval
+        ):
+            self._last_poll = self.clock()
+            try:
+                if self._poll():
+                    self.cancel(REQUESTED)
+            except Exception as e:
+                logger.exception(e)
+        return self._event.is_set()
+
+    @property
+    def message(self) -> str:
+        if self.reason == TIMEOUT:
+            return (
+                f"Task cancelled after exceeding its time limit of {self.timeout:g}s."
+            )
+        return "Task cancelled."
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Raises:
+            TaskCancelledError: If the task was cancelled or exceeded its time limit.
+        """
+        if self.cancelled:
+            raise TaskCancelledError(self.message)
+
+    def wait(self, seconds: float) -> None:
+        """
+        Sleeps for the given seconds, but wakes up as soon as the task is cancelled.
+        Use it instead of time.sleep in task functions.
+
+        Raises:
+            TaskCancelledError: If the task was cancelled or exceeded its time limit.
+        """
+        self.raise_if_cancelled()
+        if self._deadline is not None:
+            seconds = min(seconds, max(0.0, self._deadline - self.clock()))
+        self._event.wait(seconds)
+        self.raise_if_cancelled()
+
+    def add_cleanup(self, fn: Callable[[], None]) -> None:
+        """
+        Registers a function releasing resources of an incomplete run, e.g. deleting a
+        partially uploaded object. Register it before the resource is created.
+        """
+        with self._lock:
+            self._cleanups.append(fn)
+
+    def run_cleanups(self) -> None:
+        with self._lock:
+            cleanups, self._cleanups = self._cleanups, []
+        for cleanup in reversed(cleanups):
+            try:
+                cleanup()
+            except Exception as e:
+                logger.exception(e)
+
+
+class CancellationRegistry:
+    """
+    Tokens and scheduler futures of the tasks started by this process, by task id.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tasks: Dict[int, CancellationToken] = {}
+        self._futures: Dict[int, Future] = {}
+
+    def register(self, task_id: int, token: CancellationToken, future: Future) -> None:
+        with self._lock:
+            self._tasks[task_id] = token
+            self._futures[task_id] = future
+        future.add_done_callback(lambda _: self.unregister(task_id))
+
+    def unregister(self, task_id: int) -> None:
+        with self._lock:
+            self._tasks.pop(task_id, None)
+            self._futures.pop(task_id, None)
+
+    def cancel(self, task_id: int, reason: str = REQUESTED) -> bool:
+        """
+        Cancels the task, if it was started by this process.
+        A task still waiting in its scheduler queue is not started anymore.
+
+        Returns:
+            Whether the task was found.
+        """
+        with self._lock:
+            token = self._tasks.get(task_id)
+            future = self._futures.get(task_id)
+        if token is None:
+            return False
+
+        token.cancel(reason)
+        future.cancel()
+        return True
+
+
+cancellation_registry = CancellationRegistry()
@@ -0,0 +1,197 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import time
+import asyncio
+import logging
+import threading
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, List, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+from prometheus_client import Gauge
+
+from agri_gaia_backend.util.env import int_from_env
+
+logger = logging.getLogger("api-logger")
+
+TASK_EVENTS_BUFFER_SIZE = int_from_env("TASK_EVENTS_BUFFER_SIZE", 1000)
+TASK_EVENTS_SUBSCRIBER_QUEUE_SIZE = int_from_env(
+    "TASK_EVENTS_SUBSCRIBER_QUEUE_SIZE", 1000
+)
+
+# Event types
+CREATED = "created"
+STATUS = "status"
+PROGRESS = "progress"
+# The task completed or failed, see the status in the data.
+COMPLETED = "completed"
+# The client missed events and has to fetch the tasks again.
+RESYNC = "resync"
+
+TASK_EVENT_SUBSCRIBERS = Gauge(
+    "agri_gaia_task_event_subscribers",
+    "Clients currently subscribed to task events.",
+)
+
+# Event ids are only unique within one process. The boot id makes ids of
+# another process (e.g. before a restart) detectable, so the client is asked to resync.
+_BOOT_ID = str(int(time.time()))
+
+
+@dataclass
+class TaskEvent:
+    seq: int
+    type: str
+    initiator: str
+    task_id: int
+    data: dict
+
+    @property
+    def id(self) -> str:
+        return f"{_BOOT_ID}:{self.seq}"
+
+    def to_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+
+@dataclass(eq=False)
+class _Subscriber:
+    initiator: str
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(
+        default_factory=lambda: asyncio.Queue(TASK_EVENTS_SUBSCRIBER_QUEUE_SIZE)
+    )
+    lost_events: bool = False
+
+
+class TaskEventBroker:
+    """
+    In-process publish/subscribe of task events.
+
+    Events are published by the TaskCreator from the background task threads and delivered
+    to the event loops of the subscribed clients. The most recent events are kept in a ring
+    buffer, so clients reconnecting with their last event id receive the events they missed.
+
+    Only tasks running in the same process are seen. With several workers
+    (WEB_CONCURRENCY > 1) a client receives the events of the worker it is connected to.
+    """
+
+    def __init__(self, buffer_size: int = TASK_EVENTS_BUFFER_SIZE) -> None:
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._buffer: Deque[TaskEvent] = deque(maxlen=buffer_size)
+        self._subscribers: Set[_Subscriber] = set()
+
+    def publish(self, type: str, initiator: str, task_id: int, data) -> TaskEvent:
+        """
+        Publishes an event to all subscribers of the initiator. Can be called from any thread.
+
+        Args:
+            type: The event type, e.g. PROGRESS.
+            initiator: The user who started the task.
+            task_id: The id of the task.
+            data: JSON serializable event data, usually the task schema.
+
+        Returns:
+            The published event.
+        """
+        with self._lock:
+            self._seq += 1
+            event = TaskEvent(
+                self._seq, type, initiator, task_id, jsonable_encoder(data)
+            )
+            self._buffer.append(event)
+            subscribers = [s for s in self._subscribers if s.initiator == initiator]
+
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(self._deliver, subscriber, event)
+            except RuntimeError:
+                # The event loop of the subscriber is closed.
+                self._unsubscribe(subscriber)
+        return event
+
+    @staticmethod
+    def _deliver(subscriber: _Subscriber, event: TaskEvent) -> None:
+        try:
+            subscriber.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            subscriber.lost_events = True
+
+    def _replay(self, initiator: str, last_event_id: Optional[str]) -> List[TaskEvent]:
+        # Has to be called with the lock held.
+        if last_event_id is None:
+            return []
+
+        boot_id, _, seq = last_event_id.partition(":")
+        oldest_seq = self._buffer[0].seq if self._buffer else self._seq + 1
+        if boot_id != _BOOT_ID or not seq.isdigit() or int(seq) < oldest_seq - 1:
+            return [TaskEvent(self._seq, RESYNC, initiator, 0, {})]
+
+        return [
+            e for e in self._buffer if e.seq > int(seq) and e.initiator == initiator
+        ]
+
+    def _unsubscribe(self, subscriber: _Subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.discard(subscriber)
+                TASK_EVENT_SUBSCRIBERS.dec()
+
+    async def subscribe(
+        self,
+        initiator: str,
+        last_event_id: Optional[str] = None,
+        keepalive: float = 15.0,
+    ) -> AsyncIterator[Optional[TaskEvent]]:
+        """
+        Yields the events of the initiator's tasks, starting after last_event_id.
+        Yields None if there was no event for keepalive seconds.
+
+        Args:
+            initiator: The user whose task events are yielded.
+            last_event_id: Id of the last event the client received, e.g. from the Last-Event-ID header.
+            keepalive: Seconds after which None is yielded, so that the caller can send a keepalive.
+        """
+        subscriber = _Subscriber(initiator, asyncio.get_running_loop())
+        # Registering and reading the buffer under the same lock guarantees
+        # that no event is lost or delivered twice between replay and live events.
+        with self._lock:
+            self._subscribers.add(subscriber)
+            replay = self._replay(initiator, last_event_id)
+        TASK_EVENT_SUBSCRIBERS.inc()
+
+        try:
+            for event in replay:
+                yield event
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+
+                if subscriber.lost_events:
+                    subscriber.lost_events = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    event = TaskEvent(event.seq, RESYNC, initiator, 0, {})
+                yield event
+        finally:
+            self._unsubscribe(subscriber)
+
+
+task_events = TaskEventBroker()
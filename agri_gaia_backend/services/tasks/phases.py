@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import threading
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import Summary
+
+TASK_PHASE_SECONDS = Summary(
+    "agri_gaia_task_phase_seconds",
+    "Time background tasks spent in a phase, e.g. download, preprocess, infer or upload.",
+    labelnames=("phase",),
+)
+TASK_PHASE_BYTES = Summary(
+    "agri_gaia_task_phase_bytes",
+    "Bytes transferred or processed by background tasks in a phase.",
+    labelnames=("phase",),
+)
+
+
+class Phase:
+    """
+    Handle of a running phase, see phase().
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.bytes = 0
+
+    def add_bytes(self, count: int) -> None:
+        """
+        Adds to the bytes transferred or processed in this phase.
+        """
+        self.bytes += count
+
+
+class PhaseRecorder:
+    """
+    Sums up the durations and byte counts of the phases of one background task.
+    A phase entered several times (e.g. once per dataset) is summed up.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._phases: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, seconds: float, count: int) -> None:
+        with self._lock:
+            totals = self._phases.setdefault(
+                name, {"seconds": 0.0, "bytes": 0, "count": 0}
+            )
+            totals["seconds"] += seconds
+            totals["bytes"] += count
+            totals["count"] += 1
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            A JSON serializable copy of the phase totals by phase name.
+        """
+        with self._lock:
+            return {
+                name: {**totals, "seconds": round(totals["seconds"], 3)}
+                for name, totals in self._phases.items()
+            }
+
+
+_recorder: ContextVar[Optional[PhaseRecorder]] = ContextVar(
+    "task_phase_recorder", default=None
+)
+
+
+@contextmanager
+def recording(recorder: PhaseRecorder) -> Iterator[PhaseRecorder]:
+    """
+    Records the phases entered in the current thread in the given recorder.
+    Used by the TaskCreator around the task function.
+    """
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[Phase]:
+    """
+    Measures a phase of a background task:
+
+        with phase("download") as p:
+            data = minio_api.get_object(...).read()
+            p.add_bytes(len(data))
+
+    The duration and bytes are observed in the Prometheus summaries and, if called
+    from a task function started by the TaskCreator, stored in the phases of the task.
+    Threads started by the task function do not inherit the task, their phases are
+    only observed in the summaries. The phase is recorded as well if it raises.
+
+    Args:
+        name: Name of the phase, e.g. "download", "preprocess", "infer", "upload" or "db".
+    """
+    handle = Phase(name)
+    start = time.perf_counter()
+    try:
+        yield handle
+    finally:
+        seconds = time.perf_counter() - start
+        TASK_PHASE_SECONDS.labels(phase=name).observe(seconds)
+        if handle.bytes:
+            TASK_PHASE_BYTES.labels(phase=name).observe(handle.bytes)
+        recorder = _recorder.get()
+        if recorder is not None:
+            recorder.record(name, seconds, handle.bytes)
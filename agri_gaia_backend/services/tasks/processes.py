@@ -0,0 +1,264 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import logging
+import itertools
+import threading
+import multiprocessing
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter
+
+from agri_gaia_backend.services.tasks.cancellation import TaskCancelledError
+from agri_gaia_backend.util.env import int_from_env
+
+logger = logging.getLogger("api-logger")
+
+TASK_PROCESS_POOL_SIZE = int_from_env("TASK_PROCESS_POOL_SIZE", os.cpu_count() or 1)
+
+PROCESS_POOL_CRASHES = Counter(
+    "agri_gaia_process_pool_crashes_total",
+    "Times a worker process of the process pool died and the pool was restarted.",
+)
+
+
+class WorkerCrashedError(RuntimeError):
+    pass
+
+
+# Slots of the shared array of cancelled job ids. A job is cancelled if the slot
+# job_id % _CANCELLED_JOB_SLOTS holds its id.
+_CANCELLED_JOB_SLOTS = 1024
+
+# Set in the worker processes by _init_worker.
+_worker_progress_queue = None
+_worker_cancelled_jobs = None
+
+
+def _init_worker(progress_queue, cancelled_jobs) -> None:
+    global _worker_progress_queue, _worker_cancelled_jobs
+    _worker_progress_queue = progress_queue
+    _worker_cancelled_jobs = cancelled_jobs
+
+
+def _report_progress(job_id: int, value: float) -> None:
+    if _worker_cancelled_jobs[job_id % _CANCELLED_JOB_SLOTS] == job_id:
+        raise TaskCancelledError("Task cancelled.")
+    _worker_progress_queue.put((job_id, value))
+
+
+def _run_entry_point(
+    job_id: int, fn: Callable, args: Tuple, kwargs: Dict, reports_progress: bool
+) -> Any:
+    if not reports_progress:
+        return fn(*args, **kwargs)
+
+    kwargs["on_progress_change"] = lambda value: _report_progress(job_id, value)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        # Progress is relayed asynchronously, the marker tells the relay that the job is done.
+        _worker_progress_queue.put((job_id, None))
+
+
+class ProcessPool:
+    """
+    Runs CPU-bound work in separate processes, so that it neither competes with the
+    request handling for the GIL nor takes the API down if it crashes.
+
+    Entry points have to be picklable, i.e. module-level functions with picklable arguments
+    and results, and should live in modules which are cheap to import (not in routers).
+    Worker processes are spawned, not forked, because the API process runs many threads.
+
+    If a worker process dies (e.g. segfault, OOM kill), the pool is restarted and every job
+    which was running at that time is retried once. A job crashing its worker twice fails
+    with a WorkerCrashedError.
+
+    If the progress callback of a job raises a TaskCancelledError, i.e. its task was
+    cancelled or timed out, the job is stopped by raising it from its next progress
+    report in the worker process, and run() raises it in the waiting thread.
+    """
+
+    def __init__(self, max_workers: int = TASK_PROCESS_POOL_SIZE) -> None:
+        self.max_workers = max(1, max_workers)
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._progress_callbacks: Dict[int, Callable[[float], None]] = {}
+        self._cancelled_jobs = None
+        self._cancellations: Dict[int, TaskCancelledError] = {}
+        self._job_ids = itertools.count(1)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Has to be called with the lock held.
+        if self._executor is None:
+            if self._cancelled_jobs is None:
+                self._cancelled_jobs = self._context.RawArray("q", _CANCELLED_JOB_SLOTS)
+            self._progress_queue = self._context.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self._progress_queue, self._cancelled_jobs),
+            )
+            threading.Thread(
+                target=self._relay_progress,
+                args=(self._progress_queue,),
+                name="process-pool-progress",
+                daemon=True,
+            ).start()
+        return self._executor
+
+    def _relay_progress(self, progress_queue) -> None:
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            job_id, value = message
+            if value is None:
+                self._progress_callbacks.pop(job_id, None)
+                continue
+            callback = self._progress_callbacks.get(job_id)
+            if callback is None:
+                continue
+            try:
+                # The thread waiting for the job is blocked in run(),
+                # so the callback does not race with it.
+                callback(value)
+            except TaskCancelledError as e:
+                self._cancel_job(job_id, e)
+            except Exception as e:
+                logger.exception(e)
+
+    def _cancel_job(self, job_id: int, error: TaskCancelledError) -> None:
+        # Recorded before the flag is set, so that run() finds it when the job raises.
+        self._cancellations[job_id] = error
+        self._progress_callbacks.pop(job_id, None)
+        self._cancelled_jobs[job_id % _CANCELLED_JOB_SLOTS] = job_id
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Several failed jobs may report the same crash.
+            if self._executor is not executor:
+                return
+            PROCESS_POOL_CRASHES.inc()
+            logger.error("A worker process of the process pool died. Restarting pool.")
+            self._executor = None
+            # Stops the progress relay thread of the old pool.
+            self._progress_queue.put(None)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(
+        self,
+        fn: Callable,
+        *args,
+        on_progress_change: Optional[Callable[[float], None]] = None,
+        **kwargs,
+    ) -> Tuple[Future, ProcessPoolExecutor, int]:
+        with self._lock:
+            executor = self._get_executor()
+            job_id = next(self._job_ids)
+            if on_progress_change is not None:
+                self._progress_callbacks[job_id] = on_progress_change
+            future = executor.submit(
+                _run_entry_point,
+                job_id,
+                fn,
+                args,
+                kwargs,
+                on_progress_change is not None,
+            )
+        return future, executor, job_id
+
+    def _gather(
+        self,
+        fn: Callable,
+        args_list: Sequence[Tuple],
+        kwargs: Dict,
+        on_progress_change: Optional[Callable[[float], None]] = None,
+    ) -> List[Any]:
+        results = [None] * len(args_list)
+        pending = list(range(len(args_list)))
+
+        for attempt in range(2):
+            submitted = [
+                (
+                    i,
+                    *self.submit(
+                        fn,
+                        *args_list[i],
+                        on_progress_change=on_progress_change,
+                        **kwargs,
+                    ),
+                )
+                for i in pending
+            ]
+            pending = []
+            for i, future, executor, job_id in submitted:
+                try:
+                    results[i] = future.result()
+                except BrokenProcessPool:
+                    self._progress_callbacks.pop(job_id, None)
+                    self._restart(executor)
+                    pending.append(i)
+                except TaskCancelledError as e:
+                    # Raised by the worker, re-raised with the reason of the task.
+                    raise self._cancellations.pop(job_id, e)
+                finally:
+                    self._cancellations.pop(job_id, None)
+            if not pending:
+                return results
+
+        raise WorkerCrashedError(
+            f"The worker process running '{getattr(fn, '__name__', fn)}' crashed."
+        )
+
+    def run(
+        self,
+        fn: Callable,
+        *args,
+        on_progress_change: Optional[Callable[[float], None]] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        Runs fn(*args, **kwargs) in a worker process and waits for its result.
+
+        Args:
+            fn: The picklable entry point.
+            args: Picklable positional arguments of fn.
+            on_progress_change: Called in this process with the progress reported by fn.
+                                If given, fn is called with an on_progress_change keyword argument.
+            kwargs: Picklable keyword arguments of fn.
+
+        Returns:
+            The result of fn.
+
+        Raises:
+            WorkerCrashedError: If the worker process running fn died twice.
+            TaskCancelledError: If on_progress_change raised it, fn was stopped.
+            Exception: Any exception raised by fn.
+        """
+        return self._gather(fn, [args], kwargs, on_progress_change)[0]
+
+    def map(self, fn: Callable, args_list: Sequence[Tuple], **kwargs) -> List[Any]:
+        """
+        Runs fn for each tuple of positional arguments in parallel and waits for all results.
+        The keyword arguments are the same for all calls. See run.
+        """
+        return self._gather(fn, args_list, kwargs)
+
+
+process_pool = ProcessPool()
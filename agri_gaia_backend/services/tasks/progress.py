@@ -0,0 +1,165 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import logging
+import threading
+
+from typing import Any, Callable, Optional
+
+from prometheus_client import Counter
+from sqlalchemy.orm import Session
+
+from agri_gaia_backend.db import tasks_api
+from agri_gaia_backend.db.models import Task
+from agri_gaia_backend.services.tasks.phases import phase
+from agri_gaia_backend.util.env import float_from_env
+
+logger = logging.getLogger("api-logger")
+
+# A progress update is written at most every TASK_PROGRESS_MIN_INTERVAL seconds and only
+# if the progress advanced by TASK_PROGRESS_MIN_DELTA. Smaller advances are still written
+# after TASK_PROGRESS_MAX_INTERVAL seconds, so slow tasks do not appear to be stuck.
+# A coalesced update is written when it becomes due, even if no further update follows.
+TASK_PROGRESS_MIN_INTERVAL = float_from_env("TASK_PROGRESS_MIN_INTERVAL", 0.5)
+TASK_PROGRESS_MAX_INTERVAL = float_from_env("TASK_PROGRESS_MAX_INTERVAL", 5.0)
+TASK_PROGRESS_MIN_DELTA = float_from_env("TASK_PROGRESS_MIN_DELTA", 0.01)
+
+TASK_PROGRESS_UPDATES = Counter(
+    "agri_gaia_task_progress_updates_total",
+    "Progress updates reported by background tasks, by whether they were written to the database or coalesced.",
+    labelnames=("result",),
+)
+
+
+def _start_timer(delay: float, fn: Callable[[], None]) -> threading.Timer:
+    timer = threading.Timer(delay, fn)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+class CoalescingProgressWriter:
+    """
+    Progress sink of a background task, which keeps the latest progress in memory and
+    writes it to the Task row at a bounded rate instead of committing every update.
+
+    Tasks reporting progress per file would otherwise produce one transaction per file.
+    A coalesced update is written by a timer once it is due, so a task spending a long
+    time in one step after reporting progress does not show stale progress meanwhile.
+    The timer writes with the session of the task under the lock of the writer.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        task: Task,
+        min_interval: float = TASK_PROGRESS_MIN_INTERVAL,
+        max_interval: float = TASK_PROGRESS_MAX_INTERVAL,
+        min_delta: float = TASK_PROGRESS_MIN_DELTA,
+        clock: Callable[[], float] = time.monotonic,
+        on_write: Optional[Callable[[Task], None]] = None,
+        start_timer: Callable[[float, Callable[[], None]], Any] = _start_timer,
+    ) -> None:
+        self.db = db
+        self.task = task
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.min_delta = min_delta
+        self.clock = clock
+        self.on_write = on_write
+        self.start_timer = start_timer
+
+        self._lock = threading.Lock()
+        self._written = task.completion_percentage or 0.0
+        self._pending: Optional[float] = None
+        self._last_write = float("-inf")
+        # Timer writing the pending update and the time it is due at.
+        self._timer = None
+        self._due = float("inf")
+        self._closed = False
+
+    def update(self, completion_percentage: float) -> None:
+        """
+        Records the progress of the task and writes it, if the last write is long enough ago.
+
+        Args:
+            completion_percentage: The progress between 0 (exclusive) and 1 (inclusive).
+        """
+        if not 0.0 < completion_percentage <= 1.0:
+            logger.warning("Invalid value range of completion percentage")
+            return
+
+        with self._lock:
+            if self._closed:
+                return
+            self._pending = completion_percentage
+            elapsed = self.clock() - self._last_write
+            delta = abs(completion_percentage - self._written)
+            if elapsed >= self.max_interval or (
+                elapsed >= self.min_interval and delta >= self.min_delta
+            ):
+                self._write()
+            else:
+                TASK_PROGRESS_UPDATES.labels(result="coalesced").inc()
+                if delta >= self.min_delta:
+                    self._schedule(self._last_write + self.min_interval)
+                else:
+                    self._schedule(self._last_write + self.max_interval)
+
+    def flush(self) -> None:
+        """
+        Writes the pending progress regardless of the rate limit.
+        Called when the task completed or failed, later updates are ignored.
+        """
+        with self._lock:
+            self._closed = True
+            self._cancel_timer()
+            if self._pending is not None:
+                self._write()
+
+    def _schedule(self, due: float) -> None:
+        # Has to be called with the lock held. Only an earlier deadline replaces the timer.
+        if self._timer is not None and self._due <= due:
+            return
+        self._cancel_timer()
+        self._due = due
+        self._timer = self.start_timer(max(0.0, due - self.clock()), self._write_due)
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = None
+        self._due = float("inf")
+
+    def _write_due(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._due = float("inf")
+            if self._closed or self._pending is None:
+                return
+            try:
+                self._write()
+            except Exception as e:
+                logger.exception(e)
+
+    def _write(self) -> None:
+        if self._pending != self._written:
+            self.task.completion_percentage = self._pending
+            with phase("db"):
+                tasks_api.update_task_progress(self.db, self.task)
+            self._written = self._pending
+            TASK_PROGRESS_UPDATES.labels(result="written").inc()
+            if self.on_write is not None:
+                self.on_write(self.task)
+        self._pending = None
+        self._last_write = self.clock()
+        self._cancel_timer()
@@ -0,0 +1,91 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import logging
+import datetime
+import threading
+
+from prometheus_client import Counter
+
+from agri_gaia_backend.db import tasks_api
+from agri_gaia_backend.db.database import SessionLocal
+from agri_gaia_backend.util.env import float_from_env, int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Finished tasks older than TASK_RETENTION_DAYS are moved into the task_history table.
+# 0 disables archiving.
+TASK_RETENTION_DAYS = float_from_env("TASK_RETENTION_DAYS", 30)
+TASK_RETENTION_INTERVAL = float_from_env("TASK_RETENTION_INTERVAL", 3600)
+TASK_RETENTION_BATCH_SIZE = int_from_env("TASK_RETENTION_BATCH_SIZE", 1000)
+
+TASKS_ARCHIVED = Counter(
+    "agri_gaia_tasks_archived_total",
+    "Finished tasks moved into the task history.",
+)
+
+
+def archive_old_tasks(
+    retention_days: float = TASK_RETENTION_DAYS,
+    batch_size: int = TASK_RETENTION_BATCH_SIZE,
+) -> int:
+    """
+    Archives all finished tasks older than retention_days, one transaction per batch,
+    so that the tasks table is never locked for long.
+
+    Returns:
+        The number of archived tasks.
+    """
+    created_before = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    archived = 0
+    with SessionLocal() as db:
+        while True:
+            count = tasks_api.archive_finished_tasks(db, created_before, batch_size)
+            archived += count
+            TASKS_ARCHIVED.inc(count)
+            if count < batch_size:
+                break
+
+    if archived:
+        logger.info(f"Archived {archived} tasks created before {created_before}.")
+    return archived
+
+
+def _archive_periodically(interval: float) -> None:
+    while True:
+        try:
+            archive_old_tasks()
+        except Exception as e:
+            logger.exception(e)
+        time.sleep(interval)
+
+
+_retention_job = None
+
+
+def start_task_retention_job() -> None:
+    """
+    Starts a daemon thread which archives old tasks every TASK_RETENTION_INTERVAL seconds.
+    Does nothing if TASK_RETENTION_DAYS is 0. Calling it more than once has no effect.
+
+    Every worker process runs the job. Concurrent runs skip the rows locked by each other.
+    """
+    global _retention_job
+    if _retention_job is not None or TASK_RETENTION_DAYS <= 0:
+        return
+    _retention_job = threading.Thread(
+        target=_archive_periodically,
+        args=(max(TASK_RETENTION_INTERVAL, 60.0),),
+        name="task-retention",
+        daemon=True,
+    )
+    _retention_job.start()
@@ -0,0 +1,324 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import time
+import heapq
+import enum
+import logging
+import itertools
+import threading
+
+from collections import Counter as KeyCounter
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from agri_gaia_backend.util.env import int_from_env
+
+logger = logging.getLogger("api-logger")
+
+# Named queues. Each queue has its own worker threads, so long running
+# jobs of one kind cannot starve the jobs of another kind.
+IO = "io"  # Mostly waiting on MinIO, Fuseki, Portainer, CVAT
+CPU = "cpu"  # Image and label processing, inference
+DOCKER = "docker"  # Short container management on the docker host: run, stop, pull
+BUILD = "build"  # Image builds on the docker host, which may take hours
+
+QUEUE_CONCURRENCY = {
+    IO: int_from_env("TASK_QUEUE_IO_CONCURRENCY", 8),
+    CPU: int_from_env("TASK_QUEUE_CPU_CONCURRENCY", os.cpu_count() or 1),
+    DOCKER: int_from_env("TASK_QUEUE_DOCKER_CONCURRENCY", 4),
+    BUILD: int_from_env("TASK_QUEUE_BUILD_CONCURRENCY", 2),
+}
+# Maximum number of waiting jobs per queue. Further submissions are rejected.
+TASK_QUEUE_MAX_DEPTH = int_from_env("TASK_QUEUE_MAX_DEPTH", 1000)
+
+# Maximum number of running jobs of a single user per queue, so that one user cannot
+# occupy all workers of a queue. Further jobs of the user wait. 0 disables the limit.
+USER_QUEUE_CONCURRENCY = {
+    IO: int_from_env("TASK_USER_IO_CONCURRENCY", 4),
+    CPU: int_from_env("TASK_USER_CPU_CONCURRENCY", 1),
+    # Unlimited, so that a user can always stop or start their own containers.
+    DOCKER: int_from_env("TASK_USER_DOCKER_CONCURRENCY", 0),
+    BUILD: int_from_env("TASK_USER_BUILD_CONCURRENCY", 1),
+}
+# Maximum number of waiting jobs of a single user per queue. Further submissions are rejected.
+TASK_USER_MAX_WAITING = int_from_env("TASK_USER_MAX_WAITING", 20)
+
+
+class Priority(enum.IntEnum):
+    """
+    Priority of a job within its queue. Jobs with a lower value are started first,
+    jobs of the same priority in submission order.
+    """
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+QUEUE_DEPTH = Gauge(
+    "agri_gaia_task_queue_depth",
+    "Background jobs waiting in a queue.",
+    labelnames=("queue",),
+)
+QUEUE_RUNNING = Gauge(
+    "agri_gaia_task_queue_running",
+    "Background jobs currently running in a queue.",
+    labelnames=("queue",),
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "agri_gaia_task_queue_wait_seconds",
+    "Time background jobs waited in a queue before they were started.",
+    labelnames=("queue", "priority"),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+QUEUE_ADMISSIONS = Counter(
+    "agri_gaia_task_queue_admissions_total",
+    "Background jobs submitted to a queue, by whether they were accepted, had to wait "
+    "for other jobs of the same user (queued) or were rejected.",
+    labelnames=("queue", "result"),
+)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class UserQuotaExceededError(QueueFullError):
+    pass
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    fn: Callable = field(compare=False)
+    future: Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    key: Optional[str] = field(compare=False, default=None)
+    on_wait: Optional[Callable[[], None]] = field(compare=False, default=None)
+    waited: bool = field(compare=False, default=False)
+
+
+class _Queue:
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        max_depth: int,
+        key_concurrency: int = 0,
+        key_max_waiting: int = 0,
+    ) -> None:
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_depth = max_depth
+        self.key_concurrency = key_concurrency
+        self.key_max_waiting = key_max_waiting
+        self._heap: List[_Job] = []
+        # Jobs whose key reached its concurrency limit, by key. They are moved
+        # back into the heap when a job of the same key finishes.
+        self._blocked: Dict[str, List[_Job]] = {}
+        self._running_by_key = KeyCounter()
+        self._waiting_by_key = KeyCounter()
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+
+    def _depth(self) -> int:
+        return len(self._heap) + sum(len(jobs) for jobs in self._blocked.values())
+
+    def _at_key_limit(self, key: Optional[str]) -> bool:
+        return (
+            key is not None
+            and self.key_concurrency > 0
+            and self._running_by_key[key] >= self.key_concurrency
+        )
+
+    def put(self, job: _Job) -> None:
+        with self._condition:
+            if self._depth() >= self.max_depth:
+                QUEUE_ADMISSIONS.labels(queue=self.name, result="rejected").inc()
+                raise QueueFullError(
+                    f"Too many waiting background jobs in queue '{self.name}'."
+                )
+            if (
+                job.key is not None
+                and self.key_max_waiting > 0
+                and self._waiting_by_key[job.key] >= self.key_max_waiting
+            ):
+                QUEUE_ADMISSIONS.labels(queue=self.name, result="rejected").inc()
+                raise UserQuotaExceededError(
+                    f"Too many waiting background jobs of '{job.key}' in queue '{self.name}'."
+                )
+            if job.key is not None:
+                self._waiting_by_key[job.key] += 1
+            QUEUE_ADMISSIONS.labels(queue=self.name, result="accepted").inc()
+            heapq.heappush(self._heap, job)
+            QUEUE_DEPTH.labels(queue=self.name).set(self._depth())
+            # Workers are started lazily, up to the concurrency limit of the queue.
+            if len(self._workers) < self.concurrency:
+                worker = threading.Thread(
+                    target=self._work,
+                    name=f"task-{self.name}-{len(self._workers)}",
+                    daemon=True,
+                )
+                self._workers.append(worker)
+                worker.start()
+            self._condition.notify()
+
+    def _take(self) -> _Job:
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                job = heapq.heappop(self._heap)
+                if not self._at_key_limit(job.key):
+                    if job.key is not None:
+                        self._waiting_by_key[job.key] -= 1
+                        if self._waiting_by_key[job.key] <= 0:
+                            del self._waiting_by_key[job.key]
+                        self._running_by_key[job.key] += 1
+                    QUEUE_DEPTH.labels(queue=self.name).set(self._depth())
+                    return job
+
+                heapq.heappush(self._blocked.setdefault(job.key, []), job)
+                first_wait = not job.waited
+                job.waited = True
+
+            # Called without the lock held, the callback may be slow (e.g. write to the database).
+            if first_wait:
+                QUEUE_ADMISSIONS.labels(queue=self.name, result="queued").inc()
+                if job.on_wait is not None:
+                    try:
+                        job.on_wait()
+                    except Exception as e:
+                        logger.exception(e)
+
+    def _release(self, job: _Job) -> None:
+        if job.key is None:
+            return
+        with self._condition:
+            self._running_by_key[job.key] -= 1
+            if self._running_by_key[job.key] <= 0:
+                del self._running_by_key[job.key]
+            blocked = self._blocked.get(job.key)
+            if blocked:
+                heapq.heappush(self._heap, heapq.heappop(blocked))
+                self._condition.notify()
+            if not blocked:
+                self._blocked.pop(job.key, None)
+
+    def _work(self) -> None:
+        while True:
+            job = self._take()
+            if not job.future.set_running_or_notify_cancel():
+                self._release(job)
+                continue
+
+            QUEUE_WAIT_SECONDS.labels(
+                queue=self.name, priority=Priority(job.priority).name.lower()
+            ).observe(time.monotonic() - job.enqueued_at)
+            QUEUE_RUNNING.labels(queue=self.name).inc()
+            try:
+                job.future.set_result(job.fn())
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                QUEUE_RUNNING.labels(queue=self.name).dec()
+                self._release(job)
+
+
+class TaskScheduler:
+    """
+    Runs background jobs in named queues with a concurrency limit and priorities per queue.
+
+    Replaces a single ThreadPoolExecutor, in which quick jobs had to wait behind
+    multi-hour inference runs and image builds, and the number of heavy jobs was unbounded.
+
+    Jobs submitted with a key (the user) are additionally limited per key and queue, so
+    that a single user cannot occupy all workers of a queue. Jobs over the limit wait
+    without holding a worker, jobs of other users are started in the meantime.
+    """
+
+    def __init__(
+        self,
+        concurrency: Dict[str, int] = QUEUE_CONCURRENCY,
+        max_depth: int = TASK_QUEUE_MAX_DEPTH,
+        key_concurrency: Dict[str, int] = USER_QUEUE_CONCURRENCY,
+        key_max_waiting: int = TASK_USER_MAX_WAITING,
+    ) -> None:
+        self._queues = {
+            name: _Queue(
+                name,
+                limit,
+                max_depth,
+                key_concurrency.get(name, 0),
+                key_max_waiting,
+            )
+            for name, limit in concurrency.items()
+        }
+        self._seq = itertools.count()
+
+    @property
+    def queues(self) -> List[str]:
+        return list(self._queues)
+
+    def submit(
+        self,
+        fn: Callable,
+        queue: str = IO,
+        priority: Priority = Priority.NORMAL,
+        key: Optional[str] = None,
+        on_wait: Optional[Callable[[], None]] = None,
+    ) -> Future:
+        """
+        Schedules a job.
+
+        Args:
+            fn: The job, called without arguments.
+            queue: Name of the queue, e.g. IO, CPU, DOCKER or BUILD.
+            priority: Priority of the job within the queue.
+            key: The user the job runs for. At most the per-user concurrency limit of
+                 the queue of jobs with the same key run at once, the others wait.
+            on_wait: Called once if the job has to wait for other jobs of the same key.
+
+        Returns:
+            A Future of the job's result.
+
+        Raises:
+            ValueError: If the queue does not exist.
+            QueueFullError: If there are already too many waiting jobs in the queue.
+            UserQuotaExceededError: If there are already too many waiting jobs of the key in the queue.
+        """
+        if queue not in self._queues:
+            raise ValueError(
+                f"Unknown queue '{queue}'. Possible values: {', '.join(self._queues)}."
+            )
+
+        future = Future()
+        self._queues[queue].put(
+            _Job(
+                int(priority),
+                next(self._seq),
+                fn,
+                future,
+                time.monotonic(),
+                key,
+                on_wait,
+            )
+        )
+        return future
+
+
+scheduler = TaskScheduler()
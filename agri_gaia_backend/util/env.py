@@ -20,6 +20,16 @@ def bool_from_env(var_name: str) -> bool:
     return os.getenv(var_name, "False").lower() in ("true", "1", "t")
 
 
+def int_from_env(var_name: str, default: int) -> int:
+    value = os.getenv(var_name)
+    return int(value) if value else default
+
+
+def float_from_env(var_name: str, default: float) -> float:
+    value = os.getenv(var_name)
+    return float(value) if value else default
+
+
 DEBUG_MODE = bool_from_env("DEBUG")
 
 PROJECT_BASE_URL = os.environ.get("PROJECT_BASE_URL")
@@ -0,0 +1,194 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# Label conversion with fiftyone. CPU-bound, therefore run in the process pool
+# (services/tasks/processes.py). Keep the imports of this module lightweight.
+
+import os
+import json
+import zipfile
+import tempfile
+import xmltodict
+import fiftyone as fo
+import fiftyone.utils.labels as foul
+
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from agri_gaia_backend.util.common import rm, mkdir
+
+
+def _import_labels(
+    tmp_dir: str, filename: str, label_data: bytes, input_type: fo.types
+) -> fo.Dataset:
+    _, ext = os.path.splitext(filename)
+
+    if input_type == fo.types.YOLOv5Dataset and ext != ".zip":
+        raise RuntimeError(
+            "YOLOv5 labels have to be uploaded with images as a ZIP archive!"
+        )
+
+    input_dir = os.path.join(tmp_dir, "input")
+    mkdir(input_dir)
+
+    labels_path = os.path.join(input_dir, filename)
+
+    with open(labels_path, "wb") as fh:
+        fh.write(label_data)
+
+    if ext == ".zip":
+        with zipfile.ZipFile(labels_path, "r") as zip:
+            zip.extractall(input_dir)
+            rm(labels_path)
+        labels_path = input_dir
+    else:
+        labels = label_data.decode("utf-8")
+
+    from_dir_args = {}
+    if input_type == fo.types.YOLOv5Dataset:
+        dataset_filepaths = list(
+            filter(lambda p: p.is_file(), Path(labels_path).rglob("*.*"))
+        )
+
+        if not len(
+            list(filter(lambda p: p.parent.name == "images", dataset_filepaths))
+        ):
+            raise RuntimeError(
+                "In order to determine image dimensions, YOLOv5 labels have to be uploaded with samples."
+            )
+
+        dataset_yaml_filepath = list(
+            filter(
+                lambda p: p.name in {"dataset.yaml", "dataset.yml"},
+                dataset_filepaths,
+            )
+        )
+        if len(dataset_yaml_filepath) != 1:
+            raise RuntimeError("No dataset.yaml found for YOLOv5 labels.")
+        dataset_yaml_filepath = dataset_yaml_filepath[0]
+
+        from_dir_args["dataset_dir"] = dataset_yaml_filepath.parent
+        labels_path = None
+    else:
+        image_paths = None
+        if input_type == fo.types.COCODetectionDataset:
+            labels = json.loads(labels)
+            image_paths = [image["file_name"] for image in labels["images"]]
+            # With COCO, only labels of type "detections" are read by default.
+            from_dir_args["label_types"] = ("detections", "segmentations")
+        elif input_type == fo.types.CVATImageDataset:
+            labels = xmltodict.parse(labels)
+            images = labels["annotations"]["image"]
+            image_paths = [image["@name"] for image in images]
+
+        data_path = {
+            image_path: os.path.join(tmp_dir, "data", os.path.basename(image_path))
+            for image_path in image_paths
+        }
+        from_dir_args["data_path"] = data_path
+
+    # See: https://docs.voxel51.com/api/fiftyone.core.dataset.html#fiftyone.core.dataset.Dataset.from_dir
+    return fo.Dataset.from_dir(
+        dataset_type=input_type,
+        labels_path=labels_path,
+        **from_dir_args,
+    )
+
+
+def _transform_labels(
+    labels: fo.Dataset, input_type: fo.types, output_type: fo.types
+) -> Union[str, List[str]]:
+    exported_label_fields = None
+    if output_type == fo.types.YOLOv5Dataset:
+        if labels.get_field("detections") is not None:
+            exported_label_fields = "detections"
+    else:
+        if input_type == fo.types.COCODetectionDataset:
+            if labels.get_field("detections") is not None:
+                exported_label_fields = ["detections"]
+            # With COCO, "segmentations" have to be manually converted to polylines.
+            if labels.get_field("segmentations") is not None:
+                foul.instances_to_polylines(
+                    labels, "segmentations", "polylines", tolerance=0
+                )
+                exported_label_fields.append("polylines")
+        elif input_type == fo.types.CVATImageDataset:
+            if labels.get_field("polylines") is not None:
+                exported_label_fields = "polylines"
+            else:
+                exported_label_fields = "detections"
+
+    return exported_label_fields
+
+
+def _get_label_filename(output_type: fo.types) -> str:
+    if output_type == fo.types.CVATImageDataset:
+        # See: https://docs.voxel51.com/user_guide/export_datasets.html#cvatimagedataset
+        label_filename = "labels.xml"
+    elif output_type == fo.types.COCODetectionDataset:
+        label_filename = "labels.json"
+    else:
+        # For an input label file, multiple label output files are generated.
+        # Example: CVAT -> YOLOv5
+        label_filename = ""
+    return label_filename
+
+
+def convert_label_file(
+    input_format: str, output_format: str, filename: str, label_data: bytes
+) -> Tuple[str, Dict[str, bytes]]:
+    """
+    Converts an uploaded label file (or ZIP archive) from one fiftyone dataset type into another.
+
+    Args:
+        input_format: Name of the fiftyone dataset type of the input, e.g. "CVATImageDataset".
+        output_format: Name of the fiftyone dataset type of the output.
+        filename: The filename of the uploaded label file.
+        label_data: The content of the uploaded label file.
+
+    Returns:
+        The name of the converted label file and the converted files by name.
+        If the conversion generates multiple files, the name is empty.
+
+    Raises:
+        RuntimeError: If the labels could not be converted.
+    """
+    input_type = getattr(fo.types, input_format)
+    output_type = getattr(fo.types, output_format)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        labels = _import_labels(tmp_dir, filename, label_data, input_type)
+        label_fields = _transform_labels(labels, input_type, output_type)
+        label_filename = _get_label_filename(output_type)
+
+        output_dir = os.path.join(tmp_dir, "output")
+        label_output_path = os.path.join(output_dir, label_filename)
+        labels.export(
+            dataset_type=output_type,
+            labels_path=label_output_path,
+            label_field=label_fields,
+            export_media=False,
+        )
+
+        if label_filename:
+            if not os.path.isfile(label_output_path):
+                raise RuntimeError("Converted label file was not generated.")
+            with open(label_output_path, "rb") as fh:
+                return label_filename, {label_filename: fh.read()}
+
+        output_label_files = {}
+        for output_label_filepath in Path(output_dir).rglob("*.*"):
+            with open(output_label_filepath, "rb") as fh:
+                output_label_files[output_label_filepath.name] = fh.read()
+
+        if not output_label_files:
+            raise RuntimeError("Converted label files were not generated.")
+        return label_filename, output_label_files
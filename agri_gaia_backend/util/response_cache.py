@@ -0,0 +1,112 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import hashlib
+import threading
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter
+
+from agri_gaia_backend.util.env import int_from_env
+
+RESPONSE_CACHE_MAX_USERS = int_from_env("RESPONSE_CACHE_MAX_USERS", 128)
+RESPONSE_CACHE_ENTRIES_PER_USER = int_from_env("RESPONSE_CACHE_ENTRIES_PER_USER", 16)
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "agri_gaia_response_cache_requests_total",
+    "Conditional list requests by result: not_modified (304), hit (served from cache) or miss.",
+    labelnames=("handler", "result"),
+)
+
+
+@dataclass
+class CachedResponse:
+    etag: str
+    body: bytes
+    headers: Dict[str, str]
+
+
+class ResponseCache:
+    """
+    Small in-memory LRU cache of serialized responses, partitioned by user.
+
+    Both the users and the entries of each user are evicted least recently used first,
+    so the memory usage is bounded by max_users * max_entries_per_user responses.
+    """
+
+    def __init__(self, max_users: int, max_entries_per_user: int) -> None:
+        self.max_users = max_users
+        self.max_entries_per_user = max_entries_per_user
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, OrderedDict[str, CachedResponse]]" = (
+            OrderedDict()
+        )
+
+    def get(self, user: str, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entries = self._users.get(user)
+            if entries is None or key not in entries:
+                return None
+            self._users.move_to_end(user)
+            entries.move_to_end(key)
+            return entries[key]
+
+    def put(self, user: str, key: str, response: CachedResponse) -> None:
+        with self._lock:
+            entries = self._users.setdefault(user, OrderedDict())
+            self._users.move_to_end(user)
+            entries[key] = response
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries_per_user:
+                entries.popitem(last=False)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_MAX_USERS, RESPONSE_CACHE_ENTRIES_PER_USER
+)
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Builds a strong ETag from everything the response depends on,
+    e.g. the table versions and the request's query parameters.
+    """
+    digest = hashlib.sha1(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks the If-None-Match request header against an ETag (weak comparison, RFC 9110).
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,182 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import time
+import inspect
+import functools
+import threading
+import logging
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+import requests
+from fastapi import Request
+from prometheus_client import Histogram
+
+logger = logging.getLogger("api-logger")
+
+# Downstream systems the backend talks to. Used as label values and Server-Timing metric names.
+MINIO = "minio"
+FUSEKI = "fuseki"
+POSTGRES = "postgres"
+PORTAINER = "portainer"
+DOCKER = "docker"
+CVAT = "cvat"
+
+DOWNSTREAM_DURATION = Histogram(
+    "agri_gaia_downstream_duration_seconds",
+    "Time a single HTTP request spent waiting on a downstream system.",
+    labelnames=("handler", "system"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+class RequestTimings:
+    """
+    Accumulates the time spent in downstream systems during a single HTTP request.
+
+    The object is shared between the event loop and the threadpool worker
+    that executes a synchronous endpoint, so all access is guarded by a lock.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._durations: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+
+    def add(self, system: str, duration: float) -> None:
+        with self._lock:
+            self._durations[system] = self._durations.get(system, 0.0) + duration
+            self._counts[system] = self._counts.get(system, 0) + 1
+
+    def items(self) -> Dict[str, Tuple[float, int]]:
+        with self._lock:
+            return {
+                system: (duration, self._counts[system])
+                for system, duration in self._durations.items()
+            }
+
+    def to_header(self) -> str:
+        entries = [
+            f'{system};dur={duration * 1000:.1f};desc="{count} call(s)"'
+            for system, (duration, count) in sorted(self.items().items())
+        ]
+        entries.append(f"app;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+# Systems that are currently being timed in this context. Prevents nested
+# wrapped calls (e.g. a client method calling another client method) from being counted twice.
+_active_systems: ContextVar[Tuple[str, ...]] = ContextVar(
+    "active_downstream_systems", default=()
+)
+
+
+def record(system: str, duration: float) -> None:
+    """
+    Adds an already measured downstream duration to the current request, if there is one.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(system, duration)
+
+
+@contextmanager
+def downstream_timer(system: str):
+    """
+    Measures the time spent inside the with-block and attributes it to the given downstream system.
+    """
+    active = _active_systems.get()
+    if system in active:
+        yield
+        return
+
+    token = _active_systems.set(active + (system,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(system, time.perf_counter() - start)
+        _active_systems.reset(token)
+
+
+def downstream(system: str) -> Callable:
+    """
+    Decorator wrapping a function or all methods of a class with a downstream_timer.
+
+    Args:
+        system: The downstream system the wrapped calls are attributed to.
+    """
+
+    def wrap_function(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with downstream_timer(system):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def decorator(obj):
+        if not inspect.isclass(obj):
+            return wrap_function(obj)
+
+        for name, member in list(vars(obj).items()):
+            if name.startswith("__") or not inspect.isfunction(member):
+                continue
+            setattr(obj, name, wrap_function(member))
+        return obj
+
+    return decorator
+
+
+def instrument_session(session: requests.Session, system: str) -> requests.Session:
+    """
+    Registers a response hook on a requests Session (e.g. the docker APIClient),
+    which attributes the elapsed time of every response to the given downstream system.
+    """
+
+    def _on_response(response: requests.Response, *args, **kwargs):
+        record(system, response.elapsed.total_seconds())
+
+    session.hooks["response"].append(_on_response)
+    return session
+
+
+def _get_route_path(request: Request) -> str:
+    # Use the route template instead of the raw path to keep the label cardinality bounded.
+    route = request.scope.get("route")
+    return getattr(route, "path", "none")
+
+
+async def server_timing_middleware(request: Request, call_next):
+    """
+    HTTP middleware creating the request-scoped timing context. Adds a Server-Timing header
+    to the response and feeds the downstream durations into Prometheus, labeled by route.
+    """
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_timings.reset(token)
+
+    handler = _get_route_path(request)
+    for system, (duration, _) in timings.items().items():
+        DOWNSTREAM_DURATION.labels(handler=handler, system=system).observe(duration)
+
+    response.headers["Server-Timing"] = timings.to_header()
+    return response
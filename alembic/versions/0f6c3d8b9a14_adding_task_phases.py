@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+"""Adding phases to tasks
+
+Revision ID: 0f6c3d8b9a14
+Revises: e5a1f08c7d29
+Create Date: 2026-10-19 15:27:53.114936
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "0f6c3d8b9a14"
+down_revision = "e5a1f08c7d29"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "tasks",
+        sa.Column("phases", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("tasks", "phases")
@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+"""Adding triton_repository manifest
+
+Revision ID: 5a2d7e9c4b13
+Revises: 0f6c3d8b9a14
+Create Date: 2026-10-19 17:44:09.268153
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5a2d7e9c4b13"
+down_revision = "0f6c3d8b9a14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "triton_repository",
+        sa.Column("model_name", sa.String(), nullable=False),
+        sa.Column("content_hash", sa.String(), nullable=False),
+        sa.Column("config_hash", sa.String(), nullable=True),
+        sa.Column("object_name", sa.String(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("last_used", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("model_name"),
+    )
+    op.create_index(
+        op.f("ix_triton_repository_last_used"),
+        "triton_repository",
+        ["last_used"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f("ix_triton_repository_last_used"), table_name="triton_repository"
+    )
+    op.drop_table("triton_repository")
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+"""Adding cancelling and cancelled task states
+
+Revision ID: 8d4b2c6e1f3a
+Revises: 3c9e1f7a2b6d
+Create Date: 2026-10-19 09:21:47.318402
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8d4b2c6e1f3a"
+down_revision = "3c9e1f7a2b6d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ALTER TYPE ... ADD VALUE must not run in a transaction block before PostgreSQL 12.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE taskstatus ADD VALUE IF NOT EXISTS 'cancelling'")
+        op.execute("ALTER TYPE taskstatus ADD VALUE IF NOT EXISTS 'cancelled'")
+
+
+def downgrade():
+    # Values cannot be removed from an enum type, so the type is recreated.
+    op.execute(
+        "UPDATE tasks SET status = 'failed' WHERE status IN ('cancelling', 'cancelled')"
+    )
+    op.execute("ALTER TYPE taskstatus RENAME TO taskstatus_old")
+    sa.Enum("created", "inprogress", "completed", "failed", name="taskstatus").create(
+        op.get_bind()
+    )
+    op.execute(
+        "ALTER TABLE tasks ALTER COLUMN status TYPE taskstatus "
+        "USING status::text::taskstatus"
+    )
+    op.execute("DROP TYPE taskstatus_old")
@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+"""Adding inference_results
+
+Revision ID: 8e4b2f7a1c95
+Revises: c3f8a1d6e2b7
+Create Date: 2026-10-19 19:21:53.840417
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8e4b2f7a1c95"
+down_revision = "c3f8a1d6e2b7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "inference_results",
+        sa.Column("model_hash", sa.String(), nullable=False),
+        sa.Column("preprocessing", sa.String(), nullable=False),
+        sa.Column("etag", sa.String(), nullable=False),
+        sa.Column("output", sa.LargeBinary(), nullable=False),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("model_hash", "preprocessing", "etag"),
+    )
+
+
+def downgrade():
+    op.drop_table("inference_results")
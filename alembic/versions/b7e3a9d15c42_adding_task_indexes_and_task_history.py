@@ -0,0 +1,76 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+"""Adding task indexes and task_history
+
+Revision ID: b7e3a9d15c42
+Revises: 8d4b2c6e1f3a
+Create Date: 2026-10-19 11:02:15.873520
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "b7e3a9d15c42"
+down_revision = "8d4b2c6e1f3a"
+branch_labels = None
+depends_on = None
+
+TASK_INDEXES = {
+    "ix_tasks_initiator_status_creation_date": ["initiator", "status", "creation_date"],
+    "ix_tasks_initiator_id": ["initiator", "id"],
+    "ix_tasks_status_creation_date": ["status", "creation_date"],
+}
+
+
+def upgrade():
+    op.create_table(
+        "task_history",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=True),
+        sa.Column("creation_date", sa.DateTime(), nullable=True),
+        sa.Column("initiator", sa.String(), nullable=True),
+        sa.Column(
+            "status",
+            postgresql.ENUM(name="taskstatus", create_type=False),
+            nullable=True,
+        ),
+        sa.Column("message", sa.String(), nullable=True),
+        sa.Column("archived_date", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_task_history_initiator"), "task_history", ["initiator"], unique=False
+    )
+
+    # The tasks table may already be large, so writes are not blocked while indexing.
+    with op.get_context().autocommit_block():
+        for name, columns in TASK_INDEXES.items():
+            op.create_index(
+                name,
+                "tasks",
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in TASK_INDEXES:
+            op.drop_index(name, table_name="tasks", postgresql_concurrently=True)
+
+    op.drop_index(op.f("ix_task_history_initiator"), table_name="task_history")
+    op.drop_table("task_history")
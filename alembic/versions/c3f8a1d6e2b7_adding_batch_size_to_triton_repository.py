@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+"""Adding batch_size to triton_repository
+
+Revision ID: c3f8a1d6e2b7
+Revises: 5a2d7e9c4b13
+Create Date: 2026-10-19 18:32:41.705219
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "c3f8a1d6e2b7"
+down_revision = "5a2d7e9c4b13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "triton_repository", sa.Column("batch_size", sa.Integer(), nullable=True)
+    )
+    op.add_column(
+        "triton_repository",
+        sa.Column(
+            "batch_size_probes",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("triton_repository", "batch_size_probes")
+    op.drop_column("triton_repository", "batch_size")
@@ -0,0 +1,55 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+"""Adding queued task state
+
+Revision ID: e5a1f08c7d29
+Revises: b7e3a9d15c42
+Create Date: 2026-10-19 13:44:08.902671
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e5a1f08c7d29"
+down_revision = "b7e3a9d15c42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ALTER TYPE ... ADD VALUE must not run in a transaction block before PostgreSQL 12.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE taskstatus ADD VALUE IF NOT EXISTS 'queued'")
+
+
+def downgrade():
+    # Values cannot be removed from an enum type, so the type is recreated.
+    op.execute("UPDATE tasks SET status = 'created' WHERE status = 'queued'")
+    op.execute("ALTER TYPE taskstatus RENAME TO taskstatus_old")
+    sa.Enum(
+        "created",
+        "inprogress",
+        "completed",
+        "failed",
+        "cancelling",
+        "cancelled",
+        name="taskstatus",
+    ).create(op.get_bind())
+    for table in ("tasks", "task_history"):
+        op.execute(
+            f"ALTER TABLE {table} ALTER COLUMN status TYPE taskstatus "
+            "USING status::text::taskstatus"
+        )
+    op.execute("DROP TYPE taskstatus_old")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# -*- coding: utf-8 -*-
+
+"""
+Compares requests per second of the synchronous (threadpool) and the async
+database access path for the hot list queries.
+
+A minimal FastAPI app exposing both variants of each list query is served by uvicorn
+in a background thread and hammered by concurrent HTTP clients. Optionally, a number of
+threadpool workers is occupied by blocking calls to simulate long running sync endpoints.
+
+Usage (inside the backend container):
+    python -m benchmarks.async_db --requests 2000 --concurrency 32 --occupy-threads 30
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from agri_gaia_backend.db import dataset_api, edge_device_api, model_api, tasks_api
+from agri_gaia_backend.routers.common import get_async_db, get_db
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+SYNC_QUERIES = {
+    "tasks": tasks_api.get_tasks,
+    "datasets": dataset_api.get_datasets,
+    "models": model_api.get_models,
+    "edge_devices": edge_device_api.get_edge_devices,
+}
+
+ASYNC_QUERIES = {
+    "tasks": tasks_api.get_tasks_async,
+    "datasets": dataset_api.get_datasets_async,
+    "models": model_api.get_models_async,
+    "edge_devices": edge_device_api.get_edge_devices_async,
+}
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    def add_sync_route(name, query):
+        @app.get(f"/sync/{name}")
+        def _sync(limit: int = 100, db: Session = Depends(get_db)):
+            return len(query(db, skip=0, limit=limit))
+
+    def add_async_route(name, query):
+        @app.get(f"/async/{name}")
+        async def _async(limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+            return len((await query(db, limit=limit)).items)
+
+    for name, query in SYNC_QUERIES.items():
+        add_sync_route(name, query)
+    for name, query in ASYNC_QUERIES.items():
+        add_async_route(name, query)
+
+    @app.post("/occupy")
+    async def occupy(seconds: float):
+        # Occupies one threadpool worker like a slow synchronous endpoint would.
+        await run_in_threadpool(time.sleep, seconds)
+
+    return app
+
+
+def _serve(app: FastAPI) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host=HOST, port=PORT, log_level="warning")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def _run(url: str, total: int, concurrency: int) -> dict:
+    local = threading.local()
+
+    def _request(_):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        local.session.get(url).raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(_request, range(total)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument(
+        "--occupy-threads",
+        type=int,
+        default=0,
+        help="Threadpool workers to block with sleeping calls during the run.",
+    )
+    parser.add_argument("--occupy-seconds", type=float, default=3600.0)
+    args = parser.parse_args()
+
+    server = _serve(create_app())
+    base_url = f"http://{HOST}:{PORT}"
+
+    for _ in range(args.occupy_threads):
+        threading.Thread(
+            target=requests.post,
+            args=(f"{base_url}/occupy",),
+            kwargs={"params": {"seconds": args.occupy_seconds}},
+            daemon=True,
+        ).start()
+    time.sleep(0.5)
+
+    results = {}
+    for name in SYNC_QUERIES:
+        results[name] = {
+            variant: _run(
+                f"{base_url}/{variant}/{name}?limit={args.limit}",
+                args.requests,
+                args.concurrency,
+            )
+            for variant in ("sync", "async")
+        }
+
+    print(json.dumps({"parameters": vars(args), "results": results}, indent=2))
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
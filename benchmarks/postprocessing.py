@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# -*- coding: utf-8 -*-
+
+"""
+Measures postprocessing and serialization time per batch of Triton results.
+
+Synthetic outputs of a classification, a detection (YOLOv8 layout) and a segmentation
+model are decoded by services/inference/postprocessing.py, once as raw outputs and once
+with the decoding of their task, and serialized as NDJSON and npz like the result sinks
+of services/inference/results.py do. Reported are the p50 milliseconds per batch of
+every step and the serialized bytes per image. No database, MinIO or Triton is needed.
+
+Usage (inside the backend container):
+    python -m benchmarks.postprocessing --batch-sizes 1 8 32 --output results.json
+    python -m benchmarks.postprocessing --compare results.json
+"""
+
+import argparse
+import datetime
+import io
+import json
+import statistics
+import time
+import zipfile
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from agri_gaia_backend.services.inference.postprocessing import (
+    BoxFormat,
+    PostprocessingConfig,
+    PostprocessingTask,
+    postprocess_outputs,
+)
+from agri_gaia_backend.services.inference.results import (
+    encode_ndjson,
+    write_npz_arrays,
+)
+from benchmarks.tasks import _compare
+
+
+def _classification(rng: np.random.Generator, images: int) -> Dict[str, np.ndarray]:
+    logits = rng.standard_normal((images, 1000)).astype(np.float32)
+    return {"probabilities": np.exp(logits) / np.exp(logits).sum(1, keepdims=True)}
+
+
+def _detection(rng: np.random.Generator, images: int) -> Dict[str, np.ndarray]:
+    # 8400 candidates of 80 classes, few of them with a high score like real images.
+    boxes = rng.uniform(0, 640, (images, 4, 8400)).astype(np.float32)
+    boxes[:, 2:] = rng.uniform(10, 200, (images, 2, 8400))
+    scores = (rng.random((images, 80, 8400)) ** 12).astype(np.float32)
+    return {"output0": np.concatenate([boxes, scores], axis=1)}
+
+
+def _segmentation(rng: np.random.Generator, images: int) -> Dict[str, np.ndarray]:
+    return {"logits": rng.standard_normal((images, 21, 256, 256)).astype(np.float32)}
+
+
+SCENARIOS = {
+    "classification": (
+        _classification,
+        PostprocessingConfig(task=PostprocessingTask.classification),
+    ),
+    "detection": (
+        _detection,
+        PostprocessingConfig(
+            task=PostprocessingTask.detection, box_format=BoxFormat.cxcywh
+        ),
+    ),
+    "segmentation": (
+        _segmentation,
+        PostprocessingConfig(task=PostprocessingTask.segmentation),
+    ),
+}
+
+
+def _p50_ms(fn: Callable, repetitions: int):
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return round(statistics.median(durations) * 1000, 3), result
+
+
+def _npz(filenames: List[str], results) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as file:
+        write_npz_arrays(file, 1, filenames, results)
+    return buffer.getvalue()
+
+
+def run(args) -> dict:
+    rng = np.random.default_rng(0)
+    report = {}
+    for scenario in args.scenarios:
+        generate, config = SCENARIOS[scenario]
+        for batch_size in args.batch_sizes:
+            outputs = generate(rng, batch_size)
+            filenames = [f"datasets/1/{i:07d}.jpg" for i in range(batch_size)]
+            for name, decoding in (("raw", PostprocessingConfig()), (scenario, config)):
+                decode_ms, results = _p50_ms(
+                    lambda: postprocess_outputs(outputs, decoding), args.repetitions
+                )
+                ndjson_ms, ndjson = _p50_ms(
+                    lambda: encode_ndjson(filenames, results), args.repetitions
+                )
+                npz_ms, npz = _p50_ms(
+                    lambda: _npz(filenames, results), args.repetitions
+                )
+                report[f"{scenario}.batch_{batch_size}.{name}"] = {
+                    "postprocess_ms": decode_ms,
+                    "ndjson_ms": ndjson_ms,
+                    "npz_ms": npz_ms,
+                    "ndjson_bytes_per_image": len(ndjson) // batch_size,
+                    "npz_bytes_per_image": len(npz) // batch_size,
+                }
+                print(
+                    f"{scenario:15} batch {batch_size:3} {name:15} "
+                    + json.dumps(report[f"{scenario}.batch_{batch_size}.{name}"])
+                )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS)
+    )
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument(
+        "--compare", help="JSON results of a previous run to compare with."
+    )
+    args = parser.parse_args()
+
+    report = {
+        "date": datetime.datetime.now().isoformat(),
+        "parameters": {
+            k: v for k, v in vars(args).items() if k not in ("output", "compare")
+        },
+        "results": run(args),
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if baseline.get("parameters") != report["parameters"]:
+            print("Warning: the baseline was recorded with different parameters.")
+        _compare(baseline["results"], report["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# -*- coding: utf-8 -*-
+
+"""
+Load test of the background task subsystem (TaskCreator, scheduler, progress writer, task events).
+
+Submits synthetic tasks, which report progress at a configurable rate, and measures
+task throughput, progress writes per second, the latency until reported progress is
+published as task event, the time spent in on_progress_change and the scheduler queue wait.
+The results are written as JSON and can be compared against a previous run.
+
+Runs against the configured Postgres database (the task subsystem relies on Postgres
+upserts and JSONB, so SQLite cannot stand in). The created tasks are deleted afterwards.
+
+Usage (inside the backend container):
+    python -m benchmarks.tasks --tasks 2000 --users 16 --progress-steps 50 --output results.json
+    python -m benchmarks.tasks --compare results.json
+"""
+
+import argparse
+import asyncio
+import bisect
+import datetime
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from prometheus_client import REGISTRY
+
+from agri_gaia_backend.db import change_tracking
+from agri_gaia_backend.db.database import SessionLocal
+from agri_gaia_backend.db.models import Task
+from agri_gaia_backend.routers.common import TaskCreator
+from agri_gaia_backend.services.tasks import events, scheduler
+from agri_gaia_backend.services.tasks.events import task_events
+
+TITLE_PREFIX = "benchmark"
+
+
+def _percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile))]
+
+
+def _latency_stats(seconds: List[float]) -> Dict[str, Optional[float]]:
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "count": len(seconds),
+        "p50_ms": ms(_percentile(seconds, 0.5)),
+        "p99_ms": ms(_percentile(seconds, 0.99)),
+        "max_ms": ms(max(seconds) if seconds else None),
+    }
+
+
+def _progress_writes() -> float:
+    return (
+        REGISTRY.get_sample_value(
+            "agri_gaia_task_progress_updates_total", {"result": "written"}
+        )
+        or 0.0
+    )
+
+
+class _EventRecorder:
+    """
+    Records when progress of the benchmark tasks is published, by task title.
+    """
+
+    def __init__(self, users: List[str]) -> None:
+        self.users = users
+        self.published = defaultdict(list)
+        self._loop = asyncio.new_event_loop()
+        self._subscribed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        self._subscribed.wait()
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._subscribe_all())
+
+    async def _subscribe_all(self) -> None:
+        self._stop = asyncio.Event()
+        subscriptions = [
+            task_events.subscribe(user, keepalive=1.0) for user in self.users
+        ]
+        # Subscribing happens on the first iteration.
+        pending = [asyncio.ensure_future(s.__anext__()) for s in subscriptions]
+        await asyncio.sleep(0.1)
+        self._subscribed.set()
+
+        stop = asyncio.ensure_future(self._stop.wait())
+        while not stop.done():
+            done, _ = await asyncio.wait(
+                pending + [stop], return_when=asyncio.FIRST_COMPLETED
+            )
+            for i, future in enumerate(pending):
+                if future in done:
+                    self._record(future.result())
+                    pending[i] = asyncio.ensure_future(subscriptions[i].__anext__())
+
+        for future in pending:
+            future.cancel()
+        for subscription in subscriptions:
+            await subscription.aclose()
+
+    def _record(self, event) -> None:
+        if event is None or event.type not in (events.PROGRESS, events.COMPLETED):
+            return
+        now = time.perf_counter()
+        completion = event.data["completion_percentage"]
+        self.published[event.data["title"]].append((completion, now))
+
+
+def _visible_latencies(reported, published) -> List[float]:
+    """
+    Time from reporting a progress value until a progress at least as high was published.
+    """
+    latencies = []
+    for title, reports in reported.items():
+        events_of_task = published.get(title, [])
+        times = [t for _, t in events_of_task]
+        for value, reported_at in reports:
+            start = bisect.bisect_left(times, reported_at)
+            for completion, published_at in events_of_task[start:]:
+                if completion >= value:
+                    latencies.append(published_at - reported_at)
+                    break
+    return latencies
+
+
+def run(args) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    users = [f"{TITLE_PREFIX}-{run_id}-user-{i}" for i in range(args.users)]
+    creators = [TaskCreator(user) for user in users]
+
+    lock = threading.Lock()
+    submitted_at: Dict[str, float] = {}
+    queue_waits: List[float] = []
+    call_durations: List[float] = []
+    reported = defaultdict(list)
+
+    def synthetic_task(on_error, on_progress_change, title: str):
+        started = time.perf_counter()
+        with lock:
+            queue_waits.append(started - submitted_at[title])
+
+        for step in range(1, args.progress_steps + 1):
+            time.sleep(args.progress_interval)
+            value = step / args.progress_steps
+            reported_at = time.perf_counter()
+            on_progress_change(value)
+            with lock:
+                call_durations.append(time.perf_counter() - reported_at)
+                reported[title].append((value, reported_at))
+
+    recorder = _EventRecorder(users)
+    recorder.start()
+
+    futures = []
+    rejected = 0
+
+    def submit(i: int) -> None:
+        nonlocal rejected
+        title = f"{TITLE_PREFIX}-{run_id}-{i}"
+        with lock:
+            submitted_at[title] = time.perf_counter()
+        try:
+            _, _, future = creators[i % len(creators)].create_background_task(
+                synthetic_task, title, queue=args.queue, title=title
+            )
+        except HTTPException:
+            with lock:
+                rejected += 1
+            return
+        with lock:
+            futures.append(future)
+
+    writes_before = _progress_writes()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.submitters) as submitters:
+        list(submitters.map(submit, range(args.tasks)))
+    submit_elapsed = time.perf_counter() - start
+    wait(futures)
+    elapsed = time.perf_counter() - start
+    writes = _progress_writes() - writes_before
+
+    # Give the event loop time to receive the last events.
+    time.sleep(0.5)
+    recorder.stop()
+
+    failed = sum(1 for f in futures if f.exception() is not None)
+    progress_reports = sum(len(r) for r in reported.values())
+    return {
+        "tasks": {
+            "submitted": len(futures),
+            "rejected": rejected,
+            "failed": failed,
+            "submit_per_second": round(len(futures) / submit_elapsed, 1),
+            "completed_per_second": round(len(futures) / elapsed, 1),
+            "elapsed_seconds": round(elapsed, 3),
+        },
+        "progress": {
+            "reported": progress_reports,
+            "written": int(writes),
+            "written_per_second": round(writes / elapsed, 1),
+            "coalescing_ratio": (
+                round(writes / progress_reports, 4) if progress_reports else None
+            ),
+            "call": _latency_stats(call_durations),
+            "visible": _latency_stats(_visible_latencies(reported, recorder.published)),
+        },
+        "queue_wait": _latency_stats(queue_waits),
+    }
+
+
+def _delete_benchmark_tasks() -> int:
+    with SessionLocal() as db:
+        deleted = (
+            db.query(Task)
+            .filter(Task.title.like(f"{TITLE_PREFIX}-%"))
+            .delete(synchronize_session=False)
+        )
+        # Bulk deletes are not tracked automatically, see db/change_tracking.py.
+        change_tracking.increment_table_versions(db, (Task.__tablename__,))
+        db.commit()
+    return deleted
+
+
+def _compare(baseline: dict, current: dict, path: str = "") -> None:
+    for key, value in current.items():
+        name = f"{path}.{key}" if path else key
+        reference = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            _compare(reference or {}, value, name)
+        elif isinstance(value, (int, float)) and isinstance(reference, (int, float)):
+            change = (value - reference) / reference * 100 if reference else 0.0
+            print(f"{name:45} {reference:>12} -> {value:>12} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument(
+        "--users",
+        type=int,
+        default=16,
+        help="Tasks are spread over this many users, see the per-user limits of the scheduler.",
+    )
+    parser.add_argument(
+        "--queue", default=scheduler.IO, choices=scheduler.QUEUE_CONCURRENCY
+    )
+    parser.add_argument("--progress-steps", type=int, default=20)
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=0.01,
+        help="Seconds between two progress updates of a task.",
+    )
+    parser.add_argument("--submitters", type=int, default=8)
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument(
+        "--compare", help="JSON results of a previous run to compare with."
+    )
+    parser.add_argument("--keep-tasks", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        results = run(args)
+    finally:
+        if not args.keep_tasks:
+            _delete_benchmark_tasks()
+
+    report = {
+        "date": datetime.datetime.now().isoformat(),
+        "parameters": {
+            k: v for k, v in vars(args).items() if k not in ("output", "compare")
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if baseline.get("parameters") != report["parameters"]:
+            print("Warning: the baseline was recorded with different parameters.")
+        _compare(baseline["results"], report["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,630 @@
+#!/usr/bin/env python
+
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+# -*- coding: utf-8 -*-
+
+"""
+Offline benchmark of the Triton inference path (POST /triton) without a GPU Triton deployment.
+
+Runs the inference endpoint of routers/triton.py, i.e. model sync, readiness check,
+result cache, the download/preprocess/batch/infer pipeline and the result sink, against
+a mock Triton server speaking the KServe v2 HTTP protocol. The mock serves a tiny numpy
+classifier on the CPU, with an optional delay per request to emulate the GPU.
+Objects are stored in a local MinIO-compatible store accessed with static credentials
+instead of the tokens of a Keycloak user, e.g.:
+    docker run -p 9000:9000 minio/minio server /data
+
+For every dataset size, a dataset of synthetic JPEGs is created and inferred. Reported are
+images per second, the phases of the task (download, preprocess, infer, upload, ...),
+the images per second of busy time of every pipeline stage and the peak RSS of the
+backend process and its preprocessing processes. The results are written as JSON and can be
+compared against a previous run.
+
+Runs against the configured Postgres database. The created models, datasets, tasks and
+objects are deleted afterwards.
+
+Usage (inside the backend container):
+    python -m benchmarks.triton_inference --images 100 1000 --minio-endpoint localhost:9000
+    python -m benchmarks.triton_inference --images 1000 --server-latency-ms 20 --compare results.json
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+from minio import Minio
+from PIL import Image
+from prometheus_client import REGISTRY
+
+from agri_gaia_backend.db import change_tracking, tasks_api
+from agri_gaia_backend.db.database import SessionLocal
+from agri_gaia_backend.db.models import (
+    Dataset,
+    InferenceResult,
+    InputTensorShapeSemantics,
+    Model,
+    ModelFormat,
+    Task,
+    TritonRepositoryEntry,
+)
+from agri_gaia_backend.routers import triton
+from agri_gaia_backend.routers.common import TaskCreator
+from agri_gaia_backend.schemas.keycloak_user import KeycloakUser
+from agri_gaia_backend.services.inference.model_repository import TRITON_BUCKET
+from agri_gaia_backend.services.inference.results import ResultFormat
+from agri_gaia_backend.services.inference.triton_client import TritonProtocol
+from agri_gaia_backend.services.minio_api import operations
+from benchmarks.tasks import _compare
+
+TITLE_PREFIX = "benchmark"
+HOST = "127.0.0.1"
+
+_DATATYPES = {"FP32": np.float32, "FP16": np.float16, "UINT8": np.uint8}
+
+
+class MockTritonServer:
+    """
+    KServe v2 HTTP server with the subset of the protocol used by tritonclient.http:
+    model readiness, metadata, config and inference with binary tensor data.
+    Every model name is served by the same classifier with an NCHW FP32 input.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        input_size: int,
+        classes: int,
+        max_batch_size: int,
+        latency: float,
+    ) -> None:
+        self.input_size = input_size
+        self.classes = classes
+        self.max_batch_size = max_batch_size
+        self.latency = latency
+        self.requests = 0
+        self._weights = np.random.default_rng(0).standard_normal((3, classes))
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((HOST, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"{HOST}:{self._server.server_address[1]}"
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def metadata(self, name: str) -> dict:
+        return {
+            "name": name,
+            "versions": ["1"],
+            "platform": "onnxruntime_onnx",
+            "inputs": [
+                {
+                    "name": "input",
+                    "datatype": "FP32",
+                    "shape": [-1, 3, self.input_size, self.input_size],
+                }
+            ],
+            "outputs": [
+                {"name": "output", "datatype": "FP32", "shape": [-1, self.classes]}
+            ],
+        }
+
+    def config(self, name: str) -> dict:
+        return {
+            "name": name,
+            "platform": "onnxruntime_onnx",
+            "max_batch_size": self.max_batch_size,
+            "input": [
+                {
+                    "name": "input",
+                    "data_type": "TYPE_FP32",
+                    "format": "FORMAT_NONE",
+                    "dims": [3, self.input_size, self.input_size],
+                }
+            ],
+            "output": [
+                {"name": "output", "data_type": "TYPE_FP32", "dims": [self.classes]}
+            ],
+        }
+
+    def infer(self, body: bytes, header_length: Optional[int]) -> tuple:
+        """
+        Returns:
+            The JSON header of the response and the binary output data.
+        """
+        header = json.loads(body[:header_length] if header_length else body)
+        tensor = header["inputs"][0]
+        dtype = _DATATYPES[tensor["datatype"]]
+        if header_length:
+            data = np.frombuffer(body[header_length:], dtype=dtype)
+        else:
+            data = np.asarray(tensor["data"], dtype=dtype)
+        images = data.reshape(tensor["shape"]).astype(np.float32)
+
+        # Mean color of every image through a linear layer and softmax.
+        logits = images.mean(axis=(2, 3)) @ self._weights
+        scores = np.exp(logits - logits.max(axis=1, keepdims=True))
+        output = (scores / scores.sum(axis=1, keepdims=True)).astype(np.float32)
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+
+        output_bytes = output.tobytes()
+        response = {
+            "model_name": header.get("model_name", ""),
+            "outputs": [
+                {
+                    "name": "output",
+                    "datatype": "FP32",
+                    "shape": list(output.shape),
+                    "parameters": {"binary_data_size": len(output_bytes)},
+                }
+            ],
+        }
+        if "id" in header:
+            response["id"] = header["id"]
+        return response, output_bytes
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps the connections of the client alive.
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes = b"", headers: dict = None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_json(self, data: dict):
+                self._send(
+                    200,
+                    json.dumps(data).encode("utf-8"),
+                    {"Content-Type": "application/json"},
+                )
+
+            def _model(self) -> tuple:
+                # /v2/models/<name>[/versions/<version>][/<action>]
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if len(parts) < 3 or parts[:2] != ["v2", "models"]:
+                    return None, None
+                action = parts[-1] if len(parts) > 3 else ""
+                return parts[2], action
+
+            def do_GET(self):
+                name, action = self._model()
+                if name is None:
+                    self._send(200 if self.path.startswith("/v2/health") else 404)
+                elif action == "ready":
+                    self._send(200)
+                elif action == "config":
+                    self._send_json(server.config(name))
+                else:
+                    self._send_json(server.metadata(name))
+
+            def do_POST(self):
+                name, action = self._model()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if name is None or action != "infer":
+                    self._send(404)
+                    return
+                header_length = self.headers.get("Inference-Header-Content-Length")
+                response, data = server.infer(
+                    body, int(header_length) if header_length else None
+                )
+                header = json.dumps(response).encode("utf-8")
+                self._send(
+                    200,
+                    header + data,
+                    {
+                        "Content-Type": "application/octet-stream",
+                        "Inference-Header-Content-Length": str(len(header)),
+                    },
+                )
+
+        return Handler
+
+
+class _RssSampler:
+    """
+    Samples the resident set size of this process and of its child processes,
+    i.e. the preprocessing pool, and records the peaks.
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak_self = 0
+        self.peak_total = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    @staticmethod
+    def _children(pid: int) -> List[int]:
+        children = []
+        try:
+            for thread in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{thread}/children") as fh:
+                    children.extend(int(child) for child in fh.read().split())
+        except OSError:
+            pass
+        return children
+
+    def _sample(self) -> None:
+        pid = os.getpid()
+        own = self._rss(pid)
+        self.peak_self = max(self.peak_self, own)
+        self.peak_total = max(
+            self.peak_total, own + sum(self._rss(c) for c in self._children(pid))
+        )
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "_RssSampler":
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+class _RecordingTaskCreator(TaskCreator):
+    """
+    Keeps the futures of the created tasks, the endpoint only returns their location.
+    """
+
+    def __init__(self, initiator: str) -> None:
+        super().__init__(initiator)
+        self.created = []
+
+    def create_background_task(self, *args, **kwargs):
+        result = super().create_background_task(*args, **kwargs)
+        self.created.append(result)
+        return result
+
+
+def _random_jpeg(rng: np.random.Generator, size: int) -> bytes:
+    # Smooth noise compresses like a photo, white noise would be unrealistically large.
+    small = rng.integers(0, 256, (size // 16, size // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((size, size), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _put(client: Minio, bucket: str, object_name: str, data: bytes) -> None:
+    client.put_object(bucket, object_name, io.BytesIO(data), len(data))
+
+
+def _stage_throughput() -> Dict[str, tuple]:
+    stages = {}
+    for metric in REGISTRY.collect():
+        if metric.name != "agri_gaia_inference_stage_images_per_second":
+            continue
+        for sample in metric.samples:
+            name = sample.name.rsplit("_", 1)[-1]
+            stage = sample.labels["stage"]
+            total, count = stages.get(stage, (0.0, 0.0))
+            if name == "sum":
+                stages[stage] = (sample.value, count)
+            elif name == "count":
+                stages[stage] = (total, sample.value)
+    return stages
+
+
+class Benchmark:
+    def __init__(self, args, client: Minio, server: MockTritonServer) -> None:
+        self.args = args
+        self.client = client
+        self.server = server
+        self.run_id = uuid.uuid4().hex[:8]
+        self.bucket = f"{TITLE_PREFIX}-{self.run_id}"
+        self.user = KeycloakUser({"preferred_username": self.bucket}, access_token="")
+        self.model_ids: List[int] = []
+        self.dataset_ids: List[int] = []
+
+    def setup(self) -> int:
+        for bucket in (self.bucket, TRITON_BUCKET):
+            if not self.client.bucket_exists(bucket):
+                self.client.make_bucket(bucket)
+
+        with SessionLocal() as db:
+            model = Model(
+                owner=self.bucket,
+                name=f"{TITLE_PREFIX}-{self.run_id}",
+                public=False,
+                last_modified=datetime.datetime.now(),
+                bucket_name=self.bucket,
+                file_name="model.onnx",
+                file_size=self.args.model_size,
+                format=ModelFormat.onnx,
+                input_semantics=InputTensorShapeSemantics.NCHW,
+            )
+            db.add(model)
+            db.commit()
+            self.model_ids.append(model.id)
+
+        # The mock does not load the model file, only its size matters for the sync.
+        _put(
+            self.client,
+            self.bucket,
+            f"models/{model.id}/model.onnx",
+            os.urandom(self.args.model_size),
+        )
+        return model.id
+
+    def create_dataset(self, images: int) -> int:
+        with SessionLocal() as db:
+            dataset = Dataset(
+                owner=self.bucket,
+                name=f"{TITLE_PREFIX}-{self.run_id}-{images}",
+                public=False,
+                last_modified=datetime.datetime.now(),
+                filecount=images,
+                total_filesize=0,
+                bucket_name=self.bucket,
+                minio_location=f"datasets/{TITLE_PREFIX}-{self.run_id}-{images}",
+                dataset_type="image",
+            )
+            db.add(dataset)
+            db.commit()
+            self.dataset_ids.append(dataset.id)
+
+        rng = np.random.default_rng(images)
+        jpegs = [_random_jpeg(rng, self.args.image_size) for _ in range(images)]
+
+        def upload(i: int) -> None:
+            object_name = f"datasets/{dataset.id}/{i:07d}.jpg"
+            _put(self.client, self.bucket, object_name, jpegs[i])
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(upload, range(images)))
+        return dataset.id
+
+    def infer(self, model_id: int, dataset_id: int, images: int) -> dict:
+        creator = _RecordingTaskCreator(self.bucket)
+        stages_before = _stage_throughput()
+        requests_before = self.server.requests
+
+        with SessionLocal() as db, _RssSampler() as rss:
+            start = time.perf_counter()
+            triton.get_tritonInfo(
+                SimpleNamespace(user=self.user),
+                models=[model_id],
+                datasets=[dataset_id],
+                url=self.server.url,
+                protocol=TritonProtocol.http,
+                use_shared_memory=False,
+                autotune=self.args.autotune,
+                result_format=self.args.result_format,
+                use_cache=self.args.use_cache,
+                db=db,
+                task_creator=creator,
+            )
+            task, _, future = creator.created[0]
+            future.result()
+            elapsed = time.perf_counter() - start
+
+        with SessionLocal() as db:
+            task = tasks_api.get_task(db, task.id)
+            status, message, phases = task.status.value, task.message, task.phases
+
+        stages = {}
+        for stage, (total, count) in _stage_throughput().items():
+            before_total, before_count = stages_before.get(stage, (0.0, 0.0))
+            if count > before_count:
+                stages[stage] = round(
+                    (total - before_total) / (count - before_count), 1
+                )
+
+        return {
+            "images": images,
+            "status": status,
+            "message": message,
+            "elapsed_seconds": round(elapsed, 3),
+            "images_per_second": round(images / elapsed, 1),
+            "triton_requests": self.server.requests - requests_before,
+            "stage_images_per_second": stages,
+            "phases": phases,
+            "peak_rss_mb": round(rss.peak_self / 1024**2, 1),
+            "peak_rss_with_children_mb": round(rss.peak_total / 1024**2, 1),
+        }
+
+    def run(self) -> List[dict]:
+        model_id = self.setup()
+        results = []
+        for images in self.args.images:
+            dataset_id = self.create_dataset(images)
+            for repetition in range(self.args.repetitions):
+                result = self.infer(model_id, dataset_id, images)
+                result["repetition"] = repetition
+                results.append(result)
+                print(json.dumps(result))
+        return results
+
+    def cleanup(self) -> None:
+        for obj in self.client.list_objects(self.bucket, recursive=True):
+            self.client.remove_object(self.bucket, obj.object_name)
+        self.client.remove_bucket(self.bucket)
+
+        with SessionLocal() as db:
+            for model_id in self.model_ids:
+                entry = db.get(TritonRepositoryEntry, str(model_id))
+                if entry is not None:
+                    db.query(InferenceResult).filter(
+                        InferenceResult.model_hash.like(f"{entry.content_hash}:%")
+                    ).delete(synchronize_session=False)
+                    db.delete(entry)
+                for obj in self.client.list_objects(
+                    TRITON_BUCKET, prefix=f"{model_id}/", recursive=True
+                ):
+                    self.client.remove_object(TRITON_BUCKET, obj.object_name)
+            db.query(Model).filter(Model.id.in_(self.model_ids)).delete(
+                synchronize_session=False
+            )
+            db.query(Dataset).filter(Dataset.id.in_(self.dataset_ids)).delete(
+                synchronize_session=False
+            )
+            db.query(Task).filter(Task.initiator == self.bucket).delete(
+                synchronize_session=False
+            )
+            # Bulk deletes are not tracked automatically, see db/change_tracking.py.
+            change_tracking.increment_table_versions(
+                db,
+                (
+                    InferenceResult.__tablename__,
+                    Model.__tablename__,
+                    Dataset.__tablename__,
+                    Task.__tablename__,
+                ),
+            )
+            db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--images",
+        type=int,
+        nargs="+",
+        default=[100, 1000],
+        help="Dataset sizes, a dataset is created and inferred for each.",
+    )
+    parser.add_argument("--repetitions", type=int, default=1)
+    parser.add_argument("--image-size", type=int, default=640)
+    parser.add_argument("--input-size", type=int, default=224)
+    parser.add_argument("--classes", type=int, default=1000)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument(
+        "--server-latency-ms",
+        type=float,
+        default=0.0,
+        help="Delay of every inference request of the mock, e.g. the GPU time of a batch.",
+    )
+    parser.add_argument("--model-size", type=int, default=1024**2)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--autotune", action="store_true")
+    parser.add_argument(
+        "--result-format", type=ResultFormat, default=ResultFormat.ndjson
+    )
+    parser.add_argument(
+        "--use-cache",
+        action="store_true",
+        help="Use the result cache, repetitions after the first then hit the cache.",
+    )
+    parser.add_argument(
+        "--minio-endpoint", default=os.getenv("MINIO_ENDPOINT", "localhost:9000")
+    )
+    parser.add_argument("--minio-access-key", default=os.getenv("MINIO_ROOT_USER"))
+    parser.add_argument("--minio-secret-key", default=os.getenv("MINIO_ROOT_PASSWORD"))
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument(
+        "--compare", help="JSON results of a previous run to compare with."
+    )
+    parser.add_argument("--keep", action="store_true", help="Keep the created objects.")
+    args = parser.parse_args()
+
+    client = Minio(
+        args.minio_endpoint,
+        access_key=args.minio_access_key,
+        secret_key=args.minio_secret_key,
+        secure=False,
+    )
+    # The local store has no Keycloak identity provider, objects are accessed with
+    # the static credentials instead of the token of the user.
+    operations.get_access = lambda token: client
+
+    server = MockTritonServer(
+        args.port,
+        args.input_size,
+        args.classes,
+        args.max_batch_size,
+        args.server_latency_ms / 1000,
+    )
+    server.start()
+    benchmark = Benchmark(args, client, server)
+    try:
+        results = benchmark.run()
+    finally:
+        server.stop()
+        if not args.keep:
+            benchmark.cleanup()
+
+    report = {
+        "date": datetime.datetime.now().isoformat(),
+        "parameters": {
+            k: v
+            for k, v in vars(args).items()
+            if k not in ("output", "compare", "minio_access_key", "minio_secret_key")
+        },
+        "results": {f"{r['images']}_images_{r['repetition']}": r for r in results},
+    }
+    print(json.dumps(report, indent=2, default=str))
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2, default=str)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if baseline.get("parameters") != json.loads(
+            json.dumps(report["parameters"], default=str)
+        ):
+            print("Warning: the baseline was recorded with different parameters.")
+        _compare(baseline["results"], report["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import datetime
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, create_engine, select
+from sqlalchemy.orm import Session, declarative_base
+
+from agri_gaia_backend.db.pagination import paginate, sort_keys
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = "items"
+    id = Column(Integer, primary_key=True)
+    created = Column(DateTime, nullable=True)
+
+
+SORT_KEYS = sort_keys(Item, created=Item.created)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    start = datetime.datetime(2024, 1, 1)
+    with Session(engine) as session:
+        # Every third item has no creation date, the others share some dates.
+        session.add_all(
+            Item(
+                id=i,
+                created=None if i % 3 == 0 else start + datetime.timedelta(days=i % 4),
+            )
+            for i in range(1, 12)
+        )
+        session.commit()
+        yield session
+
+
+def _all_pages(db, descending: bool, limit: int):
+    ids, cursor = [], None
+    while True:
+        page = paginate(
+            db,
+            select(Item),
+            SORT_KEYS["created"],
+            cursor=cursor,
+            limit=limit,
+            descending=descending,
+        )
+        ids.extend(item.id for item in page.items)
+        if page.next_cursor is None:
+            return ids
+        cursor = page.next_cursor
+
+
+def _expected(db, descending: bool):
+    # NULL keys are larger than any date.
+    def key(item):
+        return item.created is None, item.created or datetime.datetime.min, item.id
+
+    items = db.execute(select(Item)).scalars().all()
+    items = sorted(items, key=key, reverse=descending)
+    return [item.id for item in items]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 20])
+def test_pages_include_null_keys(db, descending, limit):
+    ids = _all_pages(db, descending, limit)
+
+    assert ids == _expected(db, descending), "Pages do not follow the order"
+    assert len(set(ids)) == 11, "Items are missing or repeated across pages"
+
+
+def test_cursor_on_null_key_continues(db):
+    first = paginate(db, select(Item), SORT_KEYS["created"], limit=1, descending=True)
+    assert first.items[0].created is None, "NULL keys must come first when descending"
+
+    second = paginate(
+        db,
+        select(Item),
+        SORT_KEYS["created"],
+        cursor=first.next_cursor,
+        limit=1,
+        descending=True,
+    )
+    assert second.items, "Page after a NULL key is empty"
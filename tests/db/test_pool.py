@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import logging
+import os
+
+import pytest
+import sqlalchemy
+from sqlalchemy import create_engine
+
+from agri_gaia_backend.db import database, pool
+from agri_gaia_backend.db.pool import PoolSizing, compute_pool_sizing
+
+
+def test_pool_sizing_stays_within_budget():
+    budget = 80
+    for workers in (1, 2, 4, 8):
+        sync = compute_pool_sizing(budget, workers, 0.75)
+        asnc = compute_pool_sizing(budget, workers, 0.25)
+        total = workers * (
+            sync.pool_size + sync.max_overflow + asnc.pool_size + asnc.max_overflow
+        )
+        assert total <= budget, f"Budget exceeded with {workers} worker(s)"
+
+
+def test_pool_sizing_has_at_least_one_connection():
+    sizing = compute_pool_sizing(budget=16, workers=4, share=0.25)
+    assert sizing.pool_size == 1, "Pool must have one connection"
+    assert sizing.max_overflow == 0, "Pool must not overflow the budget"
+
+
+def test_pool_sizing_rejects_budget_below_workers():
+    with pytest.raises(ValueError):
+        compute_pool_sizing(budget=4, workers=16, share=0.25)
+    with pytest.raises(ValueError):
+        compute_pool_sizing(budget=8, workers=4, share=0.25)
+
+
+def test_pool_metrics_track_checkout():
+    checked_out = database.engine.pool.checkedout()
+    with database.engine.connect():
+        assert database.engine.pool.checkedout() == checked_out + 1
+    assert database.engine.pool.checkedout() == checked_out
+
+
+def _check_out_connection(engine):
+    return engine.connect()
+
+
+def test_long_held_connection_report_shows_caller(caplog):
+    engine = create_engine("sqlite://", poolclass=pool.InstrumentedQueuePool)
+    pool.instrument_pool(engine, "test")
+
+    connection = _check_out_connection(engine)
+    try:
+        with caplog.at_level(logging.WARNING, logger="api-logger"):
+            pool._checked_out.report_long_held(threshold=-1.0)
+    finally:
+        connection.close()
+
+    assert "_check_out_connection" in caplog.text, "Caller missing from the stack"
+    assert os.path.dirname(sqlalchemy.__file__) not in caplog.text
+
+
+def test_undersized_sync_pool_is_reported(caplog):
+    with caplog.at_level(logging.WARNING, logger="api-logger"):
+        pool.check_sync_pool_sizing(PoolSizing(20, 20, 30.0), task_workers=14)
+        assert "sync DB pool" in caplog.text
+
+        caplog.clear()
+        pool.check_sync_pool_sizing(PoolSizing(30, 30, 30.0), task_workers=14)
+        assert caplog.text == ""
@@ -9,7 +9,33 @@
 #
 # SPDX-License-Identifier: MIT
 
+import os
+import math
+import time
+import asyncio
+import threading
+
+import pytest
+
 from agri_gaia_backend.routers.common import TaskCreator
+from agri_gaia_backend.services.tasks import events
+from agri_gaia_backend.services.tasks.cancellation import (
+    TASK_TIMEOUTS,
+    cancellation_registry,
+)
+from agri_gaia_backend.services.tasks.events import TaskEventBroker, task_events
+from agri_gaia_backend.services.tasks.phases import phase
+from agri_gaia_backend.services.tasks.processes import ProcessPool, WorkerCrashedError
+from agri_gaia_backend.services.tasks.progress import CoalescingProgressWriter
+from agri_gaia_backend.services.tasks.scheduler import (
+    BUILD,
+    DOCKER,
+    QUEUE_CONCURRENCY,
+    Priority,
+    QueueFullError,
+    TaskScheduler,
+    UserQuotaExceededError,
+)
 from agri_gaia_backend.db import tasks_api
 from agri_gaia_backend.db.models import TaskStatus
 
@@ -70,3 +96,281 @@ def test_background_task_fails_exception(request, task_creator: TaskCreator, db)
     assert not executed, "Task wasn't executed"
     assert task is not None, "Task is not in db"
     assert task.status == TaskStatus.failed, "Task status wrong"
+
+
+class FakeTimer:
+    def __init__(self, delay, fn) -> None:
+        self.delay = delay
+        self.fire = fn
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+def test_progress_updates_are_coalesced(db, test_task):
+    now = 0.0
+    progress = CoalescingProgressWriter(
+        db,
+        test_task,
+        min_interval=1.0,
+        max_interval=10.0,
+        clock=lambda: now,
+        start_timer=FakeTimer,
+    )
+
+    progress.update(0.1)
+    assert test_task.completion_percentage == 0.1, "First update not written"
+
+    now = 0.5
+    progress.update(0.2)
+    assert test_task.completion_percentage == 0.1, "Update within interval written"
+
+    now = 1.5
+    progress.update(0.105)
+    assert test_task.completion_percentage == 0.1, "Too small advance written"
+
+    progress.flush()
+    assert test_task.completion_percentage == 0.105, "Pending update not flushed"
+
+
+def test_coalesced_progress_is_written_when_due(db, test_task):
+    now = 0.0
+    timers = []
+
+    def start_timer(delay, fn):
+        timers.append(FakeTimer(delay, fn))
+        return timers[-1]
+
+    progress = CoalescingProgressWriter(
+        db,
+        test_task,
+        min_interval=1.0,
+        max_interval=10.0,
+        clock=lambda: now,
+        start_timer=start_timer,
+    )
+    progress.update(0.1)
+
+    now = 0.5
+    progress.update(0.4)
+    assert timers[-1].delay == 0.5, "Not written after the minimum interval"
+    now = 1.0
+    timers[-1].fire()
+    assert test_task.completion_percentage == 0.4, "Due update not written"
+
+    now = 1.5
+    progress.update(0.405)
+    assert (
+        timers[-1].delay == 9.5
+    ), "Small advance not written after the maximum interval"
+    progress.flush()
+    assert timers[-1].cancelled, "Timer not cancelled by the final write"
+    assert test_task.completion_percentage == 0.405
+
+
+def test_background_task_publishes_events(task_creator: TaskCreator, test_user, db):
+    async def collect_events():
+        subscription = task_events.subscribe(test_user.username, keepalive=1.0)
+        received = []
+
+        def test_task(on_error, on_progress_change):
+            on_progress_change(0.5)
+
+        # Subscribing happens on the first iteration.
+        first = asyncio.ensure_future(subscription.__anext__())
+        await asyncio.sleep(0.1)
+        task, _, future = task_creator.create_background_task(test_task, "Task Title")
+
+        event = await first
+        while True:
+            if event is not None and event.task_id == task.id:
+                received.append(event.type)
+                if event.type == events.COMPLETED:
+                    break
+            event = await subscription.__anext__()
+        await subscription.aclose()
+        tasks_api.delete_task(db, tasks_api.get_task(db, task.id))
+        return received
+
+    received = asyncio.run(collect_events())
+
+    assert received == [
+        events.CREATED,
+        events.STATUS,
+        events.PROGRESS,
+        events.COMPLETED,
+    ], "Unexpected task events"
+
+
+def test_task_events_resume_from_last_event_id():
+    broker = TaskEventBroker(buffer_size=2)
+    first = broker.publish(events.PROGRESS, "user", 1, {})
+    second = broker.publish(events.PROGRESS, "user", 1, {})
+    broker.publish(events.PROGRESS, "other", 2, {})
+
+    async def replay(last_event_id):
+        subscription = broker.subscribe("user", last_event_id, keepalive=0.01)
+        received = []
+        async for event in subscription:
+            if event is None:
+                break
+            received.append(event)
+        await subscription.aclose()
+        return received
+
+    resumed = asyncio.run(replay(first.id))
+    assert [e.id for e in resumed] == [second.id], "Missed event not replayed"
+
+    resynced = asyncio.run(replay("0:1"))
+    assert [e.type for e in resynced] == [events.RESYNC], "Unknown event id accepted"
+
+
+def test_background_task_records_phases(request, task_creator: TaskCreator, db):
+    def test_task(on_error, on_progress_change):
+        with phase("download") as download:
+            download.add_bytes(1024)
+        with phase("download"):
+            pass
+
+    task, _, future = task_creator.create_background_task(test_task, "Task Title")
+    future.result(timeout=5)
+    task = tasks_api.get_task(db, task.id)
+    request.addfinalizer(lambda: tasks_api.delete_task(db, task))
+
+    assert task.phases["download"]["count"] == 2, "Phase entries not summed up"
+    assert task.phases["download"]["bytes"] == 1024, "Phase bytes not recorded"
+    assert task.phases["download"]["seconds"] >= 0, "Phase duration not recorded"
+
+
+def test_scheduler_runs_higher_priority_first():
+    scheduler = TaskScheduler({"test": 1})
+    blocker = threading.Event()
+    order = []
+
+    scheduler.submit(blocker.wait, "test")
+    low = scheduler.submit(lambda: order.append("low"), "test", Priority.LOW)
+    high = scheduler.submit(lambda: order.append("high"), "test", Priority.HIGH)
+    blocker.set()
+    low.result(timeout=5)
+    high.result(timeout=5)
+
+    assert order == ["high", "low"], "Jobs not started in priority order"
+
+
+def test_scheduler_rejects_jobs_of_full_queue():
+    scheduler = TaskScheduler({"test": 1}, max_depth=1)
+    blocker = threading.Event()
+
+    running = scheduler.submit(blocker.wait, "test")
+    while not running.running():
+        pass
+    scheduler.submit(lambda: None, "test")
+    with pytest.raises(QueueFullError):
+        scheduler.submit(lambda: None, "test")
+    blocker.set()
+
+
+def test_scheduler_limits_running_jobs_per_user():
+    scheduler = TaskScheduler(
+        {"test": 2}, key_concurrency={"test": 1}, key_max_waiting=1
+    )
+    blocker = threading.Event()
+    waiting = threading.Event()
+    order = []
+
+    running = scheduler.submit(blocker.wait, "test", key="a")
+    while not running.running():
+        pass
+    second = scheduler.submit(
+        lambda: order.append("a"), "test", key="a", on_wait=waiting.set
+    )
+    other = scheduler.submit(lambda: order.append("b"), "test", key="b")
+    other.result(timeout=5)
+    waiting.wait(timeout=5)
+    with pytest.raises(UserQuotaExceededError):
+        scheduler.submit(lambda: None, "test", key="a")
+    blocker.set()
+    second.result(timeout=5)
+
+    assert waiting.is_set(), "Waiting job not reported"
+    assert order == ["b", "a"], "Job of other user not started first"
+
+
+def test_scheduler_runs_container_jobs_during_image_builds():
+    scheduler = TaskScheduler()
+    blocker = threading.Event()
+
+    builds = [
+        scheduler.submit(blocker.wait, BUILD, Priority.LOW, key=f"user{i}")
+        for i in range(QUEUE_CONCURRENCY[BUILD])
+    ]
+    stop = scheduler.submit(lambda: "stopped", DOCKER, Priority.HIGH, key="user0")
+
+    assert stop.result(timeout=5) == "stopped", "Container job waited for builds"
+    assert not any(build.done() for build in builds), "Builds finished early"
+    blocker.set()
+
+
+def test_scheduler_does_not_limit_container_jobs_per_user():
+    scheduler = TaskScheduler()
+    blocker = threading.Event()
+
+    download = scheduler.submit(blocker.wait, DOCKER, key="a")
+    stop = scheduler.submit(lambda: "stopped", DOCKER, Priority.HIGH, key="a")
+
+    assert stop.result(timeout=5) == "stopped", "Container job waited for same user"
+    assert not download.done(), "Download finished early"
+    blocker.set()
+
+
+def test_process_pool_survives_crashing_worker():
+    pool = ProcessPool(max_workers=1)
+
+    assert pool.map(math.factorial, [(3,), (4,)]) == [6, 24], "Wrong results"
+    with pytest.raises(WorkerCrashedError):
+        pool.run(os._exit, 1)
+    assert pool.run(math.factorial, 5) == 120, "Pool not usable after crash"
+
+
+def test_background_task_is_cancelled(request, task_creator: TaskCreator, db):
+    started = threading.Event()
+    cleaned_up = threading.Event()
+
+    def test_task(on_error, on_progress_change, cancellation_token):
+        cancellation_token.add_cleanup(cleaned_up.set)
+        started.set()
+        while True:
+            cancellation_token.wait(0.1)
+
+    task, _, future = task_creator.create_background_task(test_task, "Task Title")
+    started.wait(timeout=5)
+    assert cancellation_registry.cancel(task.id), "Running task not registered"
+    future.result(timeout=5)
+    task = tasks_api.get_task(db, task.id)
+    request.addfinalizer(lambda: tasks_api.delete_task(db, task))
+
+    assert task.status == TaskStatus.cancelled, "Task status not cancelled"
+    assert cleaned_up.is_set(), "Cleanup hook not run"
+
+
+def test_background_task_times_out(request, task_creator: TaskCreator, db):
+    def test_task(on_error, on_progress_change):
+        while True:
+            time.sleep(0.05)
+            on_progress_change(0.5)
+
+    task, _, future = task_creator.create_background_task(
+        test_task, "Task Title", timeout=0.2
+    )
+    future.result(timeout=5)
+    task = tasks_api.get_task(db, task.id)
+    request.addfinalizer(lambda: tasks_api.delete_task(db, task))
+
+    assert task.status == TaskStatus.cancelled, "Task status not cancelled"
+    assert "time limit" in task.message, "Timeout not reported"
+
+
+def test_every_queue_has_a_timeout():
+    for queue in TaskCreator.scheduler.queues:
+        assert TASK_TIMEOUTS.get(queue), f"No time limit for queue '{queue}'"
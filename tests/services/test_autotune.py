@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+
+from agri_gaia_backend.services.inference.autotune import (
+    autotune_batch_size,
+    candidate_batch_sizes,
+    probe_batch_size,
+)
+
+
+class FakeServer:
+    """
+    Answers every request immediately and advances a simulated clock by the duration
+    of the batch: a fixed overhead per request plus a time per image.
+    """
+
+    def __init__(self, overhead: float, per_image: float) -> None:
+        self.overhead = overhead
+        self.per_image = per_image
+        self.now = 0.0
+        self.batch_sizes = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def send(self, batch: np.ndarray):
+        self.batch_sizes.append(len(batch))
+        self.now += self.overhead + self.per_image * len(batch)
+        return self
+
+    def get_result(self):
+        return None
+
+
+def test_candidate_batch_sizes():
+    assert candidate_batch_sizes(1) == [1]
+    assert candidate_batch_sizes(8) == [1, 2, 4, 8]
+    assert candidate_batch_sizes(12) == [1, 2, 4, 8, 12]
+
+
+def test_probe_batch_size():
+    server = FakeServer(overhead=0.01, per_image=0.001)
+    image = np.zeros((3, 4, 4), dtype=np.float32)
+
+    probe = probe_batch_size(server.send, image, 10, requests=4, clock=server.clock)
+
+    assert server.batch_sizes == [10] * 5, "Warm-up or timed requests missing"
+    assert probe.images_per_second == 500.0, "Wrong throughput"
+    assert probe.p50_latency_ms == 20.0, "Wrong latency"
+
+
+def test_autotune_chooses_smallest_batch_size_within_tolerance():
+    # Throughput: 1 -> 90.9, 2 -> 166.7, 4 -> 285.7, 8 -> 444.4, 16 -> 615.4,
+    # 32 -> 761.9, 64 -> 864.9 images/s.
+    server = FakeServer(overhead=0.01, per_image=0.001)
+    image = np.zeros((3, 4, 4), dtype=np.float32)
+
+    batch_size, probes = autotune_batch_size(
+        server.send, image, 64, tolerance=0.15, requests=2, clock=server.clock
+    )
+
+    assert [p.batch_size for p in probes] == [1, 2, 4, 8, 16, 32, 64]
+    assert batch_size == 32, "Did not choose the smallest batch size within tolerance"
+
+    batch_size, _ = autotune_batch_size(
+        server.send, image, 64, tolerance=0.0, requests=2, clock=server.clock
+    )
+    assert batch_size == 64, "Did not choose the fastest batch size"
@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import asyncio
+
+import pytest
+
+from agri_gaia_backend.services.docker.log_stream import (
+    ContainerLogStreamer,
+    LogStreamLimitError,
+)
+
+
+class FakeLogs:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContainer:
+    def __init__(self, *chunks):
+        self.opened = []
+        self.chunks = chunks
+
+    def logs(self, **kwargs):
+        logs = FakeLogs(self.chunks)
+        self.opened.append(logs)
+        return logs
+
+
+async def _collect(lines):
+    return [line.text async for line in lines]
+
+
+def test_log_stream_yields_lines_and_releases_slot():
+    streamer = ContainerLogStreamer(max_streams=1)
+    container = FakeContainer(
+        b"2024-05-02T10:21:04.1Z first\n2024-05-02T10:21:05.2Z sec",
+        b"ond\n2024-05-02T10:21:06.3Z 50%\r100%\n",
+    )
+
+    lines = asyncio.run(_collect(streamer.stream(container)))
+
+    assert lines == ["first", "second", "100%"], "Wrong log lines"
+    assert container.opened[0].closed, "Docker log stream not closed"
+    assert streamer._streams == 0, "Stream slot not released"
+
+
+def test_log_stream_skips_lines_until_last_event_id():
+    streamer = ContainerLogStreamer(max_streams=1)
+    container = FakeContainer(
+        b"2024-05-02T10:21:04.1Z first\n2024-05-02T10:21:04.2Z second\n"
+    )
+
+    lines = streamer.stream(container, last_event_id="2024-05-02T10:21:04.1Z")
+
+    assert asyncio.run(_collect(lines)) == ["second"], "Received line repeated"
+
+
+def test_unstarted_log_stream_holds_nothing():
+    streamer = ContainerLogStreamer(max_streams=1)
+    container = FakeContainer(b"2024-05-02T10:21:04.1Z line\n")
+
+    # E.g. the client disconnected before the response started.
+    for _ in range(3):
+        streamer.stream(container)
+
+    assert container.opened == [], "Docker log stream opened before iteration"
+    assert streamer._streams == 0, "Stream slot taken before iteration"
+    assert asyncio.run(_collect(streamer.stream(container))) == ["line"]
+
+
+def test_log_stream_limit():
+    streamer = ContainerLogStreamer(max_streams=1)
+    container = FakeContainer(b"2024-05-02T10:21:04.1Z line\n")
+
+    async def stream_twice():
+        lines = streamer.stream(container)
+        await lines.__anext__()
+        try:
+            with pytest.raises(LogStreamLimitError):
+                streamer.stream(container)
+        finally:
+            await lines.aclose()
+        return streamer._streams
+
+    assert asyncio.run(stream_twice()) == 0, "Stream slot not released on close"
@@ -0,0 +1,177 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+import pytest
+
+from agri_gaia_backend.services.inference.postprocessing import (
+    BoxFormat,
+    PostprocessingConfig,
+    PostprocessingTask,
+    decode_detections,
+    nms,
+    postprocess_outputs,
+    segmentation_masks,
+    top_k,
+)
+
+DETECTION = PostprocessingConfig(task=PostprocessingTask.detection)
+
+
+def _detections(*images):
+    """
+    Outputs of a model with separate boxes (xyxy) and class scores, from lists of
+    (box, scores) per image. Images are padded with candidates of score 0.
+    """
+    candidates = max(len(image) for image in images)
+    classes = len(images[0][0][1])
+    boxes = np.zeros((len(images), candidates, 4), dtype=np.float32)
+    scores = np.zeros((len(images), candidates, classes), dtype=np.float32)
+    for i, image in enumerate(images):
+        for j, (box, class_scores) in enumerate(image):
+            boxes[i, j], scores[i, j] = box, class_scores
+    return {"boxes": boxes, "scores": scores}
+
+
+def test_top_k_sorts_by_descending_score():
+    scores = np.array([[0.1, 0.5, 0.3, 0.9], [0.4, 0.2, 0.8, 0.6]])
+
+    indices, best = top_k(scores, 2)
+
+    assert indices.tolist() == [[3, 1], [2, 3]], "Wrong classes or order"
+    np.testing.assert_allclose(best, [[0.9, 0.5], [0.8, 0.6]])
+    assert indices.dtype == np.int32 and best.dtype == np.float32
+
+
+def test_top_k_is_limited_to_number_of_classes():
+    indices, _ = top_k(np.array([[0.2, 0.7, 0.1]]), 5)
+
+    assert indices.tolist() == [[1, 0, 2]], "Not all classes returned"
+
+
+def test_segmentation_masks():
+    logits = np.zeros((2, 3, 2, 2), dtype=np.float32)
+    logits[0, 2, 0, 1] = 1
+    logits[1, 1] = 1
+
+    masks = segmentation_masks(logits)
+
+    assert masks.dtype == np.uint8
+    assert masks.tolist() == [[[0, 2], [0, 0]], [[1, 1], [1, 1]]]
+
+
+def test_nms_suppresses_overlapping_boxes():
+    boxes = np.array(
+        [[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30], [0, 0, 10, 9]],
+        dtype=np.float32,
+    )
+    scores = np.array([0.8, 0.9, 0.7, 0.6], dtype=np.float32)
+
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2], "Wrong boxes kept"
+    assert nms(boxes, scores, 0.5, max_keep=1).tolist() == [1], "max_keep ignored"
+    assert nms(boxes, scores, 0.95).tolist() == [1, 0, 2, 3], "Boxes suppressed"
+
+
+def test_nms_without_boxes():
+    assert nms(np.zeros((0, 4)), np.zeros(0), 0.5).tolist() == []
+
+
+def test_detections_of_different_classes_are_not_suppressed():
+    outputs = _detections(
+        [
+            ([0, 0, 10, 10], [0.9, 0.1]),
+            ([1, 1, 11, 11], [0.2, 0.8]),
+            ([0, 0, 10, 10], [0.7, 0.0]),
+        ]
+    )
+
+    results = decode_detections(outputs, DETECTION)
+
+    assert results.counts.tolist() == [2]
+    assert results.arrays["classes"].tolist() == [0, 1], "Wrong classes kept"
+    np.testing.assert_allclose(results.arrays["scores"], [0.9, 0.8])
+    np.testing.assert_allclose(
+        results.arrays["boxes"], [[0, 0, 10, 10], [1, 1, 11, 11]]
+    )
+
+
+def test_detections_are_ragged_per_image():
+    outputs = _detections(
+        [([0, 0, 10, 10], [0.9]), ([20, 20, 30, 30], [0.6]), ([0, 0, 1, 1], [0.1])],
+        [([0, 0, 10, 10], [0.1])],
+        [([5, 5, 15, 15], [0.3])],
+    )
+
+    results = decode_detections(outputs, DETECTION)
+
+    assert results.counts.tolist() == [2, 0, 1], "Wrong number of boxes per image"
+    per_image = results.to_lists()
+    assert [len(image["boxes"]) for image in per_image] == [2, 0, 1]
+    assert per_image[2]["boxes"] == [[5, 5, 15, 15]], "Box of wrong image"
+    assert per_image[1] == {"boxes": [], "scores": [], "classes": []}
+
+
+def test_detections_of_empty_images():
+    outputs = _detections([([0, 0, 10, 10], [0.1, 0.2])], [([0, 0, 5, 5], [0, 0])])
+
+    results = decode_detections(outputs, DETECTION)
+
+    assert results.counts.tolist() == [0, 0]
+    assert results.arrays["boxes"].shape == (0, 4)
+    assert results.images == 2
+
+
+def test_detections_are_limited_per_image():
+    config = PostprocessingConfig(task=PostprocessingTask.detection, max_detections=2)
+    image = [([i * 20, 0, i * 20 + 10, 10], [0.5 + i / 10]) for i in range(4)]
+
+    results = decode_detections(_detections(image, image), config)
+
+    assert results.counts.tolist() == [2, 2]
+    np.testing.assert_allclose(results.arrays["scores"], [0.8, 0.7, 0.8, 0.7])
+
+
+def test_detections_of_transposed_single_output():
+    # YOLOv8: (images, 4 + classes, candidates) with boxes as center and size.
+    predictions = np.zeros((1, 6, 8), dtype=np.float32)
+    predictions[0, :, 0] = [5, 5, 10, 10, 0.1, 0.9]
+    predictions[0, :, 1] = [6, 6, 10, 10, 0.1, 0.8]
+    predictions[0, :, 2] = [50, 50, 10, 10, 0.7, 0.2]
+    config = PostprocessingConfig(
+        task=PostprocessingTask.detection, box_format=BoxFormat.cxcywh
+    )
+
+    results = postprocess_outputs({"output0": predictions}, config)
+
+    assert results.arrays["classes"].tolist() == [1, 0]
+    np.testing.assert_allclose(
+        results.arrays["boxes"], [[0, 0, 10, 10], [45, 45, 55, 55]]
+    )
+
+
+def test_detections_with_further_outputs_are_rejected():
+    outputs = _detections([([0, 0, 10, 10], [0.9])])
+    outputs["num_detections"] = np.array([1])
+
+    with pytest.raises(ValueError):
+        decode_detections(outputs, DETECTION)
+
+
+def test_detection_boxes_are_selected_by_name():
+    # Scores of 4 classes have the same shape as the boxes.
+    outputs = _detections([([0, 0, 10, 10], [0.1, 0.9, 0.0, 0.0])])
+
+    results = decode_detections(
+        {"scores": outputs["scores"], "boxes": outputs["boxes"]}, DETECTION
+    )
+
+    assert results.arrays["classes"].tolist() == [1]
+    np.testing.assert_allclose(results.arrays["boxes"], [[0, 0, 10, 10]])
@@ -0,0 +1,46 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import math
+import time
+
+import pytest
+
+from agri_gaia_backend.services.tasks.cancellation import TaskCancelledError
+from agri_gaia_backend.services.tasks.processes import ProcessPool
+
+
+def _report_progress_for(seconds: float, on_progress_change) -> float:
+    # Entry point of the worker process, has to be a module-level function.
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        on_progress_change(0.5)
+        time.sleep(0.01)
+    return seconds
+
+
+def test_cancelled_process_job_is_stopped():
+    pool = ProcessPool(max_workers=1)
+    reported = []
+
+    def on_progress_change(value):
+        reported.append(value)
+        if len(reported) == 3:
+            raise TaskCancelledError("Task cancelled after exceeding its time limit.")
+
+    start = time.monotonic()
+    with pytest.raises(TaskCancelledError, match="time limit"):
+        pool.run(_report_progress_for, 60, on_progress_change=on_progress_change)
+    # The only worker process has to be free again to run the next job.
+    assert pool.run(math.factorial, 5) == 120, "Pool not usable after cancellation"
+
+    assert time.monotonic() - start < 30, "Job kept running after its cancellation"
+    assert len(reported) == 3, "Progress relayed after the cancellation"
@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import math
+
+import pytest
+
+from agri_gaia_backend.services.inference import readiness
+from agri_gaia_backend.services.inference.readiness import (
+    ModelLoadTimeoutError,
+    wait_until_ready,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds < 0:
+            raise ValueError("sleep length must be non-negative")
+        self.now += seconds
+
+
+class FakeTriton:
+    """
+    Models are ready from the given time on, each check takes the given seconds.
+    """
+
+    def __init__(self, clock: FakeClock, ready_at: dict, check_seconds: dict) -> None:
+        self.clock = clock
+        self.ready_at = ready_at
+        self.check_seconds = check_seconds
+        self.checks = []
+
+    def is_model_ready(self, name: str) -> bool:
+        self.checks.append((self.clock.now, name))
+        self.clock.now += self.check_seconds.get(name, 0.0)
+        return self.clock.now >= self.ready_at[name]
+
+
+class FixedRng:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    def uniform(self, low: float, high: float) -> float:
+        return self.delay
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(readiness.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_models_are_checked_until_ready(clock):
+    triton = FakeTriton(clock, {"a": 1.0, "b": 3.0}, {})
+
+    wait_until_ready(triton, ["a", "b"], timeout=10, clock=clock, rng=FixedRng(0.5))
+
+    assert clock.now == 3.0, "Not done as soon as the last model was ready"
+    assert triton.checks[-1] == (3.0, "b")
+    assert [t for t, name in triton.checks if name == "a"] == [0.0, 0.5, 1.0]
+
+
+def test_slow_check_past_the_deadline_times_out(clock):
+    # The check of b returns after the deadline, while the next check of a is due later.
+    triton = FakeTriton(clock, {"a": math.inf, "b": 0.0}, {"b": 11.0})
+
+    with pytest.raises(ModelLoadTimeoutError, match=r"model\(s\) a within"):
+        wait_until_ready(triton, ["a", "b"], timeout=10, clock=clock, rng=FixedRng(20))
+
+    assert triton.checks == [(0.0, "a"), (0.0, "b"), (11.0, "a")]
@@ -0,0 +1,113 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+import pytest
+
+from agri_gaia_backend.services.inference import result_cache
+from agri_gaia_backend.services.inference.postprocessing import BatchResults
+from agri_gaia_backend.services.inference.result_cache import ResultCache
+
+
+class FakeSink:
+    def __init__(self) -> None:
+        self.batches = []
+
+    def write(self, filenames, results: BatchResults) -> None:
+        self.batches.append((filenames, results))
+
+
+@pytest.fixture
+def stored(monkeypatch) -> dict:
+    """
+    Replaces the inference_results table with a dict by (model, preprocessing, etag).
+    """
+    rows = {}
+
+    def get_outputs(db, model_hash, preprocessing, etags, created_after):
+        return {
+            etag: rows[model_hash, preprocessing, etag]
+            for etag in etags
+            if (model_hash, preprocessing, etag) in rows
+        }
+
+    def save_outputs(db, model_hash, preprocessing, outputs):
+        for etag, output in outputs.items():
+            rows[model_hash, preprocessing, etag] = output
+
+    api = result_cache.inference_results_api
+    monkeypatch.setattr(api, "get_outputs", get_outputs)
+    monkeypatch.setattr(api, "save_outputs", save_outputs)
+    return rows
+
+
+def _postprocess(outputs):
+    return BatchResults(outputs)
+
+
+def test_cache_splits_cached_and_uncached_images(stored, monkeypatch):
+    monkeypatch.setattr(result_cache, "INFERENCE_CACHE_LOOKUP_SIZE", 2)
+    cache = ResultCache(None, "model", "preprocessing")
+    etags = {"a.jpg": "1", "b.jpg": "2", "c.jpg": "3", "d.jpg": "1"}
+    cache.store(["1", "3"], {"scores": np.array([[0.1, 0.9], [0.7, 0.3]])})
+
+    sink = FakeSink()
+    uncached = cache.write_cached(sink, list(etags), etags, _postprocess)
+
+    assert uncached == ["b.jpg"], "Wrong images to infer"
+    written = {
+        filename: scores.tolist()
+        for filenames, results in sink.batches
+        for filename, scores in zip(filenames, results.arrays["scores"])
+    }
+    assert written == {
+        "a.jpg": [0.1, 0.9],
+        "c.jpg": [0.7, 0.3],
+        "d.jpg": [0.1, 0.9],
+    }, "Cached outputs not written to the sink"
+
+
+def test_cache_is_separate_per_model_and_preprocessing(stored):
+    ResultCache(None, "model", "preprocessing").store(
+        ["1"], {"scores": np.ones((1, 2))}
+    )
+
+    for cache in (
+        ResultCache(None, "other model", "preprocessing"),
+        ResultCache(None, "model", "other preprocessing"),
+    ):
+        sink = FakeSink()
+        assert cache.write_cached(sink, ["a.jpg"], {"a.jpg": "1"}, _postprocess) == [
+            "a.jpg"
+        ]
+        assert sink.batches == [], "Output of another model or preprocessing used"
+
+
+def test_cache_writes_outputs_of_different_shapes_separately(stored):
+    cache = ResultCache(None, "model", "preprocessing")
+    cache.store(["1"], {"boxes": np.ones((1, 3, 4))})
+    cache.store(["2"], {"boxes": np.ones((1, 5, 4))})
+
+    sink = FakeSink()
+    etags = {"a.jpg": "1", "b.jpg": "2"}
+    assert cache.write_cached(sink, list(etags), etags, _postprocess) == []
+    shapes = [(names, results.arrays["boxes"].shape) for names, results in sink.batches]
+    assert shapes == [(["a.jpg"], (1, 3, 4)), (["b.jpg"], (1, 5, 4))]
+
+
+def test_cache_does_not_store_large_outputs(stored, monkeypatch):
+    monkeypatch.setattr(result_cache, "INFERENCE_CACHE_MAX_OUTPUT_BYTES", 1024)
+    cache = ResultCache(None, "model", "preprocessing")
+
+    cache.store(["1", "2"], {"logits": np.zeros((2, 16, 16), dtype=np.float32)})
+    cache.store(["3", "4"], {"logits": np.zeros((2, 16, 17), dtype=np.float32)})
+
+    assert sorted(etag for _, _, etag in stored) == ["1", "2"], "Large outputs stored"
@@ -0,0 +1,161 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import json
+
+import numpy as np
+import pytest
+
+from agri_gaia_backend.services.inference.postprocessing import BatchResults
+from agri_gaia_backend.services.inference.results import (
+    NdjsonResultSink,
+    NpzResultSink,
+)
+from agri_gaia_backend.services.minio_api import operations
+from agri_gaia_backend.services.minio_api.operations import (
+    MIN_PART_SIZE,
+    MultipartUpload,
+)
+
+
+class FakeMinio:
+    """
+    Records the objects and multipart uploads of the S3 calls used by MultipartUpload.
+    """
+
+    def __init__(self) -> None:
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+
+    def put_object(self, bucket, object_name, data, length, content_type=None):
+        self.objects[object_name] = data.read(length)
+
+    def _create_multipart_upload(self, bucket, object_name, headers):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = []
+        return upload_id
+
+    def _upload_part(self, bucket, object_name, data, headers, upload_id, part_number):
+        self.uploads[upload_id].append((part_number, data))
+        return f"etag-{part_number}"
+
+    def _complete_multipart_upload(self, bucket, object_name, upload_id, parts):
+        uploaded = dict(self.uploads.pop(upload_id))
+        self.objects[object_name] = b"".join(
+            uploaded[part.part_number] for part in parts
+        )
+
+    def _abort_multipart_upload(self, bucket, object_name, upload_id):
+        self.uploads.pop(upload_id)
+        self.aborted.append(object_name)
+
+
+@pytest.fixture
+def minio(monkeypatch) -> FakeMinio:
+    client = FakeMinio()
+    monkeypatch.setattr(operations, "get_access", lambda token: client)
+    return client
+
+
+def _classification(images: int) -> BatchResults:
+    return BatchResults(
+        {
+            "classes": np.arange(images * 2).reshape(images, 2),
+            "scores": np.full((images, 2), 0.5, dtype=np.float32),
+        }
+    )
+
+
+def test_small_upload_is_put_in_one_request(minio):
+    upload = MultipartUpload("bucket", "small", "token")
+    upload.write(b"abc")
+    upload.write(b"def")
+    upload.close()
+
+    assert minio.objects == {"small": b"abcdef"}, "Object not stored"
+    assert upload.tell() == 6, "Wrong number of bytes written"
+
+
+def test_large_upload_is_split_into_parts(minio):
+    data = bytes(range(256)) * (3 * MIN_PART_SIZE // 256 + 7)
+
+    upload = MultipartUpload("bucket", "large", "token")
+    for start in range(0, len(data), 1024**2):
+        upload.write(data[start : start + 1024**2])
+        assert len(upload._buffer) < MIN_PART_SIZE, "More than one part in memory"
+    upload.close()
+
+    assert minio.objects["large"] == data, "Parts not joined in order"
+
+
+def test_aborted_upload_is_discarded(minio):
+    upload = MultipartUpload("bucket", "aborted", "token")
+    upload.write(b"x" * MIN_PART_SIZE)
+    upload.abort()
+    upload.close()
+
+    assert minio.objects == {}, "Aborted object stored"
+    assert minio.uploads == {}, "Uploaded parts not discarded"
+    assert minio.aborted == ["aborted"]
+
+
+def test_ndjson_sink_writes_one_record_per_image(minio):
+    with NdjsonResultSink("bucket", "results.ndjson", "token") as sink:
+        sink.write(["a.jpg", "b.jpg"], _classification(2))
+        sink.write(["c.jpg"], _classification(1))
+
+    lines = minio.objects["results.ndjson"].splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r["filename"] for r in records] == ["a.jpg", "b.jpg", "c.jpg"]
+    assert records[1]["outputs"] == {"classes": [2, 3], "scores": [0.5, 0.5]}
+    assert sink.images == 3
+    assert sink.bytes_written == len(minio.objects["results.ndjson"])
+
+
+def test_npz_sink_writes_arrays_per_request(minio):
+    detections = BatchResults(
+        {"boxes": np.ones((3, 4), dtype=np.float32)}, counts=np.array([2, 0, 1])
+    )
+    with NpzResultSink("bucket", "results.npz", "token") as sink:
+        sink.write(["a.jpg", "b.jpg"], _classification(2))
+        sink.write(["c.jpg", "d.jpg", "e.jpg"], detections)
+
+    with np.load(io.BytesIO(minio.objects["results.npz"])) as npz:
+        assert sorted(npz.files) == [
+            "boxes_2",
+            "classes_1",
+            "counts_2",
+            "filenames_1",
+            "filenames_2",
+            "scores_1",
+        ]
+        assert npz["filenames_2"].tolist() == ["c.jpg", "d.jpg", "e.jpg"]
+        assert npz["counts_2"].tolist() == [2, 0, 1]
+        np.testing.assert_array_equal(npz["classes_1"], [[0, 1], [2, 3]])
+
+
+def test_failed_run_keeps_written_results(minio):
+    with pytest.raises(RuntimeError):
+        with NdjsonResultSink("bucket", "partial.ndjson", "token") as sink:
+            sink.write(["a.jpg"], _classification(1))
+            raise RuntimeError("Inference failed")
+
+    assert minio.objects["partial.ndjson"].count(b"\n") == 1, "Results not kept"
+
+
+def test_failed_run_without_results_stores_nothing(minio):
+    with pytest.raises(RuntimeError):
+        with NpzResultSink("bucket", "empty.npz", "token"):
+            raise RuntimeError("Inference failed")
+
+    assert minio.objects == {}, "Empty result object stored"
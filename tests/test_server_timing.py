@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2024 Osnabrück University of Applied Sciences
+# SPDX-FileContributor: Andreas Schliebitz
+# SPDX-FileContributor: Henri Graf
+# SPDX-FileContributor: Jonas Tüpker
+# SPDX-FileContributor: Lukas Hesse
+# SPDX-FileContributor: Maik Fruhner
+# SPDX-FileContributor: Prof. Dr.-Ing. Heiko Tapken
+# SPDX-FileContributor: Tobias Wamhof
+#
+# SPDX-License-Identifier: MIT
+
+from fastapi.testclient import TestClient
+from starlette.status import HTTP_200_OK
+
+from agri_gaia_backend.util.server_timing import (
+    RequestTimings,
+    downstream,
+    downstream_timer,
+    _request_timings,
+)
+
+
+class TestServerTimingHeader:
+    def test_list_endpoint_reports_postgres(self, authenticated_client: TestClient):
+        response = authenticated_client.get("/tasks")
+
+        assert response.status_code == HTTP_200_OK, "Error getting tasks"
+        assert "Server-Timing" in response.headers, "Server-Timing header missing"
+
+        server_timing = response.headers["Server-Timing"]
+        assert "postgres;dur=" in server_timing, "Postgres time not reported"
+        assert "app;dur=" in server_timing, "Total time not reported"
+
+    def test_metrics_contain_downstream_histogram(
+        self, authenticated_client: TestClient
+    ):
+        authenticated_client.get("/tasks")
+        response = authenticated_client.get("/metrics")
+
+        assert response.status_code == HTTP_200_OK, "Error getting metrics"
+        assert 'agri_gaia_downstream_duration_seconds_count{handler="/tasks"' in (
+            response.text
+        ), "Downstream histogram not exported for route"
+
+
+class TestDownstreamTimer:
+    def test_nested_calls_are_counted_once(self):
+        @downstream("fuseki")
+        def inner():
+            pass
+
+        @downstream("fuseki")
+        def outer():
+            inner()
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        try:
+            outer()
+            with downstream_timer("minio"):
+                pass
+        finally:
+            _request_timings.reset(token)
+
+        items = timings.items()
+        assert items["fuseki"][1] == 1, "Nested call was counted twice"
+        assert items["minio"][1] == 1, "Context manager call was not counted"
@@ -11,16 +11,20 @@
 
 import pytest
 import time
+import datetime
 import requests
 from fastapi.testclient import TestClient
 from agri_gaia_backend import schemas
 from agri_gaia_backend.db import tasks_api
+from agri_gaia_backend.db.models import TaskHistory, TaskStatus
 
 from starlette.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
     HTTP_202_ACCEPTED,
     HTTP_204_NO_CONTENT,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_400_BAD_REQUEST,
     HTTP_404_NOT_FOUND,
     HTTP_409_CONFLICT,
     HTTP_422_UNPROCESSABLE_ENTITY,
@@ -74,6 +78,62 @@ class TestGetTask:
             task.title == test_task.title
         ), "Returned task does not have same title as test_task"
 
+    def test_get_tasks_paginated(self, testclient: TestClient, db, test_task):
+        second_task = tasks_api.create_task(
+            db, initiator=test_task.initiator, title="Test-Task"
+        )
+        try:
+            params = {
+                "initiator": test_task.initiator,
+                "limit": 1,
+                "order_by": "created",
+                "descending": True,
+                "include_total": True,
+            }
+            response = testclient.get("/tasks", params=params)
+
+            assert response.status_code == HTTP_200_OK, "Error getting Task"
+            assert [t["id"] for t in response.json()] == [
+                second_task.id
+            ], "First page does not contain the newest task"
+            assert (
+                int(response.headers["X-Total-Count"]) >= 2
+            ), "Total count does not include both tasks"
+            assert "X-Next-Cursor" in response.headers, "Next cursor missing"
+
+            params["cursor"] = response.headers["X-Next-Cursor"]
+            response = testclient.get("/tasks", params=params)
+
+            assert response.status_code == HTTP_200_OK, "Error getting next page"
+            assert [t["id"] for t in response.json()] == [
+                test_task.id
+            ], "Second page does not continue after the first one"
+        finally:
+            tasks_api.delete_task(db, second_task)
+
+    def test_get_tasks_not_modified(self, testclient: TestClient, db, test_task):
+        response = testclient.get("/tasks")
+
+        assert response.status_code == HTTP_200_OK, "Error getting Task"
+        etag = response.headers["ETag"]
+
+        response = testclient.get("/tasks", headers={"If-None-Match": etag})
+        assert (
+            response.status_code == HTTP_304_NOT_MODIFIED
+        ), "Unchanged task list was not answered with 304"
+
+        test_task.completion_percentage = 0.5
+        tasks_api.update_task(db, test_task)
+
+        response = testclient.get("/tasks", headers={"If-None-Match": etag})
+        assert response.status_code == HTTP_200_OK, "Changed task list was not sent"
+        assert response.headers["ETag"] != etag, "ETag did not change with the task"
+
+    def test_get_tasks_invalid_cursor(self, testclient: TestClient):
+        response = testclient.get("/tasks", params={"cursor": "invalid"})
+
+        assert response.status_code == HTTP_400_BAD_REQUEST, "Invalid cursor accepted"
+
     def test_get_single_task_wrong_id(self, testclient: TestClient, test_task):
         response = testclient.get("/tasks/-10")
         assert (
@@ -113,3 +173,33 @@ class TestDeleteTask:
         tasks_count_after = len(tasks_api.get_tasks(db))
 
         assert tasks_count == tasks_count_after, "No Task should have been deleted"
+
+
+class TestArchiveTask:
+    def test_archive_finished_tasks(self, db, test_task):
+        test_task.status = TaskStatus.completed
+        test_task.creation_date = datetime.datetime.now() - datetime.timedelta(days=2)
+        tasks_api.update_task(db, test_task)
+
+        archived = tasks_api.archive_finished_tasks(
+            db, datetime.datetime.now() - datetime.timedelta(days=1)
+        )
+        archived_task = db.get(TaskHistory, test_task.id)
+
+        assert archived >= 1, "No task archived"
+        assert tasks_api.get_task(db, test_task.id) is None, "Task not removed"
+        assert archived_task is not None, "Task not in history"
+        assert archived_task.status == TaskStatus.completed, "Status not archived"
+
+        db.delete(archived_task)
+        db.commit()
+
+    def test_running_tasks_are_not_archived(self, db, test_task):
+        test_task.creation_date = datetime.datetime.now() - datetime.timedelta(days=2)
+        tasks_api.update_task(db, test_task)
+
+        tasks_api.archive_finished_tasks(
+            db, datetime.datetime.now() - datetime.timedelta(days=1)
+        )
+
+        assert tasks_api.get_task(db, test_task.id) is not None, "Task archived"